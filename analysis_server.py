@@ -0,0 +1,482 @@
+# analysis_server.py
+"""Warm analysis daemon and its thin client.
+
+Every ``python run_analysis.py`` pays for a fresh interpreter, for importing
+pandas and AIF360 and for parsing the input again. Scheduled or interactive
+workloads that run many small configs spend most of their time on that
+start-up. ``python analysis_server.py serve`` keeps one process alive with the
+libraries imported and recently used input sessions held in memory, and runs
+configs sent to it over a localhost HTTP job API:
+
+    GET  /health             server status and session cache statistics
+    POST /jobs               submit a job, returns its ``job_id`` at once
+    GET  /jobs/<id>          status and output of a job
+    GET  /jobs/<id>/events   the job's output streamed as JSON lines until it ends
+    POST /run                submit a job and stream its events in one request
+
+A job is a JSON object with either ``config_path`` (a YAML file, as for
+``run_analysis.py --config``) or ``config`` (the parsed config), plus
+optionally ``cwd`` (the directory relative paths in the config refer to) and
+``jobs``, and ``profile``, ``profile_stage`` and ``profile_capture`` as for
+``run_analysis.py --profile``. Jobs run concurrently on a bounded pool of
+threads, each with its own captured output. The profiler is process-wide, so
+a profiled job waits for the running jobs and runs alone. The sessions are kept in a ``SessionCache`` keyed by the
+input's fingerprint, so a changed input is parsed again.
+
+``python analysis_server.py run --config config.yaml`` is a drop-in
+replacement for ``run_analysis.py``: it sends the config to the server, prints
+the streamed output and falls back to running locally when no server is
+listening. The client imports only the standard library.
+"""
+import argparse
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_URL = os.environ.get('ANALYSIS_SERVER_URL', f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+FINISHED = ('done', 'failed')
+# Config entries holding paths, resolved against the job's ``cwd``.
+PATH_KEYS = [('input_file',), ('output_directory',), ('cache', 'directory'), ('output_sink', 'path')]
+
+_routing = threading.local()
+
+
+class SessionCache:
+    """
+    In-memory ``AnalysisSession`` objects shared by the server's jobs, least recently used evicted first.
+
+    Parameters:
+    max_sessions (int, optional): Number of sessions kept. Defaults to 8.
+    """
+
+    def __init__(self, max_sessions: int = 8):
+        self.max_sessions = max_sessions
+        self.hits = 0
+        self.misses = 0
+        self._sessions = collections.OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, input_file: str, options: tuple, load):
+        """
+        The cached session for ``input_file`` and ``options``, or the result of ``load()``.
+
+        A cached session is reused only while the input's fingerprint (path,
+        size, mtime) is unchanged. Concurrent requests for the same session
+        wait for a single load.
+
+        Parameters:
+        input_file (str): The analysed input.
+        options (tuple): Session parameters, e.g. label name, label values, backend and prediction column.
+        load (callable): Builds the session on a miss.
+
+        Returns:
+        AnalysisSession: The session.
+        """
+        from dataset_cache import file_fingerprint
+
+        key = (os.path.abspath(input_file), options)
+        fingerprint = file_fingerprint(input_file)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._sessions.get(key)
+                if entry is not None and entry[0] == fingerprint:
+                    self._sessions.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+            session = load()
+            with self._lock:
+                self.misses += 1
+                self._sessions[key] = (fingerprint, session)
+                self._sessions.move_to_end(key)
+                while len(self._sessions) > self.max_sessions:
+                    evicted, _ = self._sessions.popitem(last=False)
+                    self._key_locks.pop(evicted, None)
+            return session
+
+
+class _RoutedStream:
+    """Stands in for ``sys.stdout``: writes from a job's thread go to that job, all others to the real stream."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        job = getattr(_routing, 'job', None)
+        if job is None:
+            return self._stream.write(text)
+        job.write(text)
+        return len(text)
+
+    def flush(self) -> None:
+        if getattr(_routing, 'job', None) is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class Job:
+    """One submitted config: its status and the output printed so far."""
+
+    def __init__(self, request: dict):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = 'queued'
+        self.error = None
+        self.output = []
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._condition = threading.Condition()
+
+    def write(self, text: str) -> None:
+        with self._condition:
+            self.output.append(text)
+            self._condition.notify_all()
+
+    def set_status(self, status: str, error: str = None) -> None:
+        with self._condition:
+            self.status = status
+            self.error = error
+            if status == 'running':
+                self.started = time.time()
+            elif status in FINISHED:
+                self.finished = time.time()
+            self._condition.notify_all()
+
+    def wait(self, position: int, timeout: float = None) -> tuple:
+        """Output chunks after the first ``position`` ones, waiting until there are some or the job ended."""
+        with self._condition:
+            self._condition.wait_for(lambda: len(self.output) > position or self.status in FINISHED, timeout)
+            return self.output[position:], self.status
+
+    def to_dict(self) -> dict:
+        with self._condition:
+            return {'job_id': self.id, 'status': self.status, 'error': self.error, 'submitted': self.submitted,
+                    'started': self.started, 'finished': self.finished, 'output': ''.join(self.output)}
+
+
+def resolve_paths(config: dict, cwd: str) -> dict:
+    """Copy of ``config`` whose relative paths (input, output directory, cache, results store) are made absolute against ``cwd``."""
+    # run_config's default output directory is relative too.
+    config = {'output_directory': 'analysis_results', **config}
+    for *sections, key in PATH_KEYS:
+        parent = config
+        for section in sections:
+            if not isinstance(parent.get(section), dict):
+                parent = None
+                break
+            parent[section] = dict(parent[section])
+            parent = parent[section]
+        if parent is not None and isinstance(parent.get(key), str) and parent[key]:
+            parent[key] = os.path.join(cwd, parent[key])
+    return config
+
+
+class AnalysisServer:
+    """
+    Localhost HTTP server running analysis jobs with the libraries already imported.
+
+    Parameters:
+    host (str, optional): Interface to bind. Defaults to '127.0.0.1'.
+    port (int, optional): Port to listen on; 0 picks a free one. Defaults to 8765.
+    workers (int, optional): Jobs run at the same time; later jobs queue. Defaults to 4.
+    max_sessions (int, optional): Input sessions kept in memory. Defaults to 8.
+    max_finished_jobs (int, optional): Finished jobs whose status and output are kept. Defaults to 1000.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = 4, max_sessions: int = 8, max_finished_jobs: int = 1000):
+        import run_analysis  # imports pandas and AIF360 once for every job
+
+        self._run_analysis = run_analysis
+        self.workers = workers
+        self.sessions = SessionCache(max_sessions)
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = collections.OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis-job')
+        self._slots = threading.Condition()
+        self._running = 0
+        self._exclusive = False
+        self._stdout = sys.stdout
+        if not isinstance(sys.stdout, _RoutedStream):
+            sys.stdout = _RoutedStream(sys.stdout)
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def submit(self, request: dict) -> Job:
+        """Queue a job (see the module docstring for its fields) and return it."""
+        if not isinstance(request, dict) or ('config_path' in request) == ('config' in request):
+            raise ValueError("A job needs exactly one of 'config_path' and 'config'.")
+        if 'config' in request and not isinstance(request['config'], dict):
+            raise ValueError("'config' must be a mapping.")
+        import profiling
+        if request.get('profile_capture', 'cprofile') not in profiling.CAPTURE_MODES:
+            raise ValueError(f"'profile_capture' must be one of {list(profiling.CAPTURE_MODES)}.")
+        job = Job(request)
+        with self._jobs_lock:
+            self.jobs[job.id] = job
+            finished = [job_id for job_id, other in self.jobs.items() if other.status in FINISHED]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self.jobs[job_id]
+        self._executor.submit(self._run, job)
+        return job
+
+    def job(self, job_id: str) -> Job:
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    @contextlib.contextmanager
+    def _job_slot(self, exclusive: bool):
+        # Profiled jobs run alone: the active profiler would record every running job's stages.
+        with self._slots:
+            while self._exclusive or (exclusive and self._running):
+                self._slots.wait()
+            self._running += 1
+            self._exclusive = exclusive
+        try:
+            yield
+        finally:
+            with self._slots:
+                self._running -= 1
+                self._exclusive = False
+                self._slots.notify_all()
+
+    def _run(self, job: Job) -> None:
+        _routing.job = job
+        job.set_status('running')
+        try:
+            request = job.request
+            cwd = request.get('cwd') or os.getcwd()
+            if 'config_path' in request:
+                config = self._run_analysis.load_config(os.path.join(cwd, request['config_path']))
+            else:
+                config = request['config']
+            if config:
+                print("Configuration loaded successfully.")
+                config = resolve_paths(config, cwd)
+                with self._job_slot(bool(request.get('profile'))):
+                    if request.get('profile'):
+                        self._run_analysis.run_profiled(config, request.get('jobs'), request.get('profile_stage'),
+                                                        request.get('profile_capture', 'cprofile'), sessions=self.sessions)
+                    else:
+                        self._run_analysis.run_config(config, request.get('jobs'), sessions=self.sessions)
+            job.set_status('done')
+        except Exception as e:
+            print(f"Error: analysis job failed: {e}")
+            job.set_status('failed', str(e))
+        finally:
+            _routing.job = None
+
+    def health(self) -> dict:
+        with self._jobs_lock:
+            statuses = collections.Counter(job.status for job in self.jobs.values())
+        return {'status': 'ok', 'pid': os.getpid(), 'workers': self.workers, 'queued': statuses['queued'],
+                'running': statuses['running'], 'sessions': len(self.sessions),
+                'session_hits': self.sessions.hits, 'session_misses': self.sessions.misses}
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        """Stop accepting requests and wait for running jobs."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._executor.shutdown()
+        if isinstance(sys.stdout, _RoutedStream):
+            sys.stdout = self._stdout
+
+
+def _make_handler(server: AnalysisServer):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            sys.stderr.write(f"analysis_server: {format % args}\n")
+
+        def _send_json(self, status: int, document: dict) -> None:
+            body = json.dumps(document, default=str).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, job: Job) -> None:
+            # One JSON object per line: {"output": ...} chunks, then {"status": ..., "error": ...}.
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            position = 0
+            while True:
+                chunks, status = job.wait(position, timeout=1.0)
+                position += len(chunks)
+                if chunks:
+                    self.wfile.write((json.dumps({'output': ''.join(chunks)}) + '\n').encode())
+                    self.wfile.flush()
+                if status in FINISHED and not chunks:
+                    self.wfile.write((json.dumps({'job_id': job.id, 'status': status, 'error': job.error}) + '\n').encode())
+                    return
+
+        def _job_from_path(self):
+            parts = self.path.strip('/').split('/')
+            job = server.job(parts[1]) if len(parts) >= 2 and parts[0] == 'jobs' else None
+            return job, parts
+
+        def do_GET(self):
+            if self.path == '/health':
+                return self._send_json(200, server.health())
+            job, parts = self._job_from_path()
+            if job is None:
+                return self._send_json(404, {'error': f"Not found: {self.path}"})
+            if len(parts) == 2:
+                return self._send_json(200, job.to_dict())
+            if len(parts) == 3 and parts[2] == 'events':
+                return self._stream(job)
+            return self._send_json(404, {'error': f"Not found: {self.path}"})
+
+        def do_POST(self):
+            if self.path not in ('/jobs', '/run'):
+                return self._send_json(404, {'error': f"Not found: {self.path}"})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'null')
+                job = server.submit(request)
+            except ValueError as e:  # includes malformed JSON
+                return self._send_json(400, {'error': str(e)})
+            if self.path == '/jobs':
+                return self._send_json(202, {'job_id': job.id, 'status': job.status})
+            self._stream(job)
+
+    return Handler
+
+
+def run_remote(config_path: str, jobs: int = None, server_url: str = DEFAULT_URL, out=None, profile: bool = False,
+               profile_stage: str = None, profile_capture: str = 'cprofile') -> int:
+    """
+    Run a config on a server, writing its output to ``out`` as it is streamed.
+
+    Parameters:
+    config_path (str): Path to the YAML config, relative to the current directory.
+    jobs (int, optional): Worker processes for the per-attribute checks. Defaults to the config's ``jobs``.
+    server_url (str, optional): The server's base URL. Defaults to ``$ANALYSIS_SERVER_URL`` or http://127.0.0.1:8765.
+    out (file, optional): Where the output goes. Defaults to ``sys.stdout``.
+    profile (bool, optional): Save a profile next to the reports, as ``run_analysis.py --profile``. Defaults to False.
+    profile_stage (str, optional): With ``profile``, also capture this stage in depth. Defaults to None.
+    profile_capture (str, optional): 'cprofile' or 'tracemalloc'. Defaults to 'cprofile'.
+
+    Returns:
+    int: 0 if the job finished, 1 if it failed.
+
+    Raises:
+    ConnectionError: If no server is listening at ``server_url``.
+    """
+    out = out or sys.stdout
+    body = json.dumps({'config_path': os.path.abspath(config_path), 'cwd': os.getcwd(), 'jobs': jobs, 'profile': profile,
+                       'profile_stage': profile_stage, 'profile_capture': profile_capture}).encode()
+    request = urllib.request.Request(f"{server_url.rstrip('/')}/run", data=body, headers={'Content-Type': 'application/json'})
+    try:
+        response = urllib.request.urlopen(request)
+    except urllib.error.HTTPError as e:
+        out.write(f"Error: analysis server rejected the job: {e.read().decode(errors='replace')}\n")
+        return 1
+    except urllib.error.URLError as e:
+        raise ConnectionError(f"No analysis server at {server_url}: {e.reason}") from e
+    status = None
+    with response:
+        for line in response:
+            event = json.loads(line)
+            if 'output' in event:
+                out.write(event['output'])
+                out.flush()
+            else:
+                status = event['status']
+    return 0 if status == 'done' else 1
+
+
+def run_local(config_path: str, jobs: int = None, profile: bool = False, profile_stage: str = None, profile_capture: str = 'cprofile') -> int:
+    """
+    Run a config in this process, exactly like ``run_analysis.py --config``.
+
+    The parameters are those of ``run_remote``. Returns 0 if the run finished
+    and 1 if the config could not be loaded or the run raised.
+    """
+    import run_analysis
+
+    config = run_analysis.load_config(config_path)
+    if not config:
+        return 1
+    print("Configuration loaded successfully.")
+    try:
+        if profile:
+            run_analysis.run_profiled(config, jobs, profile_stage, profile_capture)
+        else:
+            run_analysis.run_config(config, jobs)
+    except Exception as e:
+        print(f"Error: analysis run failed: {e}")
+        return 1
+    return 0
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Warm bias and fairness analysis server and its client.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='Start the server')
+    serve.add_argument('--host', default=DEFAULT_HOST, help=f'Interface to bind (default: {DEFAULT_HOST})')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    serve.add_argument('--workers', type=int, default=4, help='Jobs run at the same time (default: 4)')
+    serve.add_argument('--max-sessions', type=int, default=8, help='Input sessions kept in memory (default: 8)')
+    run = commands.add_parser('run', help='Run a config on the server (drop-in for run_analysis.py)')
+    run.add_argument('--config', default='config_template.yaml', help='Path to the YAML configuration file (default: config_template.yaml)')
+    run.add_argument('--jobs', type=int, default=None, help='Number of worker processes for the per-attribute checks')
+    run.add_argument('--profile', action='store_true', help='Save per-stage timings as profile.json next to the reports')
+    run.add_argument('--profile-stage', default=None, help='With --profile, also capture this stage in depth')
+    run.add_argument('--profile-capture', choices=('cprofile', 'tracemalloc'), default='cprofile',
+                     help='How --profile-stage is captured (default: cprofile)')
+    run.add_argument('--server', default=DEFAULT_URL, help=f'Server URL (default: $ANALYSIS_SERVER_URL or {DEFAULT_URL})')
+    run.add_argument('--no-fallback', action='store_true', help='Fail instead of running locally when no server is listening')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        server = AnalysisServer(args.host, args.port, args.workers, args.max_sessions)
+        sys.stderr.write(f"Analysis server listening on {server.url} with {args.workers} workers\n")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+        return 0
+
+    profile_options = dict(profile=args.profile, profile_stage=args.profile_stage, profile_capture=args.profile_capture)
+    try:
+        return run_remote(args.config, args.jobs, args.server, **profile_options)
+    except ConnectionError as e:
+        if args.no_fallback:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        sys.stderr.write(f"{e}; running locally.\n")
+        return run_local(args.config, args.jobs, **profile_options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
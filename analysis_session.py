@@ -0,0 +1,723 @@
+# analysis_session.py
+"""Load-once analysis session shared by bias and fairness checks.
+
+``run_analysis.main`` used to call ``bias_check`` and ``fairness_check`` once
+per protected attribute, and each call re-read and re-validated the input CSV.
+An ``AnalysisSession`` parses the input a single time, validates the label
+column once, and keeps the label array, group masks and per-attribute AIF360
+datasets in memory so that every attribute and every check reuses them.
+
+Metrics are computed either by AIF360 (``backend='aif360'``, the default) or by
+the NumPy engine in ``native_metrics`` (``backend='native'``), which derives
+every reported metric from one pass of per-group confusion counts.
+"""
+import threading
+import numpy as np
+import pandas as pd
+from aif360.metrics import BinaryLabelDatasetMetric, ClassificationMetric
+from aif360.datasets import BinaryLabelDataset
+import data_io
+import native_metrics
+import profiling
+from native_metrics import BIAS_METRIC_NAMES, FAIRNESS_METRIC_NAMES, FairnessAccumulator
+
+
+def validate_label_column(columns: list, label_name: str) -> None:
+    """Raise ValueError if the label column is missing from ``columns``."""
+    if label_name not in columns:
+        raise ValueError(f"Label name '{label_name}' not found in input CSV columns: {list(columns)}")
+
+
+def validate_label_values(label_values, label_name: str, favorable_label_value: float, unfavorable_label_value: float) -> None:
+    """Raise ValueError if the favorable or unfavorable value is absent from ``label_values``."""
+    if favorable_label_value not in label_values:
+        raise ValueError(f"Favorable label value '{favorable_label_value}' not found in label column '{label_name}'. Present values: {label_values}")
+    if unfavorable_label_value not in label_values:
+        raise ValueError(f"Unfavorable label value '{unfavorable_label_value}' not found in label column '{label_name}'. Present values: {label_values}")
+
+
+def validate_prediction_column(columns: list, prediction_name: str) -> None:
+    """Raise ValueError if the prediction column is missing from ``columns``."""
+    if prediction_name not in columns:
+        raise ValueError(f"Prediction name '{prediction_name}' not found in input CSV columns: {list(columns)}")
+
+
+def validate_protected_attributes(columns: list, protected_attribute_names: list[str]) -> None:
+    """Raise ValueError if protected attributes are missing from ``columns`` or repeated."""
+    for attr_name in protected_attribute_names:
+        if attr_name not in columns:
+            raise ValueError(f"Protected attribute name '{attr_name}' not found in input CSV columns: {list(columns)}")
+
+    if len(protected_attribute_names) != len(set(protected_attribute_names)):
+        raise ValueError(f"Protected attribute names must be unique. Found: {protected_attribute_names}")
+
+
+def validate_group_definitions(protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> None:
+    """Raise ValueError if the group definitions are malformed or use unknown keys."""
+    if not isinstance(privileged_groups, list) or not all(isinstance(g, dict) for g in privileged_groups):
+        raise ValueError("privileged_groups must be a list of dictionaries.")
+    if not privileged_groups: # Ensure not empty
+        raise ValueError("privileged_groups cannot be empty.")
+
+    if not isinstance(unprivileged_groups, list) or not all(isinstance(g, dict) for g in unprivileged_groups):
+        raise ValueError("unprivileged_groups must be a list of dictionaries.")
+    if not unprivileged_groups: # Ensure not empty
+        raise ValueError("unprivileged_groups cannot be empty.")
+
+    for group_list_name, group_list in [("privileged_groups", privileged_groups), ("unprivileged_groups", unprivileged_groups)]:
+        for group_dict in group_list:
+            if not group_dict: # Ensure dict itself is not empty
+                raise ValueError(f"Empty dictionary found in {group_list_name}.")
+            for key in group_dict.keys():
+                if key not in protected_attribute_names:
+                    raise ValueError(f"Key '{key}' in {group_list_name} definition {group_dict} is not among protected_attribute_names: {protected_attribute_names}")
+
+
+def _write_report(table: pd.DataFrame, output_file: str) -> None:
+    with profiling.stage('write') as record:
+        data_io.write_table(table, output_file)
+        record['rows'] = len(table)
+
+
+def _groups_key(groups: list[dict]) -> tuple:
+    return tuple(tuple(sorted(group.items())) for group in groups)
+
+
+def compute_group_mask(df: pd.DataFrame, groups: list[dict]) -> np.ndarray:
+    """
+    Boolean row mask for a group definition.
+
+    Dictionaries in ``groups`` are OR-ed together and the key/value pairs
+    inside each dictionary are AND-ed, matching AIF360's conditioning.
+    """
+    mask = np.zeros(len(df), dtype=bool)
+    for group in groups:
+        group_mask = np.ones(len(df), dtype=bool)
+        for name, value in group.items():
+            group_mask &= (df[name] == value).to_numpy()
+        mask |= group_mask
+    return mask
+
+
+class AnalysisSession:
+    """
+    In-memory input shared by every protected attribute and every check.
+
+    Parameters:
+    input_df (pd.DataFrame): The loaded input dataset.
+    label_name (str): The name of the label column in the input dataset.
+    favorable_label_value (float, optional): Value representing the favorable outcome. Defaults to 1.0.
+    unfavorable_label_value (float, optional): Value representing the unfavorable outcome. Defaults to 0.0.
+    backend (str, optional): Metrics backend, 'aif360' or 'native'. Defaults to 'aif360'.
+    prediction_name (str, optional): Column holding a model's predicted labels. Fairness metrics then
+                                     compare predictions with the true labels; without it the labels
+                                     act as predictions. Defaults to None.
+    """
+
+    def __init__(self, input_df: pd.DataFrame, label_name: str, favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, backend: str = 'aif360', prediction_name: str = None):
+        with profiling.stage('validate'):
+            native_metrics.validate_backend(backend)
+            validate_label_column(input_df.columns.tolist(), label_name)
+            validate_label_values(input_df[label_name].unique(), label_name, favorable_label_value, unfavorable_label_value)
+            if prediction_name is not None:
+                validate_prediction_column(input_df.columns.tolist(), prediction_name)
+
+        self.input_df = input_df
+        self.label_name = label_name
+        self.favorable_label_value = favorable_label_value
+        self.unfavorable_label_value = unfavorable_label_value
+        self.backend = backend
+        self.prediction_name = prediction_name
+        self._labels = input_df[label_name].to_numpy()
+        self._label_codes = None
+        self._prediction_codes = None
+        self._group_masks = {}
+        self._datasets = {}
+        self.input_file = None
+        self._source_columns = None
+        self._read_table = data_io.read_table
+        # Serializes on-demand column loads when threads share the session (analysis_server).
+        self._load_lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state['_load_lock']  # locks cannot be pickled (spawned pool workers)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._load_lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, input_file: str, label_name: str, favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, backend: str = 'aif360', columns: list[str] = None, cache=None, prediction_name: str = None) -> "AnalysisSession":
+        """
+        Parse ``input_file`` once and build a session around it.
+
+        The format (CSV, Parquet, Feather, Arrow IPC) follows the file
+        extension. If ``columns`` is given, only those columns, the label
+        and the prediction column are read; other columns of the file are loaded on demand if a later
+        check needs them. If ``cache`` (a ``dataset_cache.DatasetCache``) is
+        given, columns are memory-mapped from it instead of being parsed
+        whenever the input file has not changed since they were cached.
+        """
+        source_columns = data_io.read_columns(input_file)
+        validate_label_column(source_columns, label_name)
+        if prediction_name is not None:
+            validate_prediction_column(source_columns, prediction_name)
+        wanted = {label_name} | ({prediction_name} if prediction_name is not None else set())
+        usecols = None if columns is None else [name for name in source_columns if name in set(columns) | wanted]
+        read_table = cache.read_table if cache is not None else data_io.read_table
+        with profiling.stage('read', file=str(input_file)) as record:
+            input_df = read_table(input_file, usecols)
+            record['rows'] = len(input_df)
+        session = cls(input_df, label_name, favorable_label_value, unfavorable_label_value, backend, prediction_name)
+        session.input_file = input_file
+        session._source_columns = source_columns
+        session._read_table = read_table
+        return session
+
+    @property
+    def columns(self) -> list:
+        """All columns of the input, including any not loaded yet."""
+        return self._source_columns if self._source_columns is not None else self.input_df.columns.tolist()
+
+    def _ensure_loaded(self, names: list[str]) -> None:
+        if all(name not in self.columns or name in self.input_df.columns for name in names):
+            return
+        with self._load_lock:
+            missing = [name for name in names if name in self.columns and name not in self.input_df.columns]
+            if missing:
+                with profiling.stage('read', file=str(self.input_file)) as record:
+                    extra = self._read_table(self.input_file, missing)
+                    record['rows'] = len(extra)
+                self.input_df = self.input_df.assign(**{name: extra[name].to_numpy() for name in missing})
+
+    @property
+    def labels(self) -> np.ndarray:
+        """The label column as a NumPy array, shared by every check."""
+        return self._labels
+
+    @property
+    def label_codes(self) -> np.ndarray:
+        """The label column encoded as 1 (favorable) / 0 (unfavorable), computed once."""
+        if self._label_codes is None:
+            self._label_codes = native_metrics.encode_binary_labels(
+                self._labels, self.label_name, self.favorable_label_value, self.unfavorable_label_value)
+        return self._label_codes
+
+    @property
+    def prediction_codes(self) -> np.ndarray:
+        """
+        The prediction column encoded as 1 (favorable) / 0 (unfavorable), computed once.
+
+        Falls back to ``label_codes`` when the session has no prediction column.
+        """
+        if self.prediction_name is None:
+            return self.label_codes
+        if self._prediction_codes is None:
+            self._prediction_codes = native_metrics.encode_binary_labels(
+                self.input_df[self.prediction_name].to_numpy(), self.prediction_name,
+                self.favorable_label_value, self.unfavorable_label_value)
+        return self._prediction_codes
+
+    def group_mask(self, groups: list[dict]) -> np.ndarray:
+        """Boolean row mask for a group definition, computed once per definition."""
+        key = _groups_key(groups)
+        if key not in self._group_masks:
+            self._group_masks[key] = compute_group_mask(self.input_df, groups)
+        return self._group_masks[key]
+
+    def validate(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> None:
+        """Validate one protected attribute definition against the loaded schema."""
+        with profiling.stage('validate'):
+            validate_protected_attributes(self.columns, protected_attribute_names)
+            validate_group_definitions(protected_attribute_names, privileged_groups, unprivileged_groups)
+        self._ensure_loaded(protected_attribute_names)
+
+    def confusion_counts(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> np.ndarray:
+        """Per-group label/prediction counts used by the native backend."""
+        group_codes = native_metrics.encode_groups(self.group_mask(unprivileged_groups), self.group_mask(privileged_groups))
+        return native_metrics.confusion_counts(group_codes, self.label_codes, self.prediction_codes)
+
+    def accumulator(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> FairnessAccumulator:
+        """Mergeable per-group statistics for one definition over the loaded rows."""
+        self.validate(protected_attribute_names, privileged_groups, unprivileged_groups)
+        accumulator = FairnessAccumulator(self.label_name, protected_attribute_names, privileged_groups, unprivileged_groups,
+                                          self.favorable_label_value, self.unfavorable_label_value, self.prediction_name)
+        return accumulator.add_counts(self.confusion_counts(protected_attribute_names, privileged_groups, unprivileged_groups))
+
+    def binary_label_dataset(self, protected_attribute_names: list[str]) -> BinaryLabelDataset:
+        """
+        AIF360 dataset over the label and protected attribute columns only.
+
+        The group metrics reported by this toolkit never look at the remaining
+        feature columns, so they are left out of the float64 conversion. The
+        dataset is cached and shared by the bias and fairness checks.
+        """
+        key = tuple(protected_attribute_names)
+        if key not in self._datasets:
+            with profiling.stage('dataset') as record:
+                self._datasets[key] = BinaryLabelDataset(
+                    df=self.input_df[list(protected_attribute_names) + [self.label_name]],
+                    label_names=[self.label_name],
+                    protected_attribute_names=protected_attribute_names,
+                    favorable_label=self.favorable_label_value,
+                    unfavorable_label=self.unfavorable_label_value)
+                record['rows'] = len(self.input_df)
+        return self._datasets[key]
+
+    def predicted_dataset(self, protected_attribute_names: list[str]) -> BinaryLabelDataset:
+        """
+        AIF360 view of the predictions for ``ClassificationMetric``.
+
+        A shallow copy of ``binary_label_dataset`` whose labels are replaced by
+        the prediction column, so the protected attributes and instance weights
+        are shared with the true-label dataset instead of being converted twice.
+        Without a prediction column this is the true-label dataset itself.
+        """
+        dataset_true = self.binary_label_dataset(protected_attribute_names)
+        if self.prediction_name is None:
+            return dataset_true
+        key = ('predictions', tuple(protected_attribute_names))
+        if key not in self._datasets:
+            dataset_pred = dataset_true.copy()
+            dataset_pred.labels = np.where(self.prediction_codes == 1, self.favorable_label_value,
+                                           self.unfavorable_label_value).astype(np.float64).reshape(-1, 1)
+            self._datasets[key] = dataset_pred
+        return self._datasets[key]
+
+    def _with_intervals(self, table: pd.DataFrame, score_function, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int, confidence_level: float, random_state) -> pd.DataFrame:
+        if not n_bootstrap:
+            return table
+        # AIF360 computes the point estimates; the replicates are scored by the equivalent native metrics.
+        counts = self.confusion_counts(protected_attribute_names, privileged_groups, unprivileged_groups)
+        return native_metrics.add_confidence_intervals(table, counts, score_function, n_bootstrap, confidence_level, random_state)
+
+    def bias_metrics(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+        """
+        Compute the bias scoring table for one protected attribute definition.
+
+        With ``n_bootstrap`` > 0, ``CI Lower``/``CI Upper``/``Std Error``
+        columns are added from a vectorized Poisson bootstrap over the
+        per-group counts (see ``native_metrics.bootstrap_intervals``), for
+        either backend.
+        """
+        self.validate(protected_attribute_names, privileged_groups, unprivileged_groups)
+        if self.backend == 'native':
+            return native_metrics.bias_table(self.confusion_counts(protected_attribute_names, privileged_groups, unprivileged_groups),
+                                             n_bootstrap, confidence_level, random_state)
+        try:
+            dataset_metric = BinaryLabelDatasetMetric(
+                self.binary_label_dataset(protected_attribute_names),
+                unprivileged_groups=unprivileged_groups,
+                privileged_groups=privileged_groups,
+            )
+
+            disparate_impact = dataset_metric.disparate_impact()
+            statistical_parity_diff = dataset_metric.statistical_parity_difference()
+            mean_diff = dataset_metric.mean_difference()
+        except Exception as e:
+            raise RuntimeError(f"AIF360 error during bias check: {e}") from e
+
+        table = pd.DataFrame({
+            'Metric': BIAS_METRIC_NAMES,
+            'Score': [disparate_impact, statistical_parity_diff, mean_diff]
+        })
+        return self._with_intervals(table, native_metrics.bias_scores, protected_attribute_names, privileged_groups, unprivileged_groups,
+                                    n_bootstrap, confidence_level, random_state)
+
+    def fairness_metrics(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+        """Compute the fairness scoring table for one protected attribute definition (see ``bias_metrics`` for ``n_bootstrap``)."""
+        self.validate(protected_attribute_names, privileged_groups, unprivileged_groups)
+        if self.backend == 'native':
+            return native_metrics.fairness_table(self.confusion_counts(protected_attribute_names, privileged_groups, unprivileged_groups),
+                                                 n_bootstrap, confidence_level, random_state)
+        # Encoding checks the prediction values, so invalid ones are reported as such rather than as an AIF360 error.
+        self.prediction_codes
+        try:
+            data = self.binary_label_dataset(protected_attribute_names)
+
+            # When evaluating the dataset itself (no prediction column),
+            # dataset_true and dataset_pred are the same.
+            classified_dataset = self.predicted_dataset(protected_attribute_names)
+            metric = ClassificationMetric(data, classified_dataset, # dataset_true, dataset_pred
+                                            unprivileged_groups=unprivileged_groups,
+                                            privileged_groups=privileged_groups)
+
+            accuracy = metric.accuracy()
+            tpr = metric.true_positive_rate()
+            tnr = metric.true_negative_rate()
+            balanced_accuracy = (tpr + tnr) / 2
+            demographic_parity_difference = metric.statistical_parity_difference()
+            equal_opportunity_difference = metric.equal_opportunity_difference()
+            equalized_odds_diff = metric.equalized_odds_difference()
+            fpr_diff = metric.false_positive_rate_difference()
+            fnr_diff = metric.false_negative_rate_difference()
+        except Exception as e:
+            raise RuntimeError(f"AIF360 error during fairness check: {e}") from e
+
+        table = pd.DataFrame({
+            'Metric': FAIRNESS_METRIC_NAMES,
+            'Score': [
+                accuracy, balanced_accuracy, demographic_parity_difference,
+                equal_opportunity_difference, equalized_odds_diff,
+                fpr_diff, fnr_diff
+            ]
+        })
+        return self._with_intervals(table, native_metrics.fairness_scores, protected_attribute_names, privileged_groups, unprivileged_groups,
+                                    n_bootstrap, confidence_level, random_state)
+
+    def bias_check(self, output_file: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> None:
+        """Write the bias scoring table for one protected attribute definition."""
+        with profiling.stage('metrics'):
+            table = self.bias_metrics(protected_attribute_names, privileged_groups, unprivileged_groups,
+                                      n_bootstrap, confidence_level, random_state)
+        _write_report(table, output_file)
+
+    def fairness_check(self, output_file: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> None:
+        """Write the fairness scoring table for one protected attribute definition."""
+        with profiling.stage('metrics'):
+            table = self.fairness_metrics(protected_attribute_names, privileged_groups, unprivileged_groups,
+                                          n_bootstrap, confidence_level, random_state)
+        _write_report(table, output_file)
+
+    def intersectional_metrics(self, protected_attribute_names: list[str], min_support: int = 30, mode: str = 'cube') -> pd.DataFrame:
+        """Long-format metrics for every subgroup in the lattice spanned by the attributes (see ``intersectional``)."""
+        from intersectional import cell_counts, subgroup_lattice
+
+        validate_protected_attributes(self.columns, protected_attribute_names)
+        self._ensure_loaded(protected_attribute_names)
+        cells = cell_counts(self.input_df, protected_attribute_names, self.label_name, self.favorable_label_value, self.unfavorable_label_value,
+                            self.prediction_name)
+        return subgroup_lattice(cells, protected_attribute_names, min_support, mode)
+
+    def intersectional_check(self, output_file: str, protected_attribute_names: list[str], min_support: int = 30, mode: str = 'cube') -> None:
+        """Write the intersectional subgroup table."""
+        with profiling.stage('metrics'):
+            table = self.intersectional_metrics(protected_attribute_names, min_support, mode)
+        _write_report(table, output_file)
+
+    def threshold_metrics(self, score_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], thresholds: list[float] = None) -> tuple:
+        """Fairness-vs-threshold and per-group ROC tables for a score column (see ``threshold_sweep``)."""
+        from threshold_sweep import sweep_counts, sweep_frame, sweep_tables, validate_score_column
+
+        validate_score_column(self.columns, score_name)
+        self.validate(protected_attribute_names, privileged_groups, unprivileged_groups)
+        self._ensure_loaded([score_name])
+        grid, histogram = sweep_frame(self.input_df, self.label_name, score_name, privileged_groups, unprivileged_groups,
+                                      self.favorable_label_value, self.unfavorable_label_value, thresholds)
+        return sweep_tables(grid, sweep_counts(histogram))
+
+    def threshold_sweep(self, output_file: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], score_name: str, thresholds: list[float] = None, roc_output_file: str = None) -> None:
+        """Write the fairness-vs-threshold table (and optionally the ROC table) for a score column."""
+        with profiling.stage('metrics'):
+            curves, roc = self.threshold_metrics(score_name, protected_attribute_names, privileged_groups, unprivileged_groups, thresholds)
+        _write_report(curves, output_file)
+        if roc_output_file:
+            _write_report(roc, roc_output_file)
+
+
+class StreamingAnalysis:
+    """
+    Chunked counterpart of ``AnalysisSession`` for inputs larger than memory.
+
+    The input is read ``chunksize`` rows at a time, keeping only the label and
+    protected attribute columns, and each chunk is reduced to the native
+    backend's per-group counts before the next one is read, so peak memory is
+    bounded by the chunk size rather than the file size. Every definition
+    registered before the first metric request is served by the same pass.
+    Metrics are always computed by the native engine.
+
+    Parameters:
+    input_file (str): Path to the input file (CSV, Parquet, Feather or Arrow IPC).
+    label_name (str): The name of the label column in the input dataset.
+    favorable_label_value (float, optional): Value representing the favorable outcome. Defaults to 1.0.
+    unfavorable_label_value (float, optional): Value representing the unfavorable outcome. Defaults to 0.0.
+    chunksize (int, optional): Number of rows read per chunk. Defaults to 1,000,000.
+    prediction_name (str, optional): Column holding a model's predicted labels. Defaults to None.
+    """
+
+    def __init__(self, input_file: str, label_name: str, favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, chunksize: int = 1_000_000, prediction_name: str = None):
+        if chunksize <= 0:
+            raise ValueError(f"chunksize must be a positive integer, got {chunksize}")
+        self.input_file = input_file
+        self.label_name = label_name
+        self.favorable_label_value = favorable_label_value
+        self.unfavorable_label_value = unfavorable_label_value
+        self.chunksize = chunksize
+        self.prediction_name = prediction_name
+        self.columns = data_io.read_columns(input_file)
+        validate_label_column(self.columns, label_name)
+        if prediction_name is not None:
+            validate_prediction_column(self.columns, prediction_name)
+        self._definitions = {}
+        self._accumulators = {}
+
+    def validate(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> None:
+        """Validate one protected attribute definition against the input header."""
+        validate_protected_attributes(self.columns, protected_attribute_names)
+        validate_group_definitions(protected_attribute_names, privileged_groups, unprivileged_groups)
+
+    def register(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> None:
+        """Queue a definition so that the next pass over the input also counts it."""
+        self.validate(protected_attribute_names, privileged_groups, unprivileged_groups)
+        key = (_groups_key(privileged_groups), _groups_key(unprivileged_groups))
+        if key not in self._accumulators:
+            self._definitions[key] = (list(protected_attribute_names), privileged_groups, unprivileged_groups)
+
+    def _pending(self) -> tuple:
+        """Definitions not yet counted, the columns they need and a fresh accumulator for each."""
+        pending = {key: definition for key, definition in self._definitions.items() if key not in self._accumulators}
+        usecols = {name for names, _, _ in pending.values() for name in names} | {self.label_name}
+        if self.prediction_name is not None:
+            usecols.add(self.prediction_name)
+        accumulators = {
+            key: FairnessAccumulator(self.label_name, names, privileged_groups, unprivileged_groups,
+                                     self.favorable_label_value, self.unfavorable_label_value, self.prediction_name)
+            for key, (names, privileged_groups, unprivileged_groups) in pending.items()
+        }
+        return pending, sorted(usecols), accumulators
+
+    def _count_chunk(self, chunk: pd.DataFrame, pending: dict, counters: dict) -> None:
+        # ``counters`` maps each pending definition to a FairnessAccumulator or StratifiedReservoir.
+        label_codes = native_metrics.encode_binary_labels(
+            chunk[self.label_name].to_numpy(), self.label_name, self.favorable_label_value, self.unfavorable_label_value)
+        prediction_codes = label_codes if self.prediction_name is None else native_metrics.encode_binary_labels(
+            chunk[self.prediction_name].to_numpy(), self.prediction_name, self.favorable_label_value, self.unfavorable_label_value)
+        for key, (_, privileged_groups, unprivileged_groups) in pending.items():
+            group_codes = native_metrics.encode_groups(
+                compute_group_mask(chunk, unprivileged_groups), compute_group_mask(chunk, privileged_groups))
+            counters[key].update(group_codes, label_codes, prediction_codes)
+
+    def run(self) -> None:
+        """Stream the input once, counting every registered definition not yet counted."""
+        pending, usecols, accumulators = self._pending()
+        with profiling.stage('stream', file=str(self.input_file)) as record:
+            record['rows'] = 0
+            for chunk in data_io.iter_chunks(self.input_file, usecols, self.chunksize):
+                self._count_chunk(chunk, pending, accumulators)
+                record['rows'] += len(chunk)
+        self._accumulators.update(accumulators)
+
+    def accumulator(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> FairnessAccumulator:
+        """Mergeable per-group statistics for one definition, streaming the input if not yet counted."""
+        self.register(protected_attribute_names, privileged_groups, unprivileged_groups)
+        key = (_groups_key(privileged_groups), _groups_key(unprivileged_groups))
+        if key not in self._accumulators:
+            self.run()
+        return self._accumulators[key]
+
+    def confusion_counts(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> np.ndarray:
+        """Per-group label/prediction counts, streaming the input if not yet counted."""
+        return self.accumulator(protected_attribute_names, privileged_groups, unprivileged_groups).counts.astype(np.float64)
+
+    def bias_metrics(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+        """Compute the bias scoring table for one protected attribute definition."""
+        return self.accumulator(protected_attribute_names, privileged_groups, unprivileged_groups).bias_table(n_bootstrap, confidence_level, random_state)
+
+    def fairness_metrics(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+        """Compute the fairness scoring table for one protected attribute definition."""
+        return self.accumulator(protected_attribute_names, privileged_groups, unprivileged_groups).fairness_table(n_bootstrap, confidence_level, random_state)
+
+    def bias_check(self, output_file: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> None:
+        """Write the bias scoring table for one protected attribute definition."""
+        with profiling.stage('metrics'):
+            table = self.bias_metrics(protected_attribute_names, privileged_groups, unprivileged_groups,
+                                      n_bootstrap, confidence_level, random_state)
+        _write_report(table, output_file)
+
+    def fairness_check(self, output_file: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> None:
+        """Write the fairness scoring table for one protected attribute definition."""
+        with profiling.stage('metrics'):
+            table = self.fairness_metrics(protected_attribute_names, privileged_groups, unprivileged_groups,
+                                          n_bootstrap, confidence_level, random_state)
+        _write_report(table, output_file)
+
+    def intersectional_metrics(self, protected_attribute_names: list[str], min_support: int = 30, mode: str = 'cube') -> pd.DataFrame:
+        """Long-format metrics for every subgroup in the lattice, counted in a separate chunked pass."""
+        from intersectional import count_cells, subgroup_lattice
+
+        cells = count_cells(self.input_file, self.label_name, protected_attribute_names, self.favorable_label_value,
+                            self.unfavorable_label_value, self.prediction_name, self.chunksize)
+        return subgroup_lattice(cells, protected_attribute_names, min_support, mode)
+
+    def intersectional_check(self, output_file: str, protected_attribute_names: list[str], min_support: int = 30, mode: str = 'cube') -> None:
+        """Write the intersectional subgroup table."""
+        with profiling.stage('metrics'):
+            table = self.intersectional_metrics(protected_attribute_names, min_support, mode)
+        _write_report(table, output_file)
+
+    def threshold_metrics(self, score_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], thresholds: list[float] = None) -> tuple:
+        """Fairness-vs-threshold and per-group ROC tables for a score column, counted in a separate chunked pass over a fixed grid."""
+        from threshold_sweep import threshold_tables
+
+        return threshold_tables(self.input_file, self.label_name, score_name, protected_attribute_names, privileged_groups,
+                                unprivileged_groups, self.favorable_label_value, self.unfavorable_label_value, thresholds,
+                                self.chunksize)
+
+    def threshold_sweep(self, output_file: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], score_name: str, thresholds: list[float] = None, roc_output_file: str = None) -> None:
+        """Write the fairness-vs-threshold table (and optionally the ROC table) for a score column."""
+        with profiling.stage('metrics'):
+            curves, roc = self.threshold_metrics(score_name, protected_attribute_names, privileged_groups, unprivileged_groups, thresholds)
+        _write_report(curves, output_file)
+        if roc_output_file:
+            _write_report(roc, roc_output_file)
+
+
+class ApproximateAnalysis(StreamingAnalysis):
+    """
+    Sampled counterpart of ``StreamingAnalysis`` that trades exactness for speed on very large inputs.
+
+    During one pass over the input, every registered definition draws a
+    stratified sample. A ``native_metrics.StratifiedReservoir`` keeps a uniform
+    random sample of at most ``rows_per_group`` rows from each group, so
+    minority groups keep all their rows while majority groups are capped. Each
+    sampled row is weighted by its inverse inclusion probability (rows seen in
+    its group / rows sampled from it). The bias and fairness metrics are
+    computed from these weighted counts. Each score is reported with an
+    ``Error Bound``: the largest distance from the score to its weighted
+    bootstrap interval at ``confidence_level``.
+
+    With a ``tolerance``, the pass stops as soon as, for every registered
+    definition, both groups have at least ``min_group_rows`` sampled rows and
+    every finite metric's error bound is at most ``tolerance``. Stopping early
+    is only valid if the rows read so far are a random sample of the input.
+    A tolerance is therefore only accepted for inputs whose blocks can be read
+    in random order: Parquet row groups, and Arrow IPC or Feather record
+    batches. CSV files and Arrow IPC streams are always read in full, and their
+    bounds describe the sampling within groups only.
+
+    The bootstrap resamples rows independently, so bounds can be too narrow
+    when the rows of a block are strongly alike (e.g. one row group per day).
+    Intersectional checks and threshold sweeps are not approximated.
+
+    Parameters:
+    input_file (str): Path to the input file (CSV, Parquet, Feather or Arrow IPC).
+    label_name (str): The name of the label column in the input dataset.
+    favorable_label_value (float, optional): Value representing the favorable outcome. Defaults to 1.0.
+    unfavorable_label_value (float, optional): Value representing the unfavorable outcome. Defaults to 0.0.
+    chunksize (int, optional): Rows read per chunk; bounds are checked after each chunk. Defaults to 100,000.
+    prediction_name (str, optional): Column holding a model's predicted labels. Defaults to None.
+    tolerance (float, optional): Stop once every error bound is at most this. Defaults to None (read everything).
+    confidence_level (float, optional): Confidence of the error bounds. Defaults to 0.95.
+    min_group_rows (int, optional): Sampled rows both groups need before the pass may stop. Defaults to 1000.
+    rows_per_group (int, optional): Largest sample kept per group. Defaults to 100,000.
+    n_bootstrap (int, optional): Bootstrap replicates behind each bound. Defaults to 200.
+    random_state (int, optional): Seed for the block order, the samples and the bootstrap. Defaults to None.
+    """
+
+    def __init__(self, input_file: str, label_name: str, favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, chunksize: int = 100_000, prediction_name: str = None, tolerance: float = None, confidence_level: float = 0.95, min_group_rows: int = 1000, rows_per_group: int = 100_000, n_bootstrap: int = 200, random_state=None):
+        super().__init__(input_file, label_name, favorable_label_value, unfavorable_label_value, chunksize, prediction_name)
+        if tolerance is not None and tolerance <= 0:
+            raise ValueError(f"tolerance must be positive, got {tolerance}")
+        if not 0 < confidence_level < 1:
+            raise ValueError(f"confidence_level must be between 0 and 1, got {confidence_level}")
+        if int(n_bootstrap) < 2:
+            raise ValueError(f"n_bootstrap must be at least 2, got {n_bootstrap}")
+        if int(rows_per_group) < 1:
+            raise ValueError(f"rows_per_group must be a positive integer, got {rows_per_group}")
+        self.total_rows = data_io.count_rows(input_file)
+        if tolerance is not None and self.total_rows is None:
+            raise ValueError(f"Stopping early at a tolerance needs an input whose blocks can be read in random order "
+                             f"(Parquet, Feather or an Arrow IPC file), got '{input_file}'. Omit tolerance to sample the whole file.")
+        self.tolerance = tolerance
+        self.confidence_level = confidence_level
+        self.min_group_rows = min_group_rows
+        self.rows_per_group = int(rows_per_group)
+        self.n_bootstrap = int(n_bootstrap)
+        self.rows_read = 0
+        self.stopped_early = False
+        self._rng = np.random.default_rng(random_state)
+        # One bootstrap seed, derived from random_state, for the stopping rule and every reported
+        # table, so the bounds that stopped the pass are the bounds reported.
+        self._bootstrap_seed = int(self._rng.integers(2**32))
+        self._pass_info = {}
+
+    def _tables(self, accumulator: FairnessAccumulator) -> tuple:
+        return (accumulator.bias_table(self.n_bootstrap, self.confidence_level, self._bootstrap_seed),
+                accumulator.fairness_table(self.n_bootstrap, self.confidence_level, self._bootstrap_seed))
+
+    def _converged(self, accumulator: FairnessAccumulator, reservoir: native_metrics.StratifiedReservoir) -> bool:
+        sampled = reservoir.sampled
+        unprivileged_rows = sampled[[native_metrics.UNPRIVILEGED, native_metrics.BOTH]].sum()
+        privileged_rows = sampled[[native_metrics.PRIVILEGED, native_metrics.BOTH]].sum()
+        if min(unprivileged_rows, privileged_rows) < self.min_group_rows:
+            return False
+        label_totals = accumulator.counts.sum(axis=(0, 2))
+        if not label_totals.all():  # both label values must have been seen
+            return False
+        for table in self._tables(accumulator):
+            bounds = native_metrics.error_bounds(table)[np.isfinite(table['Score'])]
+            if not (bounds <= self.tolerance).all():  # a nan bound never converges
+                return False
+        return True
+
+    @staticmethod
+    def _fill(accumulator: FairnessAccumulator, reservoir: native_metrics.StratifiedReservoir) -> None:
+        # Sampled rows as counts; their inverse-inclusion weights as instance weights.
+        accumulator.counts = reservoir.counts().astype(np.int64)
+        accumulator.weights = reservoir.weighted_counts()
+
+    def run(self) -> None:
+        """Sample every registered definition not yet sampled in one pass, stopping once the bounds converge."""
+        pending, usecols, accumulators = self._pending()
+        reservoirs = {key: native_metrics.StratifiedReservoir(self.rows_per_group, self._rng) for key in pending}
+        rows, stopped_early = 0, False
+        with profiling.stage('sample', file=str(self.input_file)) as record:
+            for chunk in data_io.iter_chunks(self.input_file, usecols, self.chunksize, shuffle=True, random_state=self._rng):
+                self._count_chunk(chunk, pending, reservoirs)
+                rows += len(chunk)
+                if self.tolerance is None:
+                    continue
+                for key, reservoir in reservoirs.items():
+                    self._fill(accumulators[key], reservoir)
+                if all(self._converged(accumulators[key], reservoirs[key]) for key in reservoirs):
+                    stopped_early = rows < self.total_rows
+                    break
+            record['rows'] = rows
+        for key, reservoir in reservoirs.items():
+            self._fill(accumulators[key], reservoir)
+            self._pass_info[key] = {'rows_read': rows, 'rows_sampled': int(reservoir.sampled.sum()), 'stopped_early': stopped_early}
+        self.rows_read, self.stopped_early = rows, stopped_early
+        self._accumulators.update(accumulators)
+
+    def estimated_counts(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> np.ndarray:
+        """Per-group label/prediction counts estimated for the whole input from the weighted sample."""
+        accumulator = self.accumulator(protected_attribute_names, privileged_groups, unprivileged_groups)
+        key = (_groups_key(privileged_groups), _groups_key(unprivileged_groups))
+        rows_read = self._pass_info[key]['rows_read']
+        if self.total_rows is None or rows_read == 0:
+            return accumulator.weights.copy()
+        return accumulator.weights * (self.total_rows / rows_read)
+
+    def _approximate_table(self, table_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict]) -> pd.DataFrame:
+        accumulator = self.accumulator(protected_attribute_names, privileged_groups, unprivileged_groups)
+        table = getattr(accumulator, table_name)(self.n_bootstrap, self.confidence_level, self._bootstrap_seed)
+        table['Error Bound'] = native_metrics.error_bounds(table)
+        key = (_groups_key(privileged_groups), _groups_key(unprivileged_groups))
+        table.attrs.update({**self._pass_info[key], 'total_rows': self.total_rows,
+                            'confidence_level': self.confidence_level, 'tolerance': self.tolerance})
+        return table
+
+    def bias_metrics(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+        """
+        Estimate the bias scoring table for one protected attribute definition.
+
+        The table has the bootstrap interval columns and ``Error Bound``.
+        They always use the session's ``n_bootstrap``, ``confidence_level`` and
+        seed, so they match the bounds the stopping rule saw; the arguments of
+        the same names are ignored. ``table.attrs`` records ``rows_read``,
+        ``rows_sampled``, ``total_rows`` and ``stopped_early``.
+        """
+        return self._approximate_table('bias_table', protected_attribute_names, privileged_groups, unprivileged_groups)
+
+    def fairness_metrics(self, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+        """Estimate the fairness scoring table for one protected attribute definition (see ``bias_metrics``)."""
+        return self._approximate_table('fairness_table', protected_attribute_names, privileged_groups, unprivileged_groups)
+
+    def describe(self) -> str:
+        """One line on the last sampling pass, e.g. for progress output."""
+        total = f" of {self.total_rows}" if self.total_rows is not None else ""
+        stop = f", stopped once every error bound was within {self.tolerance}" if self.stopped_early else ""
+        return (f"read {self.rows_read}{total} rows and sampled at most {self.rows_per_group} per group{stop} "
+                f"({self.confidence_level:.0%} confidence bounds)")
@@ -0,0 +1,319 @@
+# benchmarks.py
+"""Throughput and memory benchmarks on synthetic data at production scale.
+
+``iter_synthetic_chunks`` generates a seeded dataset modelled on
+``sample_data/sample_data_adult_binary.csv``, one chunk at a time, so inputs
+of 10^8 rows can be written without holding them in memory. The categorical
+columns are integer coded (AIF360 datasets only hold numbers): ``sex`` is 1
+for the privileged group (Male) and 0 otherwise, and ``race`` takes codes
+``0 .. race_cardinality - 1`` with 0 (White) privileged. ``favorable_rate``
+sets the share of favorable labels and ``bias`` the injected disparity:
+unprivileged rows (``sex == 0``) receive the favorable label at ``1 - bias``
+times the privileged rate, so the expected disparate impact for ``sex`` is
+``1 - bias``. A ``prediction`` column and a ``score`` column correlated with
+the label are included for fairness checks and threshold sweeps.
+
+Each benchmark case runs one public entry point (``bias_check``,
+``fairness_check``, ``apply_reweighing``, ``apply_disparate_impact_remover``)
+with a given backend on a generated file. Cases run in a fresh process by
+default, so the reported peak RSS belongs to that case alone. Results are
+saved as JSON and can be compared with a stored baseline:
+
+    python benchmarks.py --rows 100000 1000000 --output bench.json --baseline baseline.json
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import data_io
+from profiling import peak_rss_bytes
+
+LABEL_NAME = 'income-label'
+PRIVILEGED_GROUPS = [{'sex': 1}]
+UNPRIVILEGED_GROUPS = [{'sex': 0}]
+PRIVILEGED_SHARE = 0.67  # share of sex == 1, as in the Adult data
+BENCHMARK_CHUNKSIZE = 1_000_000
+DEFAULT_TOLERANCE = 0.10
+
+
+def _codes(rng: np.random.Generator, n_rows: int, probabilities) -> np.ndarray:
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    return rng.choice(len(probabilities), size=n_rows, p=probabilities / probabilities.sum())
+
+
+def _synthetic_chunk(rng: np.random.Generator, n_rows: int, race_cardinality: int, privileged_rate: float, bias: float) -> pd.DataFrame:
+    sex = (rng.random(n_rows) < PRIVILEGED_SHARE).astype(np.int64)
+    race_probabilities = [0.85] + [0.15 / (race_cardinality - 1)] * (race_cardinality - 1) if race_cardinality > 1 else [1.0]
+    education_num = np.clip(np.rint(rng.normal(10.1, 2.6, n_rows)), 1, 16).astype(np.int64)
+    label = (rng.random(n_rows) < np.where(sex == 1, privileged_rate, privileged_rate * (1 - bias))).astype(np.int64)
+    score = 1 / (1 + np.exp(-(3.0 * (label - 0.5) + 0.25 * (education_num - 10) + rng.normal(0, 1, n_rows))))
+    return pd.DataFrame({
+        'age': np.clip(np.rint(rng.normal(38.6, 13.6, n_rows)), 17, 90).astype(np.int64),
+        'workclass': _codes(rng, n_rows, [0.70, 0.08, 0.06, 0.04, 0.03, 0.06, 0.02, 0.01]),
+        'education-num': education_num,
+        'marital-status': _codes(rng, n_rows, [0.46, 0.33, 0.14, 0.03, 0.03, 0.007, 0.003]),
+        'occupation': _codes(rng, n_rows, [0.13, 0.13, 0.12, 0.12, 0.11, 0.10, 0.06, 0.05, 0.05, 0.04, 0.03, 0.03, 0.02, 0.01]),
+        'relationship': _codes(rng, n_rows, [0.41, 0.26, 0.16, 0.11, 0.05, 0.01]),
+        'race': _codes(rng, n_rows, race_probabilities),
+        'sex': sex,
+        'capital-gain': np.where(rng.random(n_rows) < 0.08, np.minimum(rng.lognormal(8.5, 1.1, n_rows), 99999), 0).astype(np.int64),
+        'capital-loss': np.where(rng.random(n_rows) < 0.05, np.clip(rng.normal(1870, 360, n_rows), 0, None), 0).astype(np.int64),
+        'hours-per-week': np.clip(np.rint(rng.normal(40.4, 12.3, n_rows)), 1, 99).astype(np.int64),
+        'native-country': np.where(rng.random(n_rows) < 0.9, 0, rng.integers(1, 41, n_rows)),
+        'score': score,
+        'prediction': (score >= 0.5).astype(np.int64),
+        LABEL_NAME: label,
+    })
+
+
+def iter_synthetic_chunks(n_rows: int, race_cardinality: int = 5, favorable_rate: float = 0.24, bias: float = 0.3, seed: int = 0, chunksize: int = BENCHMARK_CHUNKSIZE):
+    """
+    Yield a seeded synthetic Adult-like dataset in chunks of ``chunksize`` rows.
+
+    Parameters:
+    n_rows (int): Total number of rows.
+    race_cardinality (int, optional): Number of distinct ``race`` codes. Defaults to 5.
+    favorable_rate (float, optional): Expected share of favorable labels (``income-label == 1``). Defaults to 0.24.
+    bias (float, optional): Relative shortfall of the unprivileged group's favorable rate; the expected
+                            disparate impact for ``sex`` is ``1 - bias``. Defaults to 0.3.
+    seed (int, optional): Seed; the same seed and chunksize always produce the same rows. Defaults to 0.
+    chunksize (int, optional): Rows per chunk. Defaults to 1,000,000.
+
+    Returns:
+    Iterator[pd.DataFrame]: The chunks, in order.
+    """
+    if n_rows < 0 or chunksize <= 0:
+        raise ValueError(f"n_rows must be non-negative and chunksize positive, got {n_rows} and {chunksize}")
+    if race_cardinality < 1:
+        raise ValueError(f"race_cardinality must be at least 1, got {race_cardinality}")
+    if not 0 <= bias < 1:
+        raise ValueError(f"bias must be in [0, 1), got {bias}")
+    # Rates per sex such that the overall favorable rate is favorable_rate.
+    privileged_rate = favorable_rate / (PRIVILEGED_SHARE + (1 - PRIVILEGED_SHARE) * (1 - bias))
+    if favorable_rate <= 0 or privileged_rate > 1:
+        raise ValueError(f"favorable_rate {favorable_rate} is not reachable with bias {bias}")
+    for index, start in enumerate(range(0, n_rows, chunksize)):
+        rng = np.random.default_rng([seed, index])
+        yield _synthetic_chunk(rng, min(chunksize, n_rows - start), race_cardinality, privileged_rate, bias)
+
+
+def generate_dataset(n_rows: int, **params) -> pd.DataFrame:
+    """In-memory synthetic dataset; ``params`` are those of ``iter_synthetic_chunks``."""
+    return pd.concat(list(iter_synthetic_chunks(n_rows, **params)), ignore_index=True)
+
+
+def write_synthetic_dataset(path: str, n_rows: int, **params) -> int:
+    """Write a synthetic dataset chunk by chunk (format by extension) and return the number of rows."""
+    return data_io.write_chunks(iter_synthetic_chunks(n_rows, **params), path)
+
+
+def _bias_check(input_file, output_dir, **kwargs):
+    from bias_check import bias_check
+    bias_check(input_file, os.path.join(output_dir, 'bias.csv'), LABEL_NAME, ['sex'], PRIVILEGED_GROUPS, UNPRIVILEGED_GROUPS, **kwargs)
+
+
+def _fairness_check(input_file, output_dir, **kwargs):
+    from fairness import fairness_check
+    fairness_check(input_file, os.path.join(output_dir, 'fairness.csv'), LABEL_NAME, ['sex'], PRIVILEGED_GROUPS, UNPRIVILEGED_GROUPS,
+                   prediction_name='prediction', **kwargs)
+
+
+def _reweighing(input_file, output_dir, **kwargs):
+    from mitigation_techniques import apply_reweighing
+    apply_reweighing(input_file, os.path.join(output_dir, 'reweighed.csv'), LABEL_NAME, ['sex'], PRIVILEGED_GROUPS, UNPRIVILEGED_GROUPS,
+                     **kwargs)
+
+
+def _disparate_impact_remover(input_file, output_dir, **kwargs):
+    from mitigation_techniques import apply_disparate_impact_remover
+    apply_disparate_impact_remover(input_file, os.path.join(output_dir, 'repaired.csv'), ['sex'], 'sex', LABEL_NAME, **kwargs)
+
+
+# Case name -> callable(input_file, output_dir). Each public entry point once per backend.
+CASES = {
+    'bias_check': functools.partial(_bias_check, backend='aif360'),
+    'bias_check_native': functools.partial(_bias_check, backend='native'),
+    'bias_check_chunked': functools.partial(_bias_check, chunksize=BENCHMARK_CHUNKSIZE),
+    'fairness_check': functools.partial(_fairness_check, backend='aif360'),
+    'fairness_check_native': functools.partial(_fairness_check, backend='native'),
+    'fairness_check_chunked': functools.partial(_fairness_check, chunksize=BENCHMARK_CHUNKSIZE),
+    'reweighing': functools.partial(_reweighing, backend='aif360'),
+    'reweighing_native': functools.partial(_reweighing, backend='native', chunksize=BENCHMARK_CHUNKSIZE),
+    'disparate_impact_remover': functools.partial(_disparate_impact_remover, backend='aif360'),
+    'disparate_impact_remover_native': functools.partial(_disparate_impact_remover, backend='native'),
+    'disparate_impact_remover_chunked': functools.partial(_disparate_impact_remover, chunksize=BENCHMARK_CHUNKSIZE),
+}
+
+
+def run_case(case: str, input_file: str, n_rows: int, repeats: int = 3) -> dict:
+    """
+    Time one case ``repeats`` times in the current process.
+
+    Returns:
+    dict: case, rows, best and all wall times, CPU time of the best run, rows per second (best run),
+          and the process's peak RSS and its growth over the runs.
+    """
+    if case not in CASES:
+        raise ValueError(f"Unknown benchmark case '{case}'. Use one of {list(CASES)}.")
+    # Import the entry points (and AIF360) up front so import time is not measured.
+    import bias_check, fairness, mitigation_techniques  # noqa: F401
+    rss_before = peak_rss_bytes()
+    wall_times, cpu_times = [], []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for _ in range(repeats):
+            wall, cpu = time.perf_counter(), time.process_time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                CASES[case](input_file, output_dir)
+            wall_times.append(time.perf_counter() - wall)
+            cpu_times.append(time.process_time() - cpu)
+    best = int(np.argmin(wall_times))
+    peak = peak_rss_bytes()
+    return {
+        'case': case,
+        'rows': n_rows,
+        'wall_time': wall_times[best],
+        'median_wall_time': statistics.median(wall_times),
+        'wall_times': wall_times,
+        'cpu_time': cpu_times[best],
+        'rows_per_second': n_rows / wall_times[best] if wall_times[best] > 0 else None,
+        'peak_rss_bytes': peak,
+        'rss_growth_bytes': None if peak is None else peak - rss_before,
+    }
+
+
+def _run_isolated(*args) -> dict:
+    # A fresh interpreter per case: ru_maxrss is a high-water mark and would otherwise carry over.
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_case, *args).result()
+
+
+def environment() -> dict:
+    """Versions and machine details stored alongside the results."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_benchmarks(rows: list, cases: list = None, data_dir: str = None, file_format: str = 'csv', repeats: int = 3, isolate: bool = True, **generator_params) -> dict:
+    """
+    Generate (or reuse) one input per size and run every case on it.
+
+    Parameters:
+    rows (list[int]): Dataset sizes, e.g. [10**4, 10**6, 10**8].
+    cases (list[str], optional): Case names from ``CASES``. Defaults to all of them.
+    data_dir (str, optional): Where generated inputs are kept and reused across runs. Defaults to a
+                              temporary directory removed afterwards.
+    file_format (str, optional): Extension of the generated inputs ('csv', 'parquet', 'feather', 'arrow').
+                                 Defaults to 'csv'.
+    repeats (int, optional): Runs per case; the fastest is reported. Defaults to 3.
+    isolate (bool, optional): Run each case in a fresh process so peak RSS is per case. Defaults to True.
+    **generator_params: Passed to ``iter_synthetic_chunks`` (race_cardinality, favorable_rate, bias, seed).
+
+    Returns:
+    dict: ``{'environment': ..., 'generator': ..., 'results': [...]}``, one result per case and size.
+    """
+    cases = list(cases or CASES)
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases {unknown}. Use any of {list(CASES)}.")
+    run = _run_isolated if isolate else run_case
+    results = []
+    with contextlib.ExitStack() as stack:
+        if data_dir is None:
+            data_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(data_dir, exist_ok=True)
+        for n_rows in rows:
+            suffix = '_'.join(f"{name}{value}" for name, value in sorted(generator_params.items()))
+            input_file = os.path.join(data_dir, f"synthetic_{n_rows}{'_' + suffix if suffix else ''}.{file_format}")
+            if not os.path.exists(input_file):
+                write_synthetic_dataset(input_file, n_rows, **generator_params)
+            for case in cases:
+                result = run(case, input_file, n_rows, repeats)
+                results.append(result)
+                print(f"{case:<34} {n_rows:>11,} rows  {result['wall_time']:9.3f} s  "
+                      f"{(result['rows_per_second'] or 0):14,.0f} rows/s  {(result['peak_rss_bytes'] or 0) / 2**20:9.1f} MiB")
+    return {'environment': environment(), 'generator': generator_params, 'results': results}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """
+    Regressions of ``results`` against ``baseline`` (both as returned by ``run_benchmarks``).
+
+    A case regresses when its throughput drops, or its peak RSS grows, by more
+    than ``tolerance`` (a fraction) relative to the baseline run of the same
+    case and size. Cases missing from the baseline are not compared.
+
+    Returns:
+    list[dict]: One entry per regression with case, rows, metric, baseline, current and relative change.
+    """
+    reference = {(result['case'], result['rows']): result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results.get('results', []):
+        previous = reference.get((result['case'], result['rows']))
+        if previous is None:
+            continue
+        for metric, worse in (('rows_per_second', -1), ('peak_rss_bytes', 1)):
+            before, after = previous.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if worse * change > tolerance:
+                regressions.append({'case': result['case'], 'rows': result['rows'], 'metric': metric,
+                                    'baseline': before, 'current': after, 'change': change})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the toolkit's entry points on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10**4, 10**5], help='Dataset sizes (default: 10000 100000)')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=None, help='Cases to run (default: all)')
+    parser.add_argument('--race-cardinality', type=int, default=5, help='Distinct race codes (default: 5)')
+    parser.add_argument('--favorable-rate', type=float, default=0.24, help='Share of favorable labels (default: 0.24)')
+    parser.add_argument('--bias', type=float, default=0.3, help='Injected disparity; expected disparate impact is 1 - bias (default: 0.3)')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed (default: 0)')
+    parser.add_argument('--format', dest='file_format', choices=['csv', 'parquet', 'feather', 'arrow'], default='csv',
+                        help='Format of the generated inputs (default: csv)')
+    parser.add_argument('--data-dir', default=None, help='Keep generated inputs here and reuse them (default: temporary)')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per case; the fastest is reported (default: 3)')
+    parser.add_argument('--no-isolate', action='store_true', help='Run cases in this process (peak RSS then accumulates)')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to save the results (default: benchmark_results.json)')
+    parser.add_argument('--baseline', default=None, help='Baseline JSON to compare with; regressions make the exit status 1')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative throughput drop or peak RSS growth (default: 0.10)')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.rows, args.cases, args.data_dir, args.file_format, args.repeats, not args.no_isolate,
+                             race_cardinality=args.race_cardinality, favorable_rate=args.favorable_rate, bias=args.bias,
+                             seed=args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression['case']} ({regression['rows']:,} rows): {regression['metric']} "
+              f"{regression['baseline']:,.0f} -> {regression['current']:,.0f} ({regression['change']:+.1%})")
+    if not regressions:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
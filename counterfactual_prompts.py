@@ -0,0 +1,227 @@
+"""Counterfactual prompt suites for HallBayes fairness analysis.
+
+A counterfactual suite instantiates the same templates once per group, e.g.
+``"Is {name} a good fit for {pronoun} job?"`` with each group's name and
+pronoun. The templates are expanded lazily. Identical expanded prompts (such
+as templates without placeholders, or groups that share a substitution) are
+deduplicated before anything reaches the backend, so each distinct prompt is
+evaluated once and its metrics are shared by every group that produced it.
+
+Because every template is expanded for every group, the results form a
+templates x groups grid. Counterfactual pairs (each group against a reference
+group on the same template) and per-group disparity statistics (decision
+rate, mean ``roh_bound`` and ``isr``, decision flip rate) are computed from
+that grid in one vectorized pass.
+"""
+from __future__ import annotations
+
+import string
+import warnings
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+
+from hallbayes_fairness import METRIC_COLUMNS, SHARED_GROUP, deduplicated_analysis
+
+
+def template_fields(template: str) -> set:
+    """Names of the ``{placeholders}`` in a ``str.format`` template."""
+    return {field for _, field, _, _ in string.Formatter().parse(template) if field}
+
+
+def expand_templates(
+    templates: Union[pd.DataFrame, Iterable[str]],
+    substitutions: Dict[Any, Dict[str, str]],
+) -> Iterator[Tuple[Any, Any, str]]:
+    """Lazily yield ``(template_id, group, prompt)`` for every template and group.
+
+    Parameters
+    ----------
+    templates: Union[pd.DataFrame, Iterable[str]]
+        Template strings, or a DataFrame with a ``template`` column and an
+        optional ``template_id`` column (defaults to the position).
+    substitutions: Dict[Any, Dict[str, str]]
+        Placeholder values per group, e.g. ``{"f": {"name": "Alice"}}``.
+
+    Raises ``ValueError`` for a missing (e.g. empty CSV cell) or non-string template.
+    """
+    if isinstance(templates, pd.DataFrame):
+        if "template" not in templates.columns:
+            raise ValueError(f"Column 'template' not found in templates: {list(templates.columns)}")
+        ids = templates["template_id"] if "template_id" in templates.columns else range(len(templates))
+        pairs = zip(ids, templates["template"])
+    else:
+        pairs = enumerate(templates)
+    for template_id, template in pairs:
+        if not isinstance(template, str):
+            raise ValueError(f"Template {template_id!r} is missing or not a string: {template!r}")
+        fields = template_fields(template)
+        for group, values in substitutions.items():
+            missing = fields - set(values)
+            if missing:
+                raise ValueError(f"Group '{group}' has no substitution for {sorted(missing)} in template {template_id!r}")
+            yield template_id, group, template.format_map(values)
+
+
+def counterfactual_tables(
+    expanded: pd.DataFrame,
+    metrics: pd.DataFrame,
+    groups: list,
+    reference_group: Any,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Counterfactual pairs and per-group disparity statistics from the templates x groups grid.
+
+    Parameters
+    ----------
+    expanded: pd.DataFrame
+        One row per (template, group) in template-major order, with
+        ``template_id``, ``group`` and ``prompt``.
+    metrics: pd.DataFrame
+        Metrics aligned with ``expanded`` (``decision_answer``, ``roh_bound``, ``isr``).
+    groups: list
+        Groups in grid order.
+    reference_group: Any
+        Group every other group is compared with.
+
+    Returns
+    -------
+    Tuple[pd.DataFrame, pd.DataFrame]
+        Pairs with one row per template and non-reference group, and
+        statistics with one row per group.
+    """
+    n_groups = len(groups)
+    ref = groups.index(reference_group)
+    shape = (len(expanded) // n_groups, n_groups)
+    decisions = metrics["decision_answer"].to_numpy(dtype=np.int64).reshape(shape)
+    roh = metrics["roh_bound"].to_numpy(dtype=np.float64).reshape(shape)
+    isr = metrics["isr"].to_numpy(dtype=np.float64).reshape(shape)
+    flips = decisions != decisions[:, [ref]]
+
+    others = [g for g in range(n_groups) if g != ref]
+    template_ids = expanded["template_id"].to_numpy()[::n_groups]
+    pairs = pd.DataFrame({
+        "template_id": np.repeat(template_ids, len(others)),
+        "group": np.tile(np.asarray(groups, dtype=object)[others], len(template_ids)),
+        "reference_group": reference_group,
+        "decision_answer": decisions[:, others].ravel(),
+        "reference_decision_answer": np.repeat(decisions[:, ref], len(others)),
+        "decision_flip": flips[:, others].ravel(),
+        "roh_bound_difference": (roh[:, others] - roh[:, [ref]]).ravel(),
+        "isr_difference": (isr[:, others] - isr[:, [ref]]).ravel(),
+    })
+
+    with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)  # missing metrics average to nan
+        decision_rate = decisions.mean(axis=0)
+        mean_roh = np.nanmean(roh, axis=0)
+        mean_isr = np.nanmean(isr, axis=0)
+        stats = pd.DataFrame({
+            "group": groups,
+            "n_prompts": shape[0],
+            "decision_rate": decision_rate,
+            "mean_roh_bound": mean_roh,
+            "mean_isr": mean_isr,
+            "decision_rate_difference": decision_rate - decision_rate[ref],
+            "decision_rate_ratio": decision_rate / decision_rate[ref],
+            "mean_roh_bound_difference": mean_roh - mean_roh[ref],
+            "mean_isr_difference": mean_isr - mean_isr[ref],
+            "flip_rate": flips.mean(axis=0),
+        })
+    return pairs, stats
+
+
+def counterfactual_fairness_analysis(
+    templates: Union[pd.DataFrame, Iterable[str]],
+    substitutions: Dict[Any, Dict[str, str]],
+    reference_group: Any = None,
+    output_file: Optional[str] = None,
+    pairs_file: Optional[str] = None,
+    stats_file: Optional[str] = None,
+    **analysis_kwargs: Any,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Evaluate a templated counterfactual suite with each distinct prompt evaluated once.
+
+    Parameters
+    ----------
+    templates: Union[pd.DataFrame, Iterable[str]]
+        Templates, as accepted by ``expand_templates``.
+    substitutions: Dict[Any, Dict[str, str]]
+        Placeholder values per group.
+    reference_group: Any
+        Group the others are compared with. Defaults to the first group.
+    output_file, pairs_file, stats_file: Optional[str]
+        CSV files for the per-prompt results, the counterfactual pairs and
+        the per-group statistics.
+    **analysis_kwargs:
+        Options of ``hallucination_fairness_analysis`` (``model``,
+        ``planner_params``, ``max_concurrency``, ``cache_path``,
+        ``checkpoint_file``, ...). They apply to the distinct prompts.
+
+    Returns
+    -------
+    Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]
+        Per-prompt results (``template_id``, ``group``, ``prompt`` and the
+        HallBayes metrics), counterfactual pairs and per-group statistics.
+        ``results.attrs["unique_prompts"]`` holds the number of prompts
+        actually evaluated.
+    """
+    groups = list(substitutions)
+    if not groups:
+        raise ValueError("substitutions must define at least one group")
+    if reference_group is None:
+        reference_group = groups[0]
+    if reference_group not in substitutions:
+        raise ValueError(f"Reference group '{reference_group}' is not among the groups: {groups}")
+
+    # Only the distinct prompts and one template id per template are kept while expanding.
+    template_ids = []
+
+    def expanded_prompts():
+        for position, (template_id, _, prompt) in enumerate(expand_templates(templates, substitutions)):
+            if position % len(groups) == 0:
+                template_ids.append(template_id)
+            yield prompt
+
+    positions, evaluated = deduplicated_analysis(expanded_prompts(), **analysis_kwargs)
+    expanded = pd.DataFrame({
+        "template_id": np.repeat(np.asarray(template_ids, dtype=object), len(groups)),
+        "group": np.tile(np.asarray(groups, dtype=object), len(template_ids)),
+        "prompt": evaluated["prompt"].to_numpy()[positions] if len(positions) else [],
+    })
+    metrics = evaluated.reindex(columns=METRIC_COLUMNS).iloc[positions].reset_index(drop=True)
+    results = pd.concat([expanded, metrics], axis=1)
+    results.attrs.update(evaluated.attrs)
+    results.attrs["unique_prompts"] = len(evaluated)
+
+    pairs, stats = counterfactual_tables(expanded, metrics, groups, reference_group)
+    for df, path in ((results, output_file), (pairs, pairs_file), (stats, stats_file)):
+        if path:
+            df.to_csv(path, index=False)
+    return results, pairs, stats
+
+
+def counterfactual_fairness_from_csv(
+    template_file: str,
+    substitutions_file: str,
+    group_col: str = "group",
+    **kwargs: Any,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Load templates and per-group substitutions from CSV files and run ``counterfactual_fairness_analysis``.
+
+    Parameters
+    ----------
+    template_file: str
+        CSV with a ``template`` column and an optional ``template_id`` column.
+    substitutions_file: str
+        CSV with a ``group_col`` column and one column per placeholder.
+    group_col: str
+        Name of the column holding group identifiers.
+    **kwargs:
+        Forwarded to ``counterfactual_fairness_analysis``.
+    """
+    templates = pd.read_csv(template_file)
+    table = pd.read_csv(substitutions_file, dtype=str, keep_default_na=False)
+    if group_col not in table.columns:
+        raise ValueError(f"Column '{group_col}' not found in {substitutions_file}")
+    substitutions = {row.pop(group_col): row for row in table.to_dict("records")}
+    return counterfactual_fairness_analysis(templates, substitutions, **kwargs)
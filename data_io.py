@@ -0,0 +1,192 @@
+# data_io.py
+"""Reading and writing tabular inputs by file extension.
+
+CSV remains the default. Parquet (``.parquet``, ``.pq``), Feather
+(``.feather``) and Arrow IPC (``.arrow``, ``.ipc``) inputs are read with
+pyarrow, only for the requested columns, and memory-mapped where the format
+allows it, so checks that need three columns of a wide export never decode the
+rest. pyarrow is an optional dependency that is only imported for those
+formats.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+FORMATS_BY_EXTENSION = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'arrow',
+    '.ipc': 'arrow',
+}
+
+
+def file_format(path: str) -> str:
+    """Return 'csv', 'parquet', 'feather' or 'arrow' based on the file extension (CSV if unknown)."""
+    return FORMATS_BY_EXTENSION.get(os.path.splitext(str(path))[1].lower(), 'csv')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except Exception as exc:  # pragma: no cover - dependency issue
+        raise ImportError(
+            "pyarrow is required to read or write Parquet, Feather and Arrow IPC files."
+            " Install it with `pip install pyarrow`."
+        ) from exc
+    return pyarrow
+
+
+def _open_arrow_ipc(path: str):
+    pa = _pyarrow()
+    source = pa.memory_map(path, 'r')
+    try:
+        return pa.ipc.open_file(source)
+    except pa.ArrowInvalid:
+        # Arrow IPC streaming format rather than the random-access file format.
+        source.seek(0)
+        return pa.ipc.open_stream(source)
+
+
+def read_columns(path: str) -> list:
+    """Column names of ``path`` without reading any rows."""
+    fmt = file_format(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, nrows=0).columns.tolist()
+    pa = _pyarrow()
+    if fmt == 'parquet':
+        return pa.parquet.read_schema(path).names
+    return _open_arrow_ipc(path).schema.names
+
+
+def read_table(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Read ``path`` into a DataFrame, restricted to ``columns`` if given.
+
+    Columns are returned in file order. Parquet, Feather and Arrow IPC files
+    are memory-mapped and only the requested columns are decoded.
+    """
+    fmt = file_format(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, usecols=columns)
+    pa = _pyarrow()
+    if columns is not None:
+        columns = [name for name in read_columns(path) if name in set(columns)]
+    if fmt == 'parquet':
+        table = pa.parquet.read_table(path, columns=columns, memory_map=True)
+    elif fmt == 'feather':
+        table = pa.feather.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = _open_arrow_ipc(path).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    return table.to_pandas()
+
+
+def count_rows(path: str):
+    """
+    Number of rows of ``path`` from its metadata, or None where that needs a full read.
+
+    Parquet footers and Arrow IPC files (including Feather) know their row
+    counts; CSV files and Arrow IPC streams do not.
+    """
+    fmt = file_format(path)
+    if fmt == 'csv':
+        return None
+    pa = _pyarrow()
+    if fmt == 'parquet':
+        return pa.parquet.ParquetFile(path, memory_map=True).metadata.num_rows
+    reader = _open_arrow_ipc(path)
+    if not hasattr(reader, 'num_record_batches'):
+        return None
+    return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+def iter_chunks(path: str, columns: list = None, chunksize: int = 1_000_000, shuffle: bool = False, random_state=None):
+    """
+    Yield DataFrames of at most ``chunksize`` rows from ``path``, restricted to ``columns``.
+
+    With ``shuffle``, the blocks of files that allow random access (Parquet
+    row groups, Arrow IPC file record batches) are visited in a random order
+    drawn from ``random_state``, so any prefix of the chunks is a random
+    sample of blocks. Rows within a block keep their order. CSV files and
+    Arrow IPC streams are always read in file order (see ``count_rows``).
+    """
+    fmt = file_format(path)
+    if fmt == 'csv':
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+        return
+    pa = _pyarrow()
+    if columns is not None:
+        columns = [name for name in read_columns(path) if name in set(columns)]
+    if fmt == 'parquet':
+        parquet_file = pa.parquet.ParquetFile(path, memory_map=True)
+        if not shuffle:
+            for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+                yield batch.to_pandas()
+            return
+        for i in np.random.default_rng(random_state).permutation(parquet_file.num_row_groups):
+            table = parquet_file.read_row_group(int(i), columns=columns)
+            for offset in range(0, table.num_rows, chunksize):
+                yield table.slice(offset, chunksize).to_pandas()
+        return
+    reader = _open_arrow_ipc(path)
+    if hasattr(reader, 'num_record_batches'):
+        order = range(reader.num_record_batches)
+        if shuffle:
+            order = np.random.default_rng(random_state).permutation(reader.num_record_batches)
+        batches = (reader.get_batch(int(i)) for i in order)
+    else:
+        batches = reader
+    for batch in batches:
+        if columns is not None:
+            batch = batch.select(columns)
+        for offset in range(0, batch.num_rows, chunksize):
+            yield batch.slice(offset, chunksize).to_pandas()
+
+
+def write_table(df: pd.DataFrame, path: str) -> None:
+    """Write ``df`` to ``path`` in the format implied by its extension (CSV if unknown)."""
+    fmt = file_format(path)
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    elif fmt == 'parquet':
+        _pyarrow()
+        df.to_parquet(path, index=False)
+    else:
+        _pyarrow()
+        df.reset_index(drop=True).to_feather(path)
+
+
+def write_chunks(chunks, path: str) -> int:
+    """
+    Write an iterable of DataFrames with the same columns to ``path`` one chunk at a time.
+
+    CSV chunks are appended under a single header; Parquet chunks become row
+    groups and Feather/Arrow IPC chunks record batches of one file, so only
+    one chunk is held in memory. Returns the number of rows written.
+    """
+    fmt = file_format(path)
+    rows = 0
+    writer = schema = None
+    try:
+        for i, chunk in enumerate(chunks):
+            if fmt == 'csv':
+                chunk.to_csv(path, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+            else:
+                pa = _pyarrow()
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    # Later chunks are cast to the first chunk's schema (e.g. an all-null column).
+                    schema = table.schema
+                    writer = pa.parquet.ParquetWriter(path, schema) if fmt == 'parquet' else pa.ipc.new_file(path, schema)
+                writer.write_table(table.cast(schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
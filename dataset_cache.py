@@ -0,0 +1,164 @@
+# dataset_cache.py
+"""Opt-in on-disk cache of parsed input columns.
+
+Repeated runs against the same input file pay for the full parse and for
+encoding string columns such as ``race`` or ``sex`` every time. A
+``DatasetCache`` stores each column a run needed as a ``.npy`` file (string
+and other object columns as integer codes plus a category dictionary) in a
+directory keyed by the input's path, size and modification time, optionally
+with a content hash. Later runs memory-map those files instead of parsing the
+input. Columns not cached yet are read from the input (projected to just those
+columns) and added to the entry. Whole entries are evicted least recently used
+first once the cache directory exceeds its size cap.
+"""
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import data_io
+
+MANIFEST = 'manifest.json'
+
+
+def file_fingerprint(path: str, content_hash: bool = False) -> str:
+    """Hash of ``path``'s absolute path, size and mtime (plus its contents if ``content_hash``)."""
+    stat = os.stat(path)
+    key = hashlib.sha256(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    if content_hash:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                key.update(block)
+    return key.hexdigest()[:32]
+
+
+class DatasetCache:
+    """
+    Directory of memory-mappable column caches, one entry per input fingerprint.
+
+    Parameters:
+    cache_dir (str): Directory holding the cache entries. Created if missing.
+    max_bytes (int, optional): Size cap for the whole directory; least recently used
+                               entries are evicted beyond it. Defaults to 10 GiB.
+    content_hash (bool, optional): Include a hash of the file contents in the key, so that
+                                   rewrites preserving size and mtime are detected. Costs one
+                                   sequential read of the file per run. Defaults to False.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 10 * 1024 ** 3, content_hash: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def fingerprint(self, path: str) -> str:
+        """Cache key for ``path``: absolute path, size and mtime (plus contents if enabled)."""
+        return file_fingerprint(path, self.content_hash)
+
+    def _entry_dir(self, path: str) -> str:
+        return os.path.join(self.cache_dir, self.fingerprint(path))
+
+    @staticmethod
+    def _read_manifest(entry_dir: str) -> dict:
+        try:
+            with open(os.path.join(entry_dir, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'columns': {}}
+
+    @staticmethod
+    def _write_atomic(path: str, write) -> None:
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def _store_column(self, entry_dir: str, manifest: dict, name: str, series: pd.Series) -> None:
+        file_name = f"col{len(manifest['columns'])}.npy"
+        if series.dtype == object or isinstance(series.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            codes, categories = pd.factorize(series)
+            try:
+                categories = json.loads(json.dumps(categories.tolist()))
+            except TypeError:
+                return # Not representable as a category dictionary; always read from the input.
+            values, info = codes.astype(np.int32), {'file': file_name, 'categories': categories}
+        else:
+            values, info = series.to_numpy(), {'file': file_name}
+        if values.dtype == object:
+            return
+        self._write_atomic(os.path.join(entry_dir, file_name), lambda f: np.save(f, values, allow_pickle=False))
+        manifest['columns'][name] = info
+
+    @staticmethod
+    def _load_column(entry_dir: str, info: dict):
+        values = np.load(os.path.join(entry_dir, info['file']), mmap_mode='r', allow_pickle=False)
+        if 'categories' in info:
+            return pd.Categorical.from_codes(values, categories=info['categories'])
+        return values
+
+    def read_table(self, path: str, columns: list = None) -> pd.DataFrame:
+        """
+        Read ``columns`` of ``path`` (all columns if None), served from the cache when possible.
+
+        Cached columns come back memory-mapped; string columns come back as
+        pandas categoricals with the original values.
+        """
+        entry_dir = self._entry_dir(path)
+        os.makedirs(entry_dir, exist_ok=True)
+        manifest = self._read_manifest(entry_dir)
+        if 'source_columns' not in manifest:
+            manifest['source_columns'] = data_io.read_columns(path)
+        wanted = [name for name in manifest['source_columns'] if columns is None or name in set(columns)]
+
+        missing = [name for name in wanted if name not in manifest['columns']]
+        manifest_path = os.path.join(entry_dir, MANIFEST)
+        fresh = data_io.read_table(path, missing) if missing else None
+        if missing or not os.path.exists(manifest_path):
+            for name in missing:
+                self._store_column(entry_dir, manifest, name, fresh[name])
+            self._write_atomic(manifest_path, lambda f: f.write(json.dumps(manifest).encode()))
+        else:
+            os.utime(manifest_path) # Mark the entry as recently used.
+
+        data = {}
+        for name in wanted:
+            if name in manifest['columns']:
+                data[name] = self._load_column(entry_dir, manifest['columns'][name])
+            else:
+                data[name] = fresh[name].to_numpy()
+        self.evict(keep=entry_dir)
+        return pd.DataFrame(data, copy=False)
+
+    def _entries(self) -> list:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(entry_dir):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+            manifest_path = os.path.join(entry_dir, MANIFEST)
+            last_used = os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else 0.0
+            entries.append((last_used, size, entry_dir))
+        return entries
+
+    def size(self) -> int:
+        """Total bytes held by the cache directory."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep: str = None) -> None:
+        """Delete least recently used entries until the cache fits in ``max_bytes``."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            if entry_dir == keep:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        """Remove every cache entry."""
+        for _, _, entry_dir in self._entries():
+            shutil.rmtree(entry_dir, ignore_errors=True)
@@ -1,15 +1,16 @@
 # fairness_check.py
-import pandas as pd
-from aif360.metrics import ClassificationMetric
-from aif360.datasets import BinaryLabelDataset
+from analysis_session import AnalysisSession, ApproximateAnalysis, StreamingAnalysis
+import profiling
 
-def fairness_check(input_file: str, output_file: str, label_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0)-> None:
+def fairness_check(input_file: str, output_file: str, label_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, backend: str = 'aif360', chunksize: int = None, accumulator_file: str = None, n_bootstrap: int = 0, confidence_level: float = 0.95, random_state: int = None, prediction_name: str = None, approximate: bool = False, tolerance: float = None)-> None:
     """
     Checks for multiple types of fairness in an input dataset and outputs a scoring table.
 
     Parameters:
-    input_file (str): Path to the input CSV file.
+    input_file (str): Path to the input file. CSV by default; Parquet (.parquet/.pq), Feather (.feather)
+                      and Arrow IPC (.arrow/.ipc) are read by extension, loading only the needed columns.
     output_file (str): Path to the output CSV file where the scoring table will be saved.
+                       May be None when only ``accumulator_file`` is wanted.
     label_name (str): The name of the label column in the input dataset.
     protected_attribute_names (list[str]): A list of names of the protected attribute columns.
     privileged_groups (list[dict]): A list of dictionaries representing privileged groups.
@@ -20,87 +21,50 @@ def fairness_check(input_file: str, output_file: str, label_name: str, protected
                                             Defaults to 1.0.
     unfavorable_label_value (float, optional): Value representing the unfavorable outcome in the label column.
                                               Defaults to 0.0.
+    backend (str, optional): Metrics backend. 'aif360' builds AIF360 datasets and metrics;
+                             'native' computes the same scores from per-group counts with NumPy.
+                             Defaults to 'aif360'.
+    chunksize (int, optional): If given, stream the input in chunks of this many rows and accumulate
+                               per-group counts instead of loading the whole file. Peak memory is then
+                               bounded by the chunk size; metrics are computed by the native engine.
+                               Defaults to None (load the whole file).
+    accumulator_file (str, optional): If given, also save the mergeable ``FairnessAccumulator`` for this
+                                      input to this path. Accumulators saved from separate shards can be
+                                      loaded, merged and finalized into the same scoring table.
+                                      Defaults to None.
+    n_bootstrap (int, optional): If greater than 0, add ``CI Lower``, ``CI Upper`` and ``Std Error`` columns
+                                 computed from this many Poisson bootstrap replicates of the per-group
+                                 counts, scored as one batched array computation. Defaults to 0 (no intervals).
+    confidence_level (float, optional): Coverage of the bootstrap intervals. Defaults to 0.95.
+    random_state (int, optional): Seed for reproducible bootstrap intervals. Defaults to None.
+    prediction_name (str, optional): Column holding a model's predicted labels (same favorable/unfavorable
+                                     values as the label). The metrics then compare these predictions with
+                                     the true labels in ``label_name``. Defaults to None, in which case the
+                                     labels themselves are evaluated (accuracy 1.0, zero error-rate gaps).
+    approximate (bool, optional): Estimate the metrics from a stratified sample drawn per group
+                                  (``analysis_session.ApproximateAnalysis``) instead of counting every row.
+                                  The table gains an ``Error Bound`` column next to the bootstrap interval
+                                  columns (``n_bootstrap`` replicates, 200 if not given). Defaults to False.
+    tolerance (float, optional): In approximate mode, stop reading once every error bound is at most this
+                                 at ``confidence_level``. Only for Parquet, Feather and Arrow IPC files, whose
+                                 blocks are read in random order. Defaults to None (read the whole input).
 
     Returns:
     None
     """
-    # Read in the input dataset
-    input_df = pd.read_csv(input_file)
-
-    # --- Start Validation (Similar to bias_check.py) ---
-    if label_name not in input_df.columns:
-        raise ValueError(f"Label name '{label_name}' not found in input CSV columns: {input_df.columns.tolist()}")
-
-    for attr_name in protected_attribute_names:
-        if attr_name not in input_df.columns:
-            raise ValueError(f"Protected attribute name '{attr_name}' not found in input CSV columns: {input_df.columns.tolist()}")
-
-    if len(protected_attribute_names) != len(set(protected_attribute_names)):
-        raise ValueError(f"Protected attribute names must be unique. Found: {protected_attribute_names}")
-
-    label_values = input_df[label_name].unique()
-    if favorable_label_value not in label_values:
-        raise ValueError(f"Favorable label value '{favorable_label_value}' not found in label column '{label_name}'. Present values: {label_values}")
-    if unfavorable_label_value not in label_values:
-        raise ValueError(f"Unfavorable label value '{unfavorable_label_value}' not found in label column '{label_name}'. Present values: {label_values}")
-
-    if not isinstance(privileged_groups, list) or not all(isinstance(g, dict) for g in privileged_groups):
-        raise ValueError("privileged_groups must be a list of dictionaries.")
-    if not privileged_groups: # Ensure not empty
-        raise ValueError("privileged_groups cannot be empty.")
-
-    if not isinstance(unprivileged_groups, list) or not all(isinstance(g, dict) for g in unprivileged_groups):
-        raise ValueError("unprivileged_groups must be a list of dictionaries.")
-    if not unprivileged_groups: # Ensure not empty
-        raise ValueError("unprivileged_groups cannot be empty.")
-
-    for group_list_name, group_list in [("privileged_groups", privileged_groups), ("unprivileged_groups", unprivileged_groups)]:
-        for group_dict in group_list:
-            if not group_dict: # Ensure dict itself is not empty
-                raise ValueError(f"Empty dictionary found in {group_list_name}.")
-            for key in group_dict.keys():
-                if key not in protected_attribute_names:
-                    raise ValueError(f"Key '{key}' in {group_list_name} definition {group_dict} is not among protected_attribute_names: {protected_attribute_names}")
-    # --- End Validation ---
-
-    try:
-        data = BinaryLabelDataset(df=input_df, label_names=[label_name],
-                                    protected_attribute_names=protected_attribute_names,
-                                    favorable_label=favorable_label_value,
-                                    unfavorable_label=unfavorable_label_value)
-
-        # When evaluating the dataset itself (not a model's predictions on it),
-        # dataset_true and dataset_pred are the same.
-        classified_dataset = data
-        metric = ClassificationMetric(data, classified_dataset, # dataset_true, dataset_pred
-                                        unprivileged_groups=unprivileged_groups,
-                                        privileged_groups=privileged_groups)
-
-        accuracy = metric.accuracy()
-        tpr = metric.true_positive_rate()
-        tnr = metric.true_negative_rate()
-        balanced_accuracy = (tpr + tnr) / 2
-        demographic_parity_difference = metric.statistical_parity_difference()
-        equal_opportunity_difference = metric.equal_opportunity_difference()
-
-        # Add new metrics
-        equalized_odds_diff = metric.equalized_odds_difference()
-        fpr_diff = metric.false_positive_rate_difference()
-        fnr_diff = metric.false_negative_rate_difference()
-
-        scoring_table = {
-            'Metric': [
-                'Accuracy', 'Balanced Accuracy', 'Demographic Parity Difference',
-                'Equal Opportunity Difference', 'Equalized Odds Difference',
-                'False Positive Rate Difference', 'False Negative Rate Difference'
-            ],
-            'Score': [
-                accuracy, balanced_accuracy, demographic_parity_difference,
-                equal_opportunity_difference, equalized_odds_diff,
-                fpr_diff, fnr_diff
-            ]
-        }
-        pd.DataFrame(scoring_table).to_csv(output_file, index=False)
-
-    except Exception as e:
-        raise RuntimeError(f"AIF360 error during fairness check: {e}") from e
+    with profiling.stage('fairness_check', attribute=','.join(protected_attribute_names)):
+        if approximate:
+            session = ApproximateAnalysis(input_file, label_name, favorable_label_value, unfavorable_label_value, chunksize or 100_000,
+                                          prediction_name=prediction_name, tolerance=tolerance, confidence_level=confidence_level,
+                                          n_bootstrap=n_bootstrap or 200, random_state=random_state)
+        elif chunksize:
+            session = StreamingAnalysis(input_file, label_name, favorable_label_value, unfavorable_label_value, chunksize,
+                                        prediction_name=prediction_name)
+        else:
+            session = AnalysisSession.from_file(input_file, label_name, favorable_label_value, unfavorable_label_value, backend,
+                                                 columns=protected_attribute_names, prediction_name=prediction_name)
+        if output_file:
+            session.fairness_check(output_file, protected_attribute_names, privileged_groups, unprivileged_groups,
+                                   n_bootstrap, confidence_level, random_state)
+        if accumulator_file:
+            session.accumulator(protected_attribute_names, privileged_groups, unprivileged_groups).save(accumulator_file)
@@ -0,0 +1,261 @@
+# fairness_monitor.py
+"""Sliding-window fairness monitoring over a timestamped stream of decisions.
+
+``FairnessMonitor`` consumes records (dicts with a timestamp, the label, an
+optional prediction and the protected attributes) one at a time and reports
+the ``bias_check``/``fairness_check`` metrics for each window of time. Each
+record only increments one cell of a per-bucket ``(4, 2, 2)`` counts tensor
+(the native engine's group x label x prediction layout), and the buckets live
+in a ring buffer holding exactly one window. A running window total is kept
+alongside: when time advances past a bucket, that bucket's counts are
+subtracted from the total and its slot is reused. Adding an event and closing
+a window are therefore O(1), and memory stays bounded however long the
+monitor runs.
+
+Windows close every ``slide_buckets`` buckets. A slide equal to the window
+length gives tumbling windows; a smaller slide gives sliding windows. Each
+closed window is emitted as one row with its metrics and any threshold alerts
+(windows falling entirely inside a gap in the stream are skipped).
+Records can come from an iterator, from JSONL on stdin or a file
+(``iter_jsonl``), or from a growing file that is followed like ``tail -f``
+(``tail_jsonl``). Running this module as a script monitors a JSONL source
+with the settings in the ``monitor`` section of a config file.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+import native_metrics
+from native_metrics import BIAS_METRIC_NAMES, FAIRNESS_METRIC_NAMES, N_GROUP_CODES, PRIVILEGED, UNPRIVILEGED
+
+
+def _to_seconds(value) -> float:
+    """Epoch seconds from a number or an ISO 8601 string (naive times are taken as UTC)."""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _in_groups(record: dict, groups: list[dict]) -> bool:
+    # Same conditioning as compute_group_mask: dicts OR-ed, key/value pairs AND-ed.
+    return any(all(record.get(key) == value for key, value in group.items()) for group in groups)
+
+
+class FairnessMonitor:
+    """
+    Time-bucketed ring buffer of per-group counts with windowed metrics and alerts.
+
+    Parameters:
+    label_name (str): Field holding the true label.
+    privileged_groups (list[dict]): A list of dictionaries representing privileged groups.
+    unprivileged_groups (list[dict]): A list of dictionaries representing unprivileged groups.
+    favorable_label_value (float, optional): Value representing the favorable outcome. Defaults to 1.0.
+    unfavorable_label_value (float, optional): Value representing the unfavorable outcome. Defaults to 0.0.
+    prediction_name (str, optional): Field holding the prediction. Defaults to None (labels act as predictions).
+    timestamp_name (str, optional): Field holding epoch seconds or an ISO 8601 time. Defaults to 'timestamp'.
+    bucket_seconds (float, optional): Width of one ring-buffer bucket. Defaults to 60.
+    window_buckets (int, optional): Window length in buckets. Defaults to 60.
+    slide_buckets (int, optional): Buckets between emitted windows; equal to ``window_buckets``
+                                   for tumbling windows. Defaults to 1.
+    thresholds (dict, optional): Alert bounds per metric name, e.g.
+                                 ``{'Disparate Impact': {'min': 0.8, 'max': 1.25}}``. Defaults to None.
+    min_events (int, optional): Windows with fewer events are emitted without alerts. Defaults to 1.
+    """
+
+    def __init__(self, label_name: str, privileged_groups: list[dict], unprivileged_groups: list[dict], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, prediction_name: str = None, timestamp_name: str = 'timestamp', bucket_seconds: float = 60, window_buckets: int = 60, slide_buckets: int = 1, thresholds: dict = None, min_events: int = 1):
+        if bucket_seconds <= 0:
+            raise ValueError(f"bucket_seconds must be positive, got {bucket_seconds}")
+        if window_buckets < 1 or not 1 <= slide_buckets <= window_buckets:
+            raise ValueError(f"Need window_buckets >= 1 and 1 <= slide_buckets <= window_buckets, got {window_buckets} and {slide_buckets}")
+        unknown = set(thresholds or {}) - set(BIAS_METRIC_NAMES) - set(FAIRNESS_METRIC_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown metrics in thresholds: {sorted(unknown)}")
+        self.label_name = label_name
+        self.privileged_groups = privileged_groups
+        self.unprivileged_groups = unprivileged_groups
+        self.favorable_label_value = favorable_label_value
+        self.unfavorable_label_value = unfavorable_label_value
+        self.prediction_name = prediction_name
+        self.timestamp_name = timestamp_name
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.slide_buckets = slide_buckets
+        self.thresholds = thresholds or {}
+        self.min_events = min_events
+
+        self._buckets = np.zeros((window_buckets, N_GROUP_CODES, 2, 2), dtype=np.int64)
+        self._window = np.zeros((N_GROUP_CODES, 2, 2), dtype=np.int64)
+        self._current = None # Absolute index of the newest bucket seen.
+        self.late_events = 0
+        self.invalid_events = 0
+
+    def _label_code(self, value, field: str) -> int:
+        if value == self.favorable_label_value:
+            return 1
+        if value == self.unfavorable_label_value:
+            return 0
+        raise ValueError(f"Field '{field}' has value {value!r}, not the favorable or unfavorable label.")
+
+    def _advance_to(self, bucket: int) -> list:
+        """Move the newest bucket forward, retiring expired buckets and closing windows."""
+        rows = []
+        steps = bucket - self._current
+        for absolute in range(self._current + 1, self._current + 1 + min(steps, self.window_buckets)):
+            # Windows end at multiples of slide_buckets; the total still holds buckets absolute - W .. absolute - 1.
+            if absolute % self.slide_buckets == 0:
+                rows.append(self._window_row(absolute))
+            slot = absolute % self.window_buckets
+            self._window -= self._buckets[slot]
+            self._buckets[slot] = 0
+        # After a gap longer than the window every bucket is empty, so the windows
+        # that would end inside the rest of the gap are skipped rather than emitted.
+        self._current = bucket
+        return rows
+
+    def _bucket_time(self, bucket: int) -> float:
+        return bucket * self.bucket_seconds
+
+    def update(self, record: dict) -> list:
+        """
+        Add one record and return the rows of any windows it closed.
+
+        Records older than the current window are counted in ``late_events``
+        and records with a missing timestamp or an unexpected label or
+        prediction in ``invalid_events``; both are otherwise ignored.
+        """
+        try:
+            timestamp = _to_seconds(record[self.timestamp_name])
+            label = self._label_code(record[self.label_name], self.label_name)
+            prediction = label if self.prediction_name is None else self._label_code(record[self.prediction_name], self.prediction_name)
+        except (KeyError, TypeError, ValueError):
+            self.invalid_events += 1
+            return []
+        group = UNPRIVILEGED * _in_groups(record, self.unprivileged_groups) + PRIVILEGED * _in_groups(record, self.privileged_groups)
+
+        bucket = math.floor(timestamp / self.bucket_seconds)
+        rows = []
+        if self._current is None:
+            self._current = bucket
+        elif bucket > self._current:
+            rows = self._advance_to(bucket)
+        elif bucket <= self._current - self.window_buckets:
+            self.late_events += 1
+            return rows
+        self._buckets[bucket % self.window_buckets, group, label, prediction] += 1
+        self._window[group, label, prediction] += 1
+        return rows
+
+    def consume(self, records, flush: bool = True):
+        """Yield a row for every window closed while consuming ``records``, then (optionally) the open window."""
+        for record in records:
+            yield from self.update(record)
+        if flush and self._current is not None:
+            yield self._window_row(self._current + 1)
+
+    @property
+    def window_counts(self) -> np.ndarray:
+        """``(4, 2, 2)`` counts of the current window."""
+        return self._window.copy()
+
+    def _window_row(self, end_bucket: int) -> dict:
+        counts = self._window.astype(np.float64)
+        scores = dict(zip(BIAS_METRIC_NAMES, native_metrics.bias_scores(counts)))
+        scores.update(zip(FAIRNESS_METRIC_NAMES, native_metrics.fairness_scores(counts)))
+        n_events = int(self._window.sum())
+        row = {
+            'window_start': self._bucket_time(end_bucket - self.window_buckets),
+            'window_end': self._bucket_time(end_bucket),
+            'n_events': n_events,
+            'n_privileged': int(self._window[[PRIVILEGED, 3]].sum()),
+            'n_unprivileged': int(self._window[[UNPRIVILEGED, 3]].sum()),
+        }
+        row.update({name: float(score) for name, score in scores.items()})
+        alerts = []
+        if n_events >= self.min_events:
+            for metric, bounds in self.thresholds.items():
+                score = row[metric]
+                if 'min' in bounds and score < bounds['min']:
+                    alerts.append(f"{metric} {score:.4g} < {bounds['min']}")
+                if 'max' in bounds and score > bounds['max']:
+                    alerts.append(f"{metric} {score:.4g} > {bounds['max']}")
+        row['alerts'] = alerts
+        return row
+
+
+def iter_jsonl(stream):
+    """Yield one dict per non-empty line of a JSONL text stream (e.g. ``sys.stdin``)."""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def tail_jsonl(path: str, poll_interval: float = 1.0, from_start: bool = False, follow: bool = True):
+    """
+    Yield records appended to a JSONL file, like ``tail -f``.
+
+    Only complete lines are parsed; a partially written last line is kept
+    until its newline arrives. With ``follow=False`` reading stops at the end
+    of the file.
+    """
+    with open(path, 'r') as f:
+        if not from_start:
+            f.seek(0, 2)
+        pending = ''
+        while True:
+            chunk = f.readline()
+            if not chunk:
+                if not follow:
+                    break
+                time.sleep(poll_interval)
+                continue
+            pending += chunk
+            if pending.endswith('\n'):
+                if pending.strip():
+                    yield json.loads(pending)
+                pending = ''
+
+
+def main():
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Monitor fairness over a JSONL stream of timestamped decisions.")
+    parser.add_argument('--config', type=str, default='config_template.yaml',
+                        help='YAML config with analysis_params and a monitor section (default: config_template.yaml)')
+    parser.add_argument('--input', type=str, default='-', help="JSONL file to read, or '-' for stdin (default)")
+    parser.add_argument('--follow', action='store_true', help='Keep following the input file as it grows')
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    analysis_params = config.get('analysis_params', {})
+    monitor_params = dict(config.get('monitor') or {})
+    attribute = monitor_params.pop('attribute', None)
+    definitions = analysis_params.get('protected_attributes_definitions', [])
+    definition = next((d for d in definitions if d.get('name') == attribute), definitions[0] if definitions else None)
+    if definition is None:
+        print("Error: no protected attribute definition to monitor.", file=sys.stderr)
+        return
+
+    monitor = FairnessMonitor(
+        analysis_params.get('label_name'), definition['privileged_groups'], definition['unprivileged_groups'],
+        analysis_params.get('favorable_label_value', 1.0), analysis_params.get('unfavorable_label_value', 0.0),
+        prediction_name=analysis_params.get('prediction_name'), **monitor_params)
+    records = iter_jsonl(sys.stdin) if args.input == '-' else tail_jsonl(args.input, from_start=True, follow=args.follow)
+    for row in monitor.consume(records):
+        # Undefined metrics (e.g. an empty group in the window) are written as JSON null.
+        row = {key: None if isinstance(value, float) and not math.isfinite(value) else value for key, value in row.items()}
+        print(json.dumps(row), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,289 @@ and returns a DataFrame containing the resulting metrics
 along with group labels.  The output can be fed into
 existing bias/fairness checks within this repository.
 
+Large prompt suites can be evaluated concurrently: each prompt becomes its
+own planner call in a thread pool, paced by a shared token bucket and retried
+with jittered exponential backoff on transient API errors. Results are put
+back in prompt order, so per-group ordering is the same as a sequential run.
+
+Identical prompts are evaluated once by ``deduplicated_analysis``, which
+``hallucination_fairness_from_csv`` and the counterfactual suites of
+``counterfactual_prompts`` both go through.
+
+For long runs, ``iter_hallucination_metrics`` yields each prompt's row as it
+completes and appends it to a JSONL checkpoint. A crashed run resumes by
+skipping the prompts whose stable group/prompt hash is already checkpointed.
+
 The HallBayes project:
 https://github.com/leochlon/hallbayes
 """
 from __future__ import annotations
 
-from typing import Sequence, Optional, Dict, Any
+import hashlib
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
 import pandas as pd
 
+# HTTP statuses and exception names treated as transient (worth retrying).
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+TRANSIENT_ERROR_NAMES = (
+    "RateLimitError",
+    "APITimeoutError",
+    "APIConnectionError",
+    "InternalServerError",
+    "ServiceUnavailableError",
+)
+# Group passed to the analysis for deduplicated prompts, which belong to no single group.
+SHARED_GROUP = "*"
+METRIC_COLUMNS = ["decision_answer", "roh_bound", "delta_bar", "b2t", "isr", "q_lo", "q_bar"]
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing ``rate`` acquisitions per second.
+
+    Parameters
+    ----------
+    rate: float
+        Tokens added per second.
+    capacity: Optional[float]
+        Maximum burst size. Defaults to ``max(1, rate)``.
+    clock, sleep: Callable
+        Time source and sleep function, replaceable in tests.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                # The tolerance absorbs rounding in the refill, which could otherwise ask for a zero-length sleep.
+                if self._tokens >= 1 - 1e-9:
+                    self._tokens = max(0.0, self._tokens - 1)
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Whether ``exc`` looks like a rate limit, timeout or server error worth retrying."""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    if status in TRANSIENT_STATUS_CODES:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def call_with_retry(
+    function: Callable[[], Any],
+    max_retries: int = 5,
+    backoff: float = 1.0,
+    max_backoff: float = 60.0,
+    rate_limiter: Optional[TokenBucket] = None,
+    rng: Optional[random.Random] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Any:
+    """Call ``function``, retrying transient errors with full-jitter exponential backoff.
+
+    Every attempt first takes a token from ``rate_limiter`` (if given). The
+    delay before retry ``n`` is drawn uniformly from
+    ``[0, min(max_backoff, backoff * 2 ** n)]``. Non-transient errors, and
+    transient ones after ``max_retries`` retries, are raised.
+    """
+    rng = rng or random.Random()
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return function()
+        except Exception as exc:
+            if attempt == max_retries or not is_transient_error(exc):
+                raise
+            sleep(rng.uniform(0, min(max_backoff, backoff * 2 ** attempt)))
+
+
+def prompt_key(group: Any, prompt: str, occurrence: int = 0) -> str:
+    """Stable hash of a (group, prompt) pair; ``occurrence`` tells repeated pairs apart."""
+    payload = json.dumps([str(group), prompt, occurrence])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _prompt_keys(prompts: Sequence[str], groups: Sequence[Any]) -> List[str]:
+    seen: Dict[tuple, int] = {}
+    keys = []
+    for group, prompt in zip(groups, prompts):
+        occurrence = seen.get((str(group), prompt), 0)
+        seen[(str(group), prompt)] = occurrence + 1
+        keys.append(prompt_key(group, prompt, occurrence))
+    return keys
+
+
+def load_checkpoint(checkpoint_file: str) -> Dict[str, Dict[str, Any]]:
+    """Rows of a JSONL checkpoint keyed by ``prompt_key``.
+
+    A partially written last line (e.g. from a crash mid-write) is cut off
+    so that appending resumes on a clean line.
+    """
+    if not os.path.exists(checkpoint_file):
+        return {}
+    with open(checkpoint_file, "rb+") as f:
+        content = f.read()
+        complete = content.rfind(b"\n") + 1
+        if complete < len(content):
+            f.truncate(complete)
+    rows = {}
+    for line in content[:complete].decode("utf-8").splitlines():
+        if line.strip():
+            row = json.loads(line)
+            rows[row["prompt_key"]] = row
+    return rows
+
+
+def _json_default(value: Any) -> Any:
+    # NumPy scalars from the planner's metrics.
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+def _setup_planner(
+    model: str,
+    planner_params: Optional[Dict[str, Any]],
+    backend: Optional[Any],
+    cache_path: Optional[str],
+    cache_max_entries: Optional[int],
+    cache_mode: str,
+) -> tuple:
+    """Planner factory, item factory, ``OpenAIPlanner.run`` parameters and the response cache (or None)."""
+    OpenAIBackend, OpenAIItem, OpenAIPlanner = _load_toolkit()
+    planner_params = planner_params or {}
+    backend = backend if backend is not None else OpenAIBackend(model=model)
+    cache = None
+    if cache_path:
+        from response_cache import CachedBackend, ResponseCache
+
+        cache = ResponseCache(cache_path, max_entries=cache_max_entries)
+        backend = CachedBackend(backend, cache, mode=cache_mode)
+
+    def make_planner():
+        return OpenAIPlanner(
+            backend,
+            temperature=planner_params.get("temperature", 0.3),
+        )
+
+    def make_item(prompt):
+        return OpenAIItem(
+            prompt=prompt,
+            n_samples=planner_params.get("n_samples", 5),
+            m=planner_params.get("m", 6),
+            skeleton_policy=planner_params.get("skeleton_policy", "auto"),
+        )
+
+    run_params = dict(
+        h_star=planner_params.get("h_star", 0.05),
+        isr_threshold=planner_params.get("isr_threshold", 1.0),
+        margin_extra_bits=planner_params.get("margin_extra_bits", 0.2),
+        B_clip=planner_params.get("B_clip", 12.0),
+        clip_mode=planner_params.get("clip_mode", "one-sided"),
+    )
+    return make_planner, make_item, run_params, cache
+
+
+def iter_hallucination_metrics(
+    prompts: Sequence[str],
+    groups: Sequence[str],
+    model: str = "gpt-4o-mini",
+    planner_params: Optional[Dict[str, Any]] = None,
+    checkpoint_file: Optional[str] = None,
+    resume: bool = False,
+    max_concurrency: int = 1,
+    requests_per_second: Optional[float] = None,
+    max_retries: int = 0,
+    retry_backoff: float = 1.0,
+    backend: Optional[Any] = None,
+    cache_path: Optional[str] = None,
+    cache_max_entries: Optional[int] = None,
+    cache_mode: str = "use",
+) -> Iterator[Dict[str, Any]]:
+    """Yield one metrics row per prompt as soon as it is evaluated.
+
+    Rows have the columns of ``hallucination_fairness_analysis`` plus
+    ``prompt_key``, a stable hash of the group, prompt and occurrence, and
+    arrive in completion order. Items are created lazily and at most
+    ``2 * max_concurrency`` are in flight, so memory stays flat however long
+    the suite is.
+
+    Parameters
+    ----------
+    checkpoint_file: Optional[str]
+        JSONL file each row is appended (and flushed) to as it arrives.
+    resume: bool
+        Keep the rows already in ``checkpoint_file`` and only evaluate the
+        prompts whose ``prompt_key`` is missing. Resumed rows are not yielded.
+
+    The remaining parameters are those of ``hallucination_fairness_analysis``.
+    The generator's return value is the cache statistics (or None).
+    """
+    if len(prompts) != len(groups):
+        raise ValueError("prompts and groups must have the same length")
+    if max_concurrency < 1:
+        raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+    if resume and not checkpoint_file:
+        raise ValueError("resume needs a checkpoint_file")
+
+    keys = _prompt_keys(prompts, groups)
+    done = set(load_checkpoint(checkpoint_file)) if resume else set()
+    make_planner, make_item, run_params, cache = _setup_planner(
+        model, planner_params, backend, cache_path, cache_max_entries, cache_mode
+    )
+    pending = ((i, make_item(prompt)) for i, prompt in enumerate(prompts) if keys[i] not in done)
+    checkpoint = open(checkpoint_file, "a" if resume else "w") if checkpoint_file else None
+    try:
+        for i, metric in _evaluate_items(
+            pending,
+            make_planner,
+            run_params,
+            max_concurrency,
+            TokenBucket(requests_per_second) if requests_per_second else None,
+            max_retries,
+            retry_backoff,
+        ):
+            row = {"prompt_key": keys[i], **_metrics_row(groups[i], prompts[i], metric)}
+            if checkpoint is not None:
+                checkpoint.write(json.dumps(row, default=_json_default) + "\n")
+                checkpoint.flush()
+            yield row
+        return cache.stats() if cache is not None else None
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        if cache is not None:
+            cache.close()
+
 
 def hallucination_fairness_analysis(
     prompts: Sequence[str],
@@ -21,6 +296,16 @@ def hallucination_fairness_analysis(
     output_file: Optional[str] = None,
     model: str = "gpt-4o-mini",
     planner_params: Optional[Dict[str, Any]] = None,
+    max_concurrency: int = 1,
+    requests_per_second: Optional[float] = None,
+    max_retries: int = 0,
+    retry_backoff: float = 1.0,
+    backend: Optional[Any] = None,
+    cache_path: Optional[str] = None,
+    cache_max_entries: Optional[int] = None,
+    cache_mode: str = "use",
+    checkpoint_file: Optional[str] = None,
+    resume: bool = False,
 ) -> pd.DataFrame:
     """Run HallBayes hallucination metrics on prompts grouped by attribute.
 
@@ -38,16 +323,93 @@ def hallucination_fairness_analysis(
         Additional parameters forwarded to ``OpenAIPlanner.run`` and
         ``OpenAIItem``. Common options include ``n_samples``, ``m``,
         ``h_star`` and others described in the HallBayes documentation.
+    max_concurrency: int
+        Number of prompts evaluated at once. With the defaults (1, no rate
+        limit, no retries, no checkpoint) all items go to a single
+        ``OpenAIPlanner.run`` call; otherwise each prompt is its own call,
+        in a thread pool when ``max_concurrency > 1``.
+    requests_per_second: Optional[float]
+        Shared token-bucket limit on planner calls (retries included).
+    max_retries: int
+        Retries per prompt on transient errors (rate limits, timeouts,
+        5xx responses), with full-jitter exponential backoff.
+    retry_backoff: float
+        Base backoff delay in seconds.
+    backend: Optional[Any]
+        Backend handed to ``OpenAIPlanner`` instead of
+        ``OpenAIBackend(model=model)``, e.g. a fake for offline tests.
+    cache_path: Optional[str]
+        SQLite file caching backend responses (see ``response_cache``), so
+        re-runs that only change decision-time parameters make no API calls.
+    cache_max_entries: Optional[int]
+        Size cap of the cache; least recently used responses are evicted.
+    cache_mode: str
+        ``"use"``, ``"refresh"`` (re-query and overwrite) or ``"off"``.
+    checkpoint_file: Optional[str]
+        JSONL file each prompt's row is appended to as soon as it completes.
+    resume: bool
+        Reuse the rows already in ``checkpoint_file`` and only evaluate the
+        remaining prompts.
 
     Returns
     -------
     pd.DataFrame
         DataFrame with one row per prompt containing decision and
-        hallucination risk metrics such as ``roh_bound`` and ``isr``.
+        hallucination risk metrics such as ``roh_bound`` and ``isr``,
+        in the order of ``prompts``. With a cache, its statistics are in
+        ``df.attrs["cache_stats"]``.
     """
-    if len(prompts) != len(groups):
-        raise ValueError("prompts and groups must have the same length")
+    options = dict(
+        model=model,
+        planner_params=planner_params,
+        backend=backend,
+        cache_path=cache_path,
+        cache_max_entries=cache_max_entries,
+        cache_mode=cache_mode,
+    )
+    batch = checkpoint_file is None and max_concurrency == 1 and requests_per_second is None and max_retries == 0
+    if batch:
+        if len(prompts) != len(groups):
+            raise ValueError("prompts and groups must have the same length")
+        make_planner, make_item, run_params, cache = _setup_planner(**options)
+        try:
+            metrics = make_planner().run([make_item(prompt) for prompt in prompts], **run_params)
+            cache_stats = cache.stats() if cache is not None else None
+        finally:
+            if cache is not None:
+                cache.close()
+        rows = [_metrics_row(grp, prompt, m) for grp, prompt, m in zip(groups, prompts, metrics)]
+    else:
+        by_key = load_checkpoint(checkpoint_file) if resume and checkpoint_file else {}
+        stream = iter_hallucination_metrics(
+            prompts,
+            groups,
+            checkpoint_file=checkpoint_file,
+            resume=resume,
+            max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second,
+            max_retries=max_retries,
+            retry_backoff=retry_backoff,
+            **options,
+        )
+        while True:
+            try:
+                row = next(stream)
+            except StopIteration as stop:
+                cache_stats = stop.value
+                break
+            by_key[row["prompt_key"]] = row
+        rows = [{k: v for k, v in by_key[key].items() if k != "prompt_key"} for key in _prompt_keys(prompts, groups)]
+
+    df = pd.DataFrame(rows)
+    if cache_stats is not None:
+        df.attrs["cache_stats"] = cache_stats
+    if output_file:
+        df.to_csv(output_file, index=False)
+    return df
+
 
+def _load_toolkit():
     try:
         from hallbayes.scripts.hallucination_toolkit import (
             OpenAIBackend,
@@ -59,54 +421,100 @@ def hallucination_fairness_analysis(
             "hallbayes is required. Install it from"
             " https://github.com/leochlon/hallbayes"  # pragma: no cover
         ) from exc
+    return OpenAIBackend, OpenAIItem, OpenAIPlanner
 
-    planner_params = planner_params or {}
 
-    backend = OpenAIBackend(model=model)
-    planner = OpenAIPlanner(
-        backend,
-        temperature=planner_params.get("temperature", 0.3),
-    )
+def _metrics_row(group: Any, prompt: str, m: Any) -> Dict[str, Any]:
+    return {
+        "group": group,
+        "prompt": prompt,
+        "decision_answer": int(getattr(m, "decision_answer", False)),
+        "roh_bound": getattr(m, "roh_bound", None),
+        "delta_bar": getattr(m, "delta_bar", None),
+        "b2t": getattr(m, "b2t", None),
+        "isr": getattr(m, "isr", None),
+        "q_lo": getattr(m, "q_lo", None),
+        "q_bar": getattr(m, "q_bar", None),
+    }
 
-    items = [
-        OpenAIItem(
-            prompt=prompt,
-            n_samples=planner_params.get("n_samples", 5),
-            m=planner_params.get("m", 6),
-            skeleton_policy=planner_params.get("skeleton_policy", "auto"),
-        )
-        for prompt in prompts
-    ]
 
-    metrics = planner.run(
-        items,
-        h_star=planner_params.get("h_star", 0.05),
-        isr_threshold=planner_params.get("isr_threshold", 1.0),
-        margin_extra_bits=planner_params.get("margin_extra_bits", 0.2),
-        B_clip=planner_params.get("B_clip", 12.0),
-        clip_mode=planner_params.get("clip_mode", "one-sided"),
-    )
+def _evaluate_items(
+    items: Iterable[tuple],
+    make_planner: Callable[[], Any],
+    run_params: Dict[str, Any],
+    max_concurrency: int,
+    rate_limiter: Optional[TokenBucket],
+    max_retries: int,
+    retry_backoff: float,
+) -> Iterator[tuple]:
+    """Yield ``(position, metric)`` for ``(position, item)`` pairs as each planner call finishes."""
+    local = threading.local()
 
-    rows = []
-    for grp, prompt, m in zip(groups, prompts, metrics):
-        rows.append(
-            {
-                "group": grp,
-                "prompt": prompt,
-                "decision_answer": int(getattr(m, "decision_answer", False)),
-                "roh_bound": getattr(m, "roh_bound", None),
-                "delta_bar": getattr(m, "delta_bar", None),
-                "b2t": getattr(m, "b2t", None),
-                "isr": getattr(m, "isr", None),
-                "q_lo": getattr(m, "q_lo", None),
-                "q_bar": getattr(m, "q_bar", None),
-            }
+    def evaluate(item):
+        # One planner per worker thread; the backend is shared.
+        if not hasattr(local, "planner"):
+            local.planner = make_planner()
+        (metric,) = call_with_retry(
+            lambda: local.planner.run([item], **run_params),
+            max_retries=max_retries,
+            backoff=retry_backoff,
+            rate_limiter=rate_limiter,
         )
+        return metric
+
+    if max_concurrency == 1:
+        for position, item in items:
+            yield position, evaluate(item)
+        return
+
+    items = iter(items)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    in_flight: Dict[Any, int] = {}
+    try:
+        while True:
+            # Keep a bounded window of submitted items so a long suite is never materialized.
+            for position, item in itertools.islice(items, 2 * max_concurrency - len(in_flight)):
+                in_flight[executor.submit(evaluate, item)] = position
+            if not in_flight:
+                return
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            # Yield every successful result before raising a failure, so it still gets checkpointed.
+            failed = [future for future in finished if future.exception() is not None]
+            for future in finished:
+                position = in_flight.pop(future)
+                if future not in failed:
+                    yield position, future.result()
+            if failed:
+                raise failed[0].exception()
+    finally:
+        # On a failure, pending prompts are dropped rather than run.
+        executor.shutdown(wait=True, cancel_futures=True)
 
-    df = pd.DataFrame(rows)
-    if output_file:
-        df.to_csv(output_file, index=False)
-    return df
+
+def deduplicated_analysis(prompts: Iterable[str], **analysis_kwargs: Any) -> Tuple[np.ndarray, pd.DataFrame]:
+    """Evaluate each distinct prompt once.
+
+    Parameters
+    ----------
+    prompts: Iterable[str]
+        Prompts, consumed lazily; only the distinct ones are kept.
+    **analysis_kwargs:
+        Options of ``hallucination_fairness_analysis`` (``model``,
+        ``planner_params``, ``max_concurrency``, ``cache_path``,
+        ``checkpoint_file``, ...). They apply to the distinct prompts.
+
+    Returns
+    -------
+    Tuple[np.ndarray, pd.DataFrame]
+        For each input prompt, the position of its row in the metrics, and
+        the metrics of the distinct prompts in first-seen order, all in
+        group ``SHARED_GROUP``.
+    """
+    unique_index: Dict[str, int] = {}
+    positions = np.fromiter((unique_index.setdefault(prompt, len(unique_index)) for prompt in prompts), dtype=np.int64)
+    unique_prompts = list(unique_index)
+    evaluated = hallucination_fairness_analysis(unique_prompts, [SHARED_GROUP] * len(unique_prompts), **analysis_kwargs)
+    return positions, evaluated
 
 
 def hallucination_fairness_from_csv(
@@ -116,6 +524,7 @@ def hallucination_fairness_from_csv(
     output_file: Optional[str] = None,
     model: str = "gpt-4o-mini",
     planner_params: Optional[Dict[str, Any]] = None,
+    **kwargs: Any,
 ) -> pd.DataFrame:
     """Load prompts and groups from a CSV and run hallucination analysis.
 
@@ -133,11 +542,17 @@ def hallucination_fairness_from_csv(
         OpenAI model name to use with HallBayes backend.
     planner_params: Optional[Dict[str, Any]]
         Additional parameters forwarded to ``hallucination_fairness_analysis``.
+    **kwargs:
+        Execution options of ``hallucination_fairness_analysis`` such as
+        ``max_concurrency``, ``requests_per_second``, ``max_retries`` and
+        the ``cache_*`` options.
 
     Returns
     -------
     pd.DataFrame
         DataFrame with hallucination metrics for each prompt in ``input_file``.
+        Identical prompts are evaluated once and share their metrics;
+        ``df.attrs["unique_prompts"]`` holds the number evaluated.
     """
     df = pd.read_csv(input_file)
     if group_col not in df.columns:
@@ -145,12 +560,15 @@ def hallucination_fairness_from_csv(
     if prompt_col not in df.columns:
         raise ValueError(f"Column '{prompt_col}' not found in {input_file}")
 
-    prompts = df[prompt_col].tolist()
-    groups = df[group_col].tolist()
-    return hallucination_fairness_analysis(
-        prompts,
-        groups,
-        output_file=output_file,
-        model=model,
-        planner_params=planner_params,
-    )
+    missing = df.index[df[prompt_col].isna()].tolist()
+    if missing:
+        raise ValueError(f"Column '{prompt_col}' of {input_file} has no prompt in rows {missing}")
+
+    positions, evaluated = deduplicated_analysis(df[prompt_col], model=model, planner_params=planner_params, **kwargs)
+    metrics = evaluated.reindex(columns=METRIC_COLUMNS).iloc[positions].reset_index(drop=True)
+    result = pd.concat([pd.DataFrame({"group": df[group_col].to_numpy(), "prompt": df[prompt_col].to_numpy()}), metrics], axis=1)
+    result.attrs.update(evaluated.attrs)
+    result.attrs["unique_prompts"] = len(evaluated)
+    if output_file:
+        result.to_csv(output_file, index=False)
+    return result
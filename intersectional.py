@@ -0,0 +1,171 @@
+# intersectional.py
+"""Intersectional subgroup metrics over the full lattice of protected attributes.
+
+Rather than one config entry (and one full check) per combination of
+protected attribute values, the rows are reduced once to counts per cell of
+(attribute values..., label, prediction). Every subgroup of the requested
+lattice -- each attribute alone, each pair, ..., the full intersection, like
+SQL ``CUBE`` (or only the prefixes, like ``ROLLUP``) -- is then aggregated
+from those cell counts and scored in one vectorized call to the native metrics
+engine. Each subgroup is compared with the rest of the population (the
+subgroup plays the unprivileged role and its complement the privileged role),
+and cells smaller than ``min_support`` rows are pruned.
+"""
+import itertools
+import numpy as np
+import pandas as pd
+import data_io
+import native_metrics
+
+LABEL_LEVEL = '__label__'
+PREDICTION_LEVEL = '__prediction__'
+MODES = ('cube', 'rollup')
+ALL_ROWS = '(all)'
+
+SUBGROUP_RATE_METRICS = {
+    'Base Rate': 'base_rate',
+    'Selection Rate': 'selection_rate',
+    'True Positive Rate': 'TPR',
+    'False Positive Rate': 'FPR',
+    'Accuracy': 'ACC',
+}
+# Metrics comparing the subgroup with the rest of the population, with their
+# position in native_metrics.bias_scores / fairness_scores.
+BIAS_COMPARISONS = {'Disparate Impact': 0, 'Statistical Parity Difference': 1}
+FAIRNESS_COMPARISONS = {
+    'Demographic Parity Difference': 2,
+    'Equal Opportunity Difference': 3,
+    'Equalized Odds Difference': 4,
+    'False Positive Rate Difference': 5,
+    'False Negative Rate Difference': 6,
+}
+
+
+def cell_counts(df: pd.DataFrame, protected_attribute_names: list[str], label_name: str, favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, prediction_name: str = None) -> pd.Series:
+    """
+    Row counts per cell of (protected attribute values..., label code, prediction code).
+
+    Counts from different chunks of the same input can be combined with
+    ``a.add(b, fill_value=0)``. Missing attribute values form their own cell.
+    """
+    label_codes = native_metrics.encode_binary_labels(df[label_name].to_numpy(), label_name, favorable_label_value, unfavorable_label_value)
+    prediction_codes = label_codes if prediction_name is None else native_metrics.encode_binary_labels(
+        df[prediction_name].to_numpy(), prediction_name, favorable_label_value, unfavorable_label_value)
+    cells = df[list(protected_attribute_names)].assign(**{LABEL_LEVEL: label_codes, PREDICTION_LEVEL: prediction_codes})
+    return cells.groupby(list(cells.columns), dropna=False, observed=True, sort=False).size()
+
+
+def _subsets(protected_attribute_names: list[str], mode: str) -> list:
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {list(MODES)}, got '{mode}'")
+    names = list(protected_attribute_names)
+    if mode == 'rollup':
+        return [tuple(names[:level]) for level in range(len(names) + 1)]
+    return [subset for level in range(len(names) + 1) for subset in itertools.combinations(names, level)]
+
+
+def _confusion_by_subgroup(cells: pd.Series, subset: tuple) -> tuple:
+    """(subgroup index frame, (n, 2, 2) counts) for the subgroups spanned by ``subset``."""
+    if not subset:
+        table = cells.groupby(level=[LABEL_LEVEL, PREDICTION_LEVEL]).sum().to_frame().T
+        keys = pd.DataFrame(index=[0])
+    else:
+        table = cells.groupby(level=list(subset) + [LABEL_LEVEL, PREDICTION_LEVEL], dropna=False, observed=True).sum()
+        table = table.unstack([LABEL_LEVEL, PREDICTION_LEVEL], fill_value=0)
+        keys = table.index.to_frame(index=False)
+    full_columns = pd.MultiIndex.from_product([[0, 1], [0, 1]], names=[LABEL_LEVEL, PREDICTION_LEVEL])
+    table = table.reindex(columns=full_columns, fill_value=0)
+    return keys, table.to_numpy(dtype=np.float64).reshape(-1, 2, 2)
+
+
+def subgroup_lattice(cells: pd.Series, protected_attribute_names: list[str], min_support: int = 1, mode: str = 'cube') -> pd.DataFrame:
+    """
+    Long-format metrics for every subgroup in the lattice, computed from ``cell_counts`` output.
+
+    Returns one row per (subgroup, metric) with a column per protected
+    attribute (None where the attribute is rolled up), ``Subgroup`` (a
+    readable label), ``Level`` (number of attributes fixed), ``Support``
+    (rows in the subgroup), ``Metric`` and ``Score``.
+    """
+    names = list(protected_attribute_names)
+    _, total = _confusion_by_subgroup(cells, ())
+    frames = []
+    for subset in _subsets(names, mode):
+        keys, counts = _confusion_by_subgroup(cells, subset)
+        support = counts.sum(axis=(1, 2))
+        keep = (support >= min_support) & (support > 0)
+        keys, counts, support = keys[keep].reset_index(drop=True), counts[keep], support[keep]
+        if not len(counts):
+            continue
+
+        # Group code 1 (unprivileged) is the subgroup, code 2 (privileged) the rest of the rows.
+        tensor = np.zeros((len(counts), native_metrics.N_GROUP_CODES, 2, 2))
+        tensor[:, native_metrics.UNPRIVILEGED] = counts
+        tensor[:, native_metrics.PRIVILEGED] = total - counts
+        rates = native_metrics.group_rates(tensor, privileged=False)
+        scores = {metric: rates[key] for metric, key in SUBGROUP_RATE_METRICS.items()}
+        if subset:
+            bias, fairness = native_metrics.bias_scores(tensor), native_metrics.fairness_scores(tensor)
+            scores.update({metric: bias[i] for metric, i in BIAS_COMPARISONS.items()})
+            scores.update({metric: fairness[i] for metric, i in FAIRNESS_COMPARISONS.items()})
+
+        wide = pd.DataFrame({name: keys[name] if name in subset else None for name in names}, index=keys.index)
+        wide['Subgroup'] = [' & '.join(f"{name}={row[name]}" for name in subset) or ALL_ROWS for _, row in keys.iterrows()] if subset else ALL_ROWS
+        wide['Level'] = len(subset)
+        wide['Support'] = support.astype(np.int64)
+        wide = wide.assign(**scores)
+        long = wide.melt(id_vars=names + ['Subgroup', 'Level', 'Support'], var_name='Metric', value_name='Score', ignore_index=False)
+        frames.append(long.sort_index(kind='stable')) # Keep each subgroup's metrics together.
+
+    columns = names + ['Subgroup', 'Level', 'Support', 'Metric', 'Score']
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def intersectional_check(input_file: str, output_file: str, label_name: str, protected_attribute_names: list[str], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, prediction_name: str = None, min_support: int = 30, mode: str = 'cube', chunksize: int = None) -> None:
+    """
+    Computes metrics for every intersectional subgroup of the protected attributes and outputs a long-format table.
+
+    Parameters:
+    input_file (str): Path to the input file (CSV, Parquet, Feather or Arrow IPC).
+    output_file (str): Path to the output file where the long-format table will be saved.
+    label_name (str): The name of the label column in the input dataset.
+    protected_attribute_names (list[str]): Protected attribute columns spanning the lattice.
+    favorable_label_value (float, optional): Value representing the favorable outcome. Defaults to 1.0.
+    unfavorable_label_value (float, optional): Value representing the unfavorable outcome. Defaults to 0.0.
+    prediction_name (str, optional): Column with predicted labels. Defaults to None (the labels are used).
+    min_support (int, optional): Subgroups with fewer rows are omitted. Defaults to 30.
+    mode (str, optional): 'cube' for every combination of attributes, 'rollup' for prefixes only. Defaults to 'cube'.
+    chunksize (int, optional): If given, count cells chunk by chunk with bounded memory. Defaults to None.
+
+    Returns:
+    None
+    """
+    cells = count_cells(input_file, label_name, protected_attribute_names, favorable_label_value, unfavorable_label_value, prediction_name, chunksize)
+    data_io.write_table(subgroup_lattice(cells, protected_attribute_names, min_support, mode), output_file)
+
+
+def count_cells(input_file: str, label_name: str, protected_attribute_names: list[str], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, prediction_name: str = None, chunksize: int = None) -> pd.Series:
+    """``cell_counts`` over a whole input file, read in one piece or ``chunksize`` rows at a time."""
+    from analysis_session import validate_label_column, validate_protected_attributes
+
+    columns = data_io.read_columns(input_file)
+    validate_label_column(columns, label_name)
+    validate_protected_attributes(columns, protected_attribute_names)
+    needed = list(protected_attribute_names) + [label_name] + ([prediction_name] if prediction_name else [])
+    chunks = data_io.iter_chunks(input_file, needed, chunksize) if chunksize else [data_io.read_table(input_file, needed)]
+    cells = None
+    for chunk in chunks:
+        counts = cell_counts(chunk, protected_attribute_names, label_name, favorable_label_value, unfavorable_label_value, prediction_name)
+        cells = counts if cells is None else cells.add(counts, fill_value=0)
+    validate_cell_labels(cells, label_name, favorable_label_value, unfavorable_label_value)
+    return cells
+
+def validate_cell_labels(cells: pd.Series, label_name: str, favorable_label_value: float, unfavorable_label_value: float) -> None:
+    """Raise ValueError if the favorable or unfavorable label never occurs in ``cells``."""
+    from analysis_session import validate_label_values
+
+    label_totals = cells.groupby(level=LABEL_LEVEL).sum()
+    present = [value for code, value in [(0, unfavorable_label_value), (1, favorable_label_value)] if label_totals.get(code, 0) > 0]
+    validate_label_values(present, label_name, favorable_label_value, unfavorable_label_value)
@@ -1,8 +1,17 @@
 # mitigation_techniques.py
 import pandas as pd
+import data_io
+import profiling
 from aif360.datasets import BinaryLabelDataset
 from aif360.algorithms.preprocessing import Reweighing
 
+def _write_output(df: pd.DataFrame, output_file: str) -> None:
+    with profiling.stage('write') as record:
+        data_io.write_table(df, output_file)
+        record['rows'] = len(df)
+
+
+@profiling.profiled('reweighing')
 def apply_reweighing(
     input_file: str,
     output_file: str,
@@ -12,63 +21,127 @@ def apply_reweighing(
     unprivileged_groups: list[dict],
     favorable_label_value: float = 1.0,
     unfavorable_label_value: float = 0.0,
+    backend: str = None,
+    chunksize: int = None,
+    weights_file: str = None,
 ) -> None:
-    input_df = pd.read_csv(input_file).dropna()
+    if backend not in (None, 'aif360', 'native'):
+        raise ValueError(f"Unknown backend '{backend}'. Use 'aif360' or 'native'.")
+    if backend == 'aif360' and (chunksize or weights_file):
+        raise ValueError("chunksize and weights_file need backend='native'; the AIF360 backend reads the whole file.")
+    if backend == 'native' or chunksize or weights_file:
+        # Two chunked passes over the file instead of several in-memory copies of it.
+        import native_mitigation
+        native_mitigation.reweigh_file(
+            input_file, output_file, label_name, protected_attribute_names,
+            privileged_groups, unprivileged_groups, favorable_label_value, unfavorable_label_value,
+            chunksize=chunksize or native_mitigation.DEFAULT_CHUNKSIZE, weights_file=weights_file,
+        )
+        print(f"Reweighing applied. Output saved to {output_file or weights_file}")
+        return
+
+    with profiling.stage('read', file=str(input_file)) as record:
+        input_df = data_io.read_table(input_file).dropna()
+        record['rows'] = len(input_df)
     if label_name not in input_df.columns:
         raise ValueError(f"Label name '{label_name}' not found.")
     for attr in protected_attribute_names:
         if attr not in input_df.columns:
             raise ValueError(f"Protected attribute '{attr}' not found.")
 
-    dataset = BinaryLabelDataset(
-        df=input_df,
-        label_names=[label_name],
-        protected_attribute_names=protected_attribute_names,
-        favorable_label=favorable_label_value,
-        unfavorable_label=unfavorable_label_value,
-    )
+    with profiling.stage('dataset'):
+        dataset = BinaryLabelDataset(
+            df=input_df,
+            label_names=[label_name],
+            protected_attribute_names=protected_attribute_names,
+            favorable_label=favorable_label_value,
+            unfavorable_label=unfavorable_label_value,
+        )
     RW = Reweighing(
         unprivileged_groups=unprivileged_groups,
         privileged_groups=privileged_groups,
     )
-    dataset_transformed = RW.fit_transform(dataset)
+    with profiling.stage('transform'):
+        dataset_transformed = RW.fit_transform(dataset)
     output_df = input_df.copy()
     output_df["instance_weights"] = dataset_transformed.instance_weights
-    output_df.to_csv(output_file, index=False)
+    _write_output(output_df, output_file)
     print(f"Reweighing applied. Output saved to {output_file}")
 
 
 from aif360.algorithms.preprocessing import DisparateImpactRemover
 
+@profiling.profiled('disparate_impact_remover')
 def apply_disparate_impact_remover(input_file: str, output_file: str,
                                      protected_attribute_names: list[str], # For BinaryLabelDataset
                                      sensitive_attribute_name: str,    # For DisparateImpactRemover
                                      label_name_for_dataset_init: str,
                                      favorable_label_for_dataset_init: float = 1.0,
                                      unfavorable_label_for_dataset_init: float = 0.0,
-                                     repair_level: float = 1.0) -> None:
+                                     repair_level: float = 1.0,
+                                     backend: str = None,
+                                     reference_file: str = None,
+                                     n_jobs: int = 1,
+                                     chunksize: int = None,
+                                     sketch_k: int = 200) -> None:
 
     if sensitive_attribute_name not in protected_attribute_names:
         raise ValueError(f"Sensitive attribute '{sensitive_attribute_name}' must be in protected_attribute_names: {protected_attribute_names}")
+    if backend not in (None, 'aif360', 'native'):
+        raise ValueError(f"Unknown backend '{backend}'. Use 'aif360' or 'native'.")
+    if backend == 'aif360' and (chunksize or reference_file):
+        raise ValueError("chunksize and reference_file need backend='native'; the AIF360 backend fits on the input itself.")
+    if chunksize:
+        # Out of core: quantile sketches in a first pass, repaired chunks written in a second.
+        import native_mitigation
+        native_mitigation.repair_file(input_file, output_file, sensitive_attribute_name, label_name_for_dataset_init,
+                                      repair_level, chunksize=chunksize, k=sketch_k, n_jobs=n_jobs,
+                                      reference_file=reference_file)
+        print(f"Disparate Impact Remover applied. Output saved to {output_file}")
+        return
+    if backend == 'native' or reference_file:
+        # Vectorized repair of every numeric feature; the label and non-numeric columns pass through.
+        from native_mitigation import DisparateImpactRepairer
+        with profiling.stage('read', file=str(input_file)) as record:
+            input_df = data_io.read_table(input_file).dropna(subset=[sensitive_attribute_name])
+            reference_df = data_io.read_table(reference_file).dropna(subset=[sensitive_attribute_name]) if reference_file else input_df
+            record['rows'] = len(input_df)
+        features = [name for name in reference_df.select_dtypes('number').columns
+                    if name not in (sensitive_attribute_name, label_name_for_dataset_init)]
+        with profiling.stage('fit') as record:
+            repairer = DisparateImpactRepairer(sensitive_attribute_name, repair_level, features, n_jobs).fit(reference_df)
+            record['rows'] = len(reference_df)
+        with profiling.stage('transform') as record:
+            repaired_df = repairer.transform(input_df)
+            record['rows'] = len(repaired_df)
+        _write_output(repaired_df, output_file)
+        print(f"Disparate Impact Remover applied. Output saved to {output_file}")
+        return
 
-    input_df = pd.read_csv(input_file).dropna()
+    with profiling.stage('read', file=str(input_file)) as record:
+        # AIF360 datasets cannot hold missing values, so rows with any are dropped.
+        # The native and chunked paths only drop rows missing the sensitive attribute.
+        input_df = data_io.read_table(input_file).dropna()
+        record['rows'] = len(input_df)
 
     # DisparateImpactRemover needs a BinaryLabelDataset
     # The label for dataset init is used just for the AIF360 dataset structure,
     # DisparateImpactRemover itself is unsupervised w.r.t labels.
-    dataset_orig = BinaryLabelDataset(
-        df=input_df.copy(),
-        label_names=[label_name_for_dataset_init],
-        protected_attribute_names=protected_attribute_names, # All PAs for dataset structure
-        favorable_label=favorable_label_for_dataset_init,
-        unfavorable_label=unfavorable_label_for_dataset_init
-    )
+    with profiling.stage('dataset'):
+        dataset_orig = BinaryLabelDataset(
+            df=input_df.copy(),
+            label_names=[label_name_for_dataset_init],
+            protected_attribute_names=protected_attribute_names, # All PAs for dataset structure
+            favorable_label=favorable_label_for_dataset_init,
+            unfavorable_label=unfavorable_label_for_dataset_init
+        )
 
     # Initialize DisparateImpactRemover
     DIR = DisparateImpactRemover(repair_level=repair_level,
                                    sensitive_attribute=sensitive_attribute_name) # Specific PA for repair
 
-    dataset_repaired = DIR.fit_transform(dataset_orig)
+    with profiling.stage('transform'):
+        dataset_repaired = DIR.fit_transform(dataset_orig)
 
     # Convert repaired dataset back to DataFrame
     # This creates a DataFrame from the features of the repaired dataset,
@@ -77,5 +150,5 @@ def apply_disparate_impact_remover(input_file: str, output_file: str,
     df_repaired = dataset_repaired.convert_to_dataframe()[0]
     # convert_to_dataframe returns a tuple (df, label_maps, protected_attribute_maps)
 
-    df_repaired.to_csv(output_file, index=False)
+    _write_output(df_repaired, output_file)
     print(f"Disparate Impact Remover applied. Output saved to {output_file}")
@@ -0,0 +1,152 @@
+# multiclass_fairness.py
+"""One-vs-rest fairness metrics for multi-class labels from one contingency tensor.
+
+Binarizing the data once per class and running ``fairness_check`` on each
+binarized copy builds one AIF360 dataset per class. Every one-vs-rest metric,
+however, only needs per-group counts of (true class, predicted class) pairs, so
+this module counts the rows once into a ``(4, K, K)`` tensor indexed by group
+code (as in ``native_metrics``), true class and predicted class. For class
+``k`` the one-vs-rest confusion counts of group ``g`` are
+
+* TP = C[g, k, k], FN = row k minus TP, FP = column k minus TP, TN = the rest,
+
+which yields a ``(K, 4, 2, 2)`` tensor that the native metric functions score
+for all classes in one vectorized call. Per-class tables match what
+``fairness_check`` reports on the binarized data (class ``k`` favorable, every
+other class unfavorable).
+"""
+import warnings
+import numpy as np
+import pandas as pd
+import data_io
+import native_metrics
+from native_metrics import FAIRNESS_METRIC_NAMES, N_GROUP_CODES
+
+GROUP_LEVEL = '__group__'
+AGGREGATES = {'macro': np.nanmean, 'min': np.nanmin, 'max': np.nanmax}
+MULTICLASS_METRIC_NAMES = ['Max Demographic Parity Difference', 'Demographic Parity Total Variation']
+
+
+def cell_counts(df: pd.DataFrame, label_name: str, privileged_groups: list[dict], unprivileged_groups: list[dict], prediction_name: str = None) -> pd.Series:
+    """
+    Row counts per (group code, true class, predicted class).
+
+    Counts from different chunks can be combined with ``a.add(b, fill_value=0)``.
+    Without ``prediction_name`` the labels act as predictions. Rows with a
+    missing label or prediction are skipped.
+    """
+    from analysis_session import compute_group_mask
+
+    group_codes = native_metrics.encode_groups(compute_group_mask(df, unprivileged_groups), compute_group_mask(df, privileged_groups))
+    predictions = df[label_name if prediction_name is None else prediction_name]
+    cells = pd.DataFrame({GROUP_LEVEL: group_codes, 'true': df[label_name].to_numpy(), 'pred': predictions.to_numpy()})
+    return cells.groupby([GROUP_LEVEL, 'true', 'pred'], observed=True, sort=False).size()
+
+
+def contingency_tensor(cells: pd.Series, classes: list = None) -> tuple:
+    """
+    ``(4, K, K)`` group x true class x predicted class counts from ``cell_counts`` output.
+
+    ``classes``, if given, must include every observed true and predicted
+    class, since each one-vs-rest "rest" is all the other classes; it fixes
+    their order and may add classes that never occur. Otherwise a ValueError
+    is raised.
+
+    Returns:
+    tuple: (list of the K classes, sorted unless given, counts tensor).
+    """
+    true_values = cells.index.get_level_values('true')
+    pred_values = cells.index.get_level_values('pred')
+    if classes is None:
+        classes = sorted(set(true_values) | set(pred_values))
+    index = pd.Index(classes)
+    true_codes, pred_codes = index.get_indexer(true_values), index.get_indexer(pred_values)
+    if (true_codes < 0).any() or (pred_codes < 0).any():
+        unknown = sorted(set(true_values[true_codes < 0]) | set(pred_values[pred_codes < 0]))
+        raise ValueError(f"Values {unknown} are not among the given classes: {list(classes)}. "
+                         "classes must list every class in the label and prediction columns.")
+    n_classes = len(classes)
+    group_codes = cells.index.get_level_values(GROUP_LEVEL).to_numpy()
+    flat = (group_codes * n_classes + true_codes) * n_classes + pred_codes
+    counts = np.bincount(flat, weights=cells.to_numpy(dtype=np.float64), minlength=N_GROUP_CODES * n_classes * n_classes)
+    return list(classes), counts.reshape(N_GROUP_CODES, n_classes, n_classes)
+
+
+def one_vs_rest_counts(counts: np.ndarray) -> np.ndarray:
+    """``(K, 4, 2, 2)`` one-vs-rest confusion counts (class k favorable) from a ``(4, K, K)`` tensor."""
+    tp = np.diagonal(counts, axis1=-2, axis2=-1)          # (4, K)
+    fn = counts.sum(axis=-1) - tp
+    fp = counts.sum(axis=-2) - tp
+    tn = counts.sum(axis=(-2, -1))[:, None] - tp - fn - fp
+    ovr = np.stack([np.stack([tn, fp], axis=-1), np.stack([fn, tp], axis=-1)], axis=-2)  # (4, K, 2, 2)
+    return np.moveaxis(ovr, 1, 0)
+
+
+def multiclass_fairness_table(counts: np.ndarray, classes: list) -> pd.DataFrame:
+    """
+    Long ``Class``/``Metric``/``Score`` table from a ``(4, K, K)`` tensor.
+
+    Rows per class hold the ``fairness_check`` metrics for that class versus
+    the rest; rows with ``Class`` 'macro', 'min' and 'max' aggregate each
+    metric across classes (ignoring undefined values); rows with ``Class``
+    'all' hold the multiclass demographic parity measures: the largest
+    absolute per-class selection-rate gap and the total variation distance
+    between the groups' predicted-class distributions.
+    """
+    ovr = one_vs_rest_counts(counts)
+    scores = np.stack(native_metrics.fairness_scores(ovr), axis=1)  # (K, metrics)
+    frames = [pd.DataFrame({'Class': np.repeat(classes, len(FAIRNESS_METRIC_NAMES)).tolist(),
+                            'Metric': FAIRNESS_METRIC_NAMES * len(classes),
+                            'Score': scores.ravel()})]
+    finite = np.where(np.isfinite(scores), scores, np.nan)
+    selection_gaps = np.abs(finite[:, FAIRNESS_METRIC_NAMES.index('Demographic Parity Difference')])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # all-nan metrics aggregate to nan
+        for name, aggregate in AGGREGATES.items():
+            frames.append(pd.DataFrame({'Class': name, 'Metric': FAIRNESS_METRIC_NAMES, 'Score': aggregate(finite, axis=0)}))
+        frames.append(pd.DataFrame({
+            'Class': 'all',
+            'Metric': MULTICLASS_METRIC_NAMES,
+            'Score': [np.nanmax(selection_gaps), 0.5 * selection_gaps.sum()],
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def multiclass_fairness_check(input_file: str, output_file: str, label_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], prediction_name: str = None, classes: list = None, chunksize: int = None) -> None:
+    """
+    Checks one-vs-rest fairness for every class of a multi-class label and outputs a long scoring table.
+
+    Parameters:
+    input_file (str): Path to the input file (CSV, Parquet, Feather or Arrow IPC).
+    output_file (str): Path to the output file where the ``Class``/``Metric``/``Score`` table will be saved.
+    label_name (str): The name of the multi-class label column.
+    protected_attribute_names (list[str]): A list of names of the protected attribute columns.
+    privileged_groups (list[dict]): A list of dictionaries representing privileged groups.
+    unprivileged_groups (list[dict]): A list of dictionaries representing unprivileged groups.
+    prediction_name (str, optional): Column with predicted classes. Defaults to None (the labels are used).
+    classes (list, optional): Every class of the label, in report order. It must include each class observed in
+                              the label and prediction columns (a ValueError is raised otherwise) and may add
+                              classes that never occur. Defaults to None (every observed class, sorted).
+    chunksize (int, optional): If given, count the input in chunks of this many rows. Defaults to None.
+
+    Returns:
+    None
+    """
+    from analysis_session import (validate_group_definitions, validate_label_column, validate_prediction_column,
+                                  validate_protected_attributes)
+
+    columns = data_io.read_columns(input_file)
+    validate_label_column(columns, label_name)
+    if prediction_name is not None:
+        validate_prediction_column(columns, prediction_name)
+    validate_protected_attributes(columns, protected_attribute_names)
+    validate_group_definitions(protected_attribute_names, privileged_groups, unprivileged_groups)
+
+    needed = list(protected_attribute_names) + [label_name] + ([prediction_name] if prediction_name else [])
+    chunks = data_io.iter_chunks(input_file, needed, chunksize) if chunksize else [data_io.read_table(input_file, needed)]
+    cells = None
+    for chunk in chunks:
+        counts = cell_counts(chunk, label_name, privileged_groups, unprivileged_groups, prediction_name)
+        cells = counts if cells is None else cells.add(counts, fill_value=0)
+    classes, counts = contingency_tensor(cells, classes)
+    data_io.write_table(multiclass_fairness_table(counts, classes), output_file)
@@ -0,0 +1,393 @@
+# native_metrics.py
+"""NumPy implementation of the bias and fairness metrics reported by this toolkit.
+
+Every reported metric derives from a handful of per-group confusion counts, so
+the native backend encodes each row as a (group, label, prediction) code and
+gets all counts from a single ``np.bincount`` call instead of building AIF360
+datasets. Counts are stored as a ``(4, 2, 2)`` tensor indexed by
+
+* group code: 0 = neither group, 1 = unprivileged, 2 = privileged, 3 = both
+  (group definitions are not required to be disjoint, exactly as in AIF360);
+* label code: 0 = unfavorable, 1 = favorable;
+* prediction code: 0 = unfavorable, 1 = favorable.
+
+The metric functions accept any number of leading batch dimensions, i.e.
+``(..., 4, 2, 2)``, and follow AIF360's definitions (including ``nan``/``inf``
+results when a group is empty) so the two backends can be used interchangeably.
+The batch dimension is also what makes bootstrap confidence intervals cheap:
+all replicates are scored as one ``(B, 4, 2, 2)`` array.
+"""
+import json
+import warnings
+import numpy as np
+import pandas as pd
+
+BACKENDS = ('aif360', 'native')
+
+BIAS_METRIC_NAMES = ['Disparate Impact', 'Statistical Parity Difference', 'Mean Difference']
+FAIRNESS_METRIC_NAMES = [
+    'Accuracy', 'Balanced Accuracy', 'Demographic Parity Difference',
+    'Equal Opportunity Difference', 'Equalized Odds Difference',
+    'False Positive Rate Difference', 'False Negative Rate Difference'
+]
+
+UNPRIVILEGED = 1
+PRIVILEGED = 2
+BOTH = UNPRIVILEGED + PRIVILEGED  # rows matching both group definitions
+N_GROUP_CODES = 4
+
+
+def validate_backend(backend: str) -> None:
+    """Raise ValueError if ``backend`` is not a supported metrics backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {list(BACKENDS)}, got '{backend}'")
+
+
+def encode_groups(unprivileged_mask: np.ndarray, privileged_mask: np.ndarray) -> np.ndarray:
+    """Combine the two group masks into one small integer code per row."""
+    return (unprivileged_mask.astype(np.intp) * UNPRIVILEGED) + (privileged_mask.astype(np.intp) * PRIVILEGED)
+
+
+def encode_binary_labels(values: np.ndarray, column_name: str, favorable_label_value: float, unfavorable_label_value: float) -> np.ndarray:
+    """
+    Encode a label or prediction column as 1 (favorable) / 0 (unfavorable).
+
+    Raises ValueError if the column holds any other value, mirroring the
+    check AIF360's ``BinaryLabelDataset`` performs.
+    """
+    favorable = values == favorable_label_value
+    unfavorable = values == unfavorable_label_value
+    if not np.all(favorable | unfavorable):
+        unexpected = pd.unique(values[~(favorable | unfavorable)])
+        raise ValueError(f"Column '{column_name}' contains values other than the favorable ({favorable_label_value}) and unfavorable ({unfavorable_label_value}) labels: {unexpected[:10].tolist()}")
+    return favorable.astype(np.intp)
+
+
+def confusion_counts(group_codes: np.ndarray, label_codes: np.ndarray, prediction_codes: np.ndarray, weights: np.ndarray = None) -> np.ndarray:
+    """Count (optionally weighted) rows per group, label and prediction in one pass."""
+    cell = (group_codes * 4) + (label_codes * 2) + prediction_codes
+    counts = np.bincount(cell, weights=weights, minlength=N_GROUP_CODES * 4)
+    return counts.astype(np.float64).reshape(N_GROUP_CODES, 2, 2)
+
+
+def _condition(counts: np.ndarray, privileged=None) -> np.ndarray:
+    """Collapse the group axis: all rows (None), unprivileged (False) or privileged (True)."""
+    if privileged is None:
+        return counts.sum(axis=-3)
+    codes = [PRIVILEGED, BOTH] if privileged else [UNPRIVILEGED, BOTH]
+    return counts[..., codes, :, :].sum(axis=-3)
+
+
+def group_rates(counts: np.ndarray, privileged=None) -> dict:
+    """Base rate, selection rate, TPR, TNR, FPR, FNR and accuracy of one group (or all rows)."""
+    c = _condition(counts, privileged)
+    tn, fp = c[..., 0, 0], c[..., 0, 1]
+    fn, tp = c[..., 1, 0], c[..., 1, 1]
+    positives, negatives = tp + fn, tn + fp
+    instances = positives + negatives
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'base_rate': positives / instances,
+            'selection_rate': (tp + fp) / instances,
+            'TPR': tp / positives,
+            'TNR': tn / negatives,
+            'FPR': fp / negatives,
+            'FNR': fn / positives,
+            'ACC': np.where(instances > 0, (tp + tn) / instances, 0.0),
+        }
+
+
+def _greater(a, b):
+    # Python's max(a, b) semantics (as used by AIF360): keep ``a`` unless ``b > a``.
+    return np.where(b > a, b, a)
+
+
+def bias_scores(counts: np.ndarray) -> list:
+    """Scores for ``BIAS_METRIC_NAMES`` computed from a counts tensor."""
+    unpriv, priv = group_rates(counts, False), group_rates(counts, True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        disparate_impact = unpriv['base_rate'] / priv['base_rate']
+    statistical_parity_diff = unpriv['base_rate'] - priv['base_rate']
+    return [disparate_impact, statistical_parity_diff, statistical_parity_diff]
+
+
+def fairness_scores(counts: np.ndarray) -> list:
+    """Scores for ``FAIRNESS_METRIC_NAMES`` computed from a counts tensor."""
+    overall, unpriv, priv = group_rates(counts), group_rates(counts, False), group_rates(counts, True)
+    tpr_diff = unpriv['TPR'] - priv['TPR']
+    fpr_diff = unpriv['FPR'] - priv['FPR']
+    return [
+        overall['ACC'],
+        (overall['TPR'] + overall['TNR']) / 2,
+        unpriv['selection_rate'] - priv['selection_rate'],
+        tpr_diff,
+        _greater(np.abs(fpr_diff), np.abs(tpr_diff)),
+        fpr_diff,
+        unpriv['FNR'] - priv['FNR'],
+    ]
+
+
+def bootstrap_intervals(counts: np.ndarray, score_function, n_bootstrap: int = 1000, confidence_level: float = 0.95, random_state=None, weights: np.ndarray = None) -> pd.DataFrame:
+    """
+    Percentile bootstrap intervals and standard errors for the scores of ``score_function``.
+
+    Uses the Poisson bootstrap: every row gets an independent Poisson(1)
+    replicate weight, so the replicate count of a (group, label, prediction)
+    cell holding ``n`` rows is a single Poisson(``n``) draw. All
+    ``n_bootstrap`` replicates are drawn and scored as one ``(B, 4, 2, 2)``
+    array. If ``weights`` (the cells' instance-weight sums) is given, each
+    replicate cell is scaled by its mean row weight. Replicates producing a
+    non-finite score (e.g. an empty group) are ignored for that metric.
+
+    Parameters:
+    counts (np.ndarray): ``(4, 2, 2)`` row counts.
+    score_function (callable): ``bias_scores`` or ``fairness_scores``.
+    n_bootstrap (int, optional): Number of bootstrap replicates. Defaults to 1000.
+    confidence_level (float, optional): Coverage of the interval. Defaults to 0.95.
+    random_state (int or np.random.Generator, optional): Seed for reproducible intervals. Defaults to None.
+    weights (np.ndarray, optional): ``(4, 2, 2)`` instance-weight sums. Defaults to None.
+
+    Returns:
+    pd.DataFrame: ``CI Lower``, ``CI Upper`` and ``Std Error`` columns, one row per metric.
+    """
+    if int(n_bootstrap) < 2:
+        raise ValueError(f"n_bootstrap must be at least 2, got {n_bootstrap}")
+    if not 0 < confidence_level < 1:
+        raise ValueError(f"confidence_level must be between 0 and 1, got {confidence_level}")
+    counts = np.asarray(counts, dtype=np.float64)
+    rng = np.random.default_rng(random_state)
+    replicates = rng.poisson(counts, size=(int(n_bootstrap),) + counts.shape).astype(np.float64)
+    if weights is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            replicates *= np.where(counts > 0, np.asarray(weights) / counts, 0.0)
+
+    scores = np.stack([np.broadcast_to(score, (int(n_bootstrap),)) for score in score_function(replicates)], axis=1)
+    scores = np.where(np.isfinite(scores), scores, np.nan)
+    alpha = (1 - confidence_level) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # all-nan metrics yield nan bounds
+        lower, upper = np.nanquantile(scores, [alpha, 1 - alpha], axis=0)
+        std_error = np.nanstd(scores, axis=0, ddof=1)
+    return pd.DataFrame({'CI Lower': lower, 'CI Upper': upper, 'Std Error': std_error})
+
+
+def _scoring_table(metric_names: list, score_function, counts: np.ndarray, n_bootstrap: int, confidence_level: float, random_state, weights=None) -> pd.DataFrame:
+    point = counts if weights is None else weights
+    table = pd.DataFrame({'Metric': metric_names, 'Score': [float(s) for s in score_function(point)]})
+    if n_bootstrap:
+        table = add_confidence_intervals(table, counts, score_function, n_bootstrap, confidence_level, random_state, weights)
+    return table
+
+
+def add_confidence_intervals(table: pd.DataFrame, counts: np.ndarray, score_function, n_bootstrap: int = 1000, confidence_level: float = 0.95, random_state=None, weights: np.ndarray = None) -> pd.DataFrame:
+    """Return ``table`` with the ``bootstrap_intervals`` columns appended (rows in ``score_function`` order)."""
+    intervals = bootstrap_intervals(counts, score_function, n_bootstrap, confidence_level, random_state, weights)
+    return pd.concat([table.reset_index(drop=True), intervals], axis=1)
+
+
+def error_bounds(table: pd.DataFrame) -> pd.Series:
+    """Half-width of each interval of a table with ``add_confidence_intervals`` columns: the larger distance from ``Score`` to either end."""
+    return np.fmax(table['CI Upper'] - table['Score'], table['Score'] - table['CI Lower'])
+
+
+def bias_table(counts: np.ndarray, n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+    """
+    Bias scoring table (``Metric``/``Score``) from a ``(4, 2, 2)`` counts tensor.
+
+    With ``n_bootstrap`` > 0, ``CI Lower``/``CI Upper``/``Std Error`` columns
+    are added (see ``bootstrap_intervals``).
+    """
+    return _scoring_table(BIAS_METRIC_NAMES, bias_scores, counts, n_bootstrap, confidence_level, random_state)
+
+
+def fairness_table(counts: np.ndarray, n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+    """
+    Fairness scoring table (``Metric``/``Score``) from a ``(4, 2, 2)`` counts tensor.
+
+    With ``n_bootstrap`` > 0, ``CI Lower``/``CI Upper``/``Std Error`` columns
+    are added (see ``bootstrap_intervals``).
+    """
+    return _scoring_table(FAIRNESS_METRIC_NAMES, fairness_scores, counts, n_bootstrap, confidence_level, random_state)
+
+
+def _jsonable(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class FairnessAccumulator:
+    """
+    Mergeable sufficient statistics for the bias and fairness scoring tables.
+
+    An accumulator holds the ``(4, 2, 2)`` group x label x prediction row
+    counts and the matching instance-weight sums for one protected attribute
+    definition. Accumulators built from disjoint slices of the same data (day
+    partitions, file shards, worker processes) can be merged in any order and
+    finalized into exactly the tables a single run over the concatenated data
+    would produce, without re-reading raw rows.
+
+    Parameters:
+    label_name (str): The name of the label column.
+    protected_attribute_names (list[str]): Names of the protected attribute columns.
+    privileged_groups (list[dict]): Privileged group definitions.
+    unprivileged_groups (list[dict]): Unprivileged group definitions.
+    favorable_label_value (float, optional): Favorable label value. Defaults to 1.0.
+    unfavorable_label_value (float, optional): Unfavorable label value. Defaults to 0.0.
+    prediction_name (str, optional): Name of the prediction column, if predictions differ from labels.
+                                     Defaults to None.
+    """
+
+    def __init__(self, label_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, prediction_name: str = None):
+        self.label_name = label_name
+        self.protected_attribute_names = list(protected_attribute_names)
+        self.privileged_groups = [{k: _jsonable(v) for k, v in g.items()} for g in privileged_groups]
+        self.unprivileged_groups = [{k: _jsonable(v) for k, v in g.items()} for g in unprivileged_groups]
+        self.favorable_label_value = _jsonable(favorable_label_value)
+        self.unfavorable_label_value = _jsonable(unfavorable_label_value)
+        self.prediction_name = prediction_name
+        self.counts = np.zeros((N_GROUP_CODES, 2, 2), dtype=np.int64)
+        self.weights = np.zeros((N_GROUP_CODES, 2, 2), dtype=np.float64)
+
+    @property
+    def metadata(self) -> dict:
+        return {
+            'label_name': self.label_name,
+            'protected_attribute_names': self.protected_attribute_names,
+            'privileged_groups': self.privileged_groups,
+            'unprivileged_groups': self.unprivileged_groups,
+            'favorable_label_value': self.favorable_label_value,
+            'unfavorable_label_value': self.unfavorable_label_value,
+            'prediction_name': self.prediction_name,
+        }
+
+    @property
+    def num_rows(self) -> int:
+        return int(self.counts.sum())
+
+    def update(self, group_codes: np.ndarray, label_codes: np.ndarray, prediction_codes: np.ndarray, weights: np.ndarray = None) -> "FairnessAccumulator":
+        """Add a slice of encoded rows (see ``encode_groups``/``encode_binary_labels``)."""
+        counts = confusion_counts(group_codes, label_codes, prediction_codes)
+        self.counts += counts.astype(np.int64)
+        self.weights += counts if weights is None else confusion_counts(group_codes, label_codes, prediction_codes, weights)
+        return self
+
+    def add_counts(self, counts: np.ndarray) -> "FairnessAccumulator":
+        """Add an unweighted ``(4, 2, 2)`` counts tensor."""
+        self.counts += np.asarray(counts).astype(np.int64)
+        self.weights += counts
+        return self
+
+    def merge(self, other: "FairnessAccumulator") -> "FairnessAccumulator":
+        """Return a new accumulator holding the statistics of both operands."""
+        if self.metadata != other.metadata:
+            raise ValueError(f"Cannot merge accumulators built for different definitions: {self.metadata} vs {other.metadata}")
+        merged = FairnessAccumulator(**self.metadata)
+        merged.counts = self.counts + other.counts
+        merged.weights = self.weights + other.weights
+        return merged
+
+    __add__ = merge
+
+    @classmethod
+    def merge_all(cls, accumulators) -> "FairnessAccumulator":
+        """Merge an iterable of accumulators (e.g. one per shard)."""
+        accumulators = list(accumulators)
+        if not accumulators:
+            raise ValueError("merge_all requires at least one accumulator.")
+        merged = accumulators[0]
+        for accumulator in accumulators[1:]:
+            merged = merged.merge(accumulator)
+        return merged
+
+    def save(self, path: str) -> None:
+        """Write the accumulator to a compact binary ``.npz`` file."""
+        with open(path, 'wb') as f:
+            np.savez(f, counts=self.counts, weights=self.weights, metadata=np.array(json.dumps(self.metadata)))
+
+    @classmethod
+    def load(cls, path: str) -> "FairnessAccumulator":
+        """Read an accumulator written by ``save``."""
+        with np.load(path, allow_pickle=False) as data:
+            accumulator = cls(**json.loads(str(data['metadata'])))
+            accumulator.counts = data['counts'].astype(np.int64)
+            accumulator.weights = data['weights'].astype(np.float64)
+        return accumulator
+
+    def validate(self) -> None:
+        """Raise ValueError if the favorable or unfavorable label was never observed."""
+        label_totals = self.counts.sum(axis=(0, 2))
+        present = [value for value, total in zip([self.unfavorable_label_value, self.favorable_label_value], label_totals) if total > 0]
+        if label_totals[1] == 0:
+            raise ValueError(f"Favorable label value '{self.favorable_label_value}' not found in label column '{self.label_name}'. Present values: {present}")
+        if label_totals[0] == 0:
+            raise ValueError(f"Unfavorable label value '{self.unfavorable_label_value}' not found in label column '{self.label_name}'. Present values: {present}")
+
+    def bias_table(self, n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+        """Finalize into the bias scoring table, with bootstrap intervals if ``n_bootstrap`` > 0."""
+        self.validate()
+        return _scoring_table(BIAS_METRIC_NAMES, bias_scores, self.counts, n_bootstrap, confidence_level, random_state, self.weights)
+
+    def fairness_table(self, n_bootstrap: int = 0, confidence_level: float = 0.95, random_state=None) -> pd.DataFrame:
+        """Finalize into the fairness scoring table, with bootstrap intervals if ``n_bootstrap`` > 0."""
+        self.validate()
+        return _scoring_table(FAIRNESS_METRIC_NAMES, fairness_scores, self.counts, n_bootstrap, confidence_level, random_state, self.weights)
+
+
+class StratifiedReservoir:
+    """
+    Uniform random sample of at most ``rows_per_group`` rows of every group code, drawn in one pass.
+
+    Each row gets a uniform random key and each group code keeps the rows with
+    the smallest keys (bottom-k sampling). After any number of updates, a group's
+    sample is a simple random sample without replacement of the rows it has
+    seen, so small groups keep all their rows while large ones are capped.
+    Only each row's (label, prediction) cell is kept. A sampled row of a group
+    that has seen ``N`` rows and kept ``n`` stands for ``N / n`` rows, its
+    inverse inclusion probability; ``weighted_counts`` applies those weights.
+
+    Parameters:
+    rows_per_group (int): Largest sample kept per group code.
+    random_state (int or np.random.Generator, optional): Seed for the sampling keys. Defaults to None.
+    """
+
+    def __init__(self, rows_per_group: int, random_state=None):
+        if int(rows_per_group) < 1:
+            raise ValueError(f"rows_per_group must be a positive integer, got {rows_per_group}")
+        self.rows_per_group = int(rows_per_group)
+        self.seen = np.zeros(N_GROUP_CODES, dtype=np.int64)
+        self._rng = np.random.default_rng(random_state)
+        self._keys = [np.empty(0) for _ in range(N_GROUP_CODES)]
+        self._cells = [np.empty(0, dtype=np.int8) for _ in range(N_GROUP_CODES)]
+
+    def update(self, group_codes: np.ndarray, label_codes: np.ndarray, prediction_codes: np.ndarray) -> "StratifiedReservoir":
+        """Offer a slice of encoded rows (see ``encode_groups``/``encode_binary_labels``) to the sample."""
+        cells = ((label_codes * 2) + prediction_codes).astype(np.int8)
+        keys = self._rng.random(len(cells))
+        for group in range(N_GROUP_CODES):
+            mask = group_codes == group
+            self.seen[group] += np.count_nonzero(mask)
+            if len(self._keys[group]) == self.rows_per_group:
+                mask &= keys < self._keys[group].max()  # only keys below the current cut-off can enter
+            if not mask.any():
+                continue
+            group_keys = np.concatenate([self._keys[group], keys[mask]])
+            group_cells = np.concatenate([self._cells[group], cells[mask]])
+            if len(group_keys) > self.rows_per_group:
+                keep = np.argpartition(group_keys, self.rows_per_group - 1)[:self.rows_per_group]
+                group_keys, group_cells = group_keys[keep], group_cells[keep]
+            self._keys[group], self._cells[group] = group_keys, group_cells
+        return self
+
+    @property
+    def sampled(self) -> np.ndarray:
+        """Rows kept per group code."""
+        return np.array([len(cells) for cells in self._cells], dtype=np.int64)
+
+    def counts(self) -> np.ndarray:
+        """``(4, 2, 2)`` counts of the sampled rows."""
+        return np.stack([np.bincount(cells, minlength=4).reshape(2, 2) for cells in self._cells]).astype(np.float64)
+
+    def weighted_counts(self) -> np.ndarray:
+        """``(4, 2, 2)`` sample counts weighted by inverse inclusion probability, i.e. estimated counts of the rows seen."""
+        sampled = self.sampled
+        scale = np.divide(self.seen, sampled, out=np.zeros(N_GROUP_CODES), where=sampled > 0)
+        return self.counts() * scale[:, None, None]
@@ -0,0 +1,431 @@
+# native_mitigation.py
+"""AIF360-free, chunked implementations of the mitigation techniques.
+
+Reweighing weights depend only on group x label counts, so ``reweigh_file``
+makes two passes over the input, ``chunksize`` rows at a time. The first pass
+counts rows per group code (as in ``native_metrics``) and label. The second
+streams the rows back out with a weight column looked up from a ``(4, 2)``
+weight table, or writes a weights-only sidecar file. Peak memory is bounded by
+the chunk size rather than by several copies of the whole input.
+
+``DisparateImpactRepairer`` reimplements AIF360's ``DisparateImpactRemover``
+(the BlackBoxAuditing numeric repair) with sorted NumPy arrays instead of
+per-value Python loops. For each feature, the distinct values of every group
+are split into the same number of quantile buckets; each bucket's target is
+the median of the groups' bucket medians, and values move towards it by
+``repair_level`` of the distance, measured in positions among the distinct
+values of the column. ``fit`` keeps the reference values, bucket bounds and
+targets, so ``transform`` repairs new rows (e.g. scoring traffic) without
+refitting, and independent columns are repaired in a thread pool.
+
+``SketchedDisparateImpactRepairer`` does the same repair out of core. A first
+pass over chunks feeds per-group, per-feature ``QuantileSketch`` summaries
+(mergeable across chunks and processes); a second pass streams chunks through
+the repair, so ``repair_file`` needs memory for one chunk plus the sketches.
+"""
+import copy
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import data_io
+import native_metrics
+import profiling
+from quantile_sketch import QuantileSketch
+from native_metrics import BOTH, N_GROUP_CODES, PRIVILEGED, UNPRIVILEGED
+
+DEFAULT_CHUNKSIZE = 1_000_000
+
+
+def reweighing_weights(counts: np.ndarray) -> np.ndarray:
+    """
+    ``(4, 2)`` weight per group code and label code, as computed by AIF360's ``Reweighing``.
+
+    ``counts`` is a ``(4, 2)`` group x label or ``(4, 2, 2)`` group x label x
+    prediction tensor. Each group's weight for label ``l`` is
+    ``n_l * n_group / (n * n_group_l)``. Rows in both groups get both weights
+    multiplied and rows in neither group keep weight 1, exactly as AIF360
+    applies its conditions.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    if counts.ndim == 3:
+        counts = counts.sum(axis=-1)
+    n = counts.sum()
+    n_label = counts.sum(axis=0)
+    weights = np.ones((N_GROUP_CODES, 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for code in (UNPRIVILEGED, PRIVILEGED):
+            group = counts[[code, BOTH]]
+            weights[code] = n_label * group.sum() / (n * group.sum(axis=0))
+    weights[BOTH] = weights[UNPRIVILEGED] * weights[PRIVILEGED]
+    return weights
+
+
+def _encode_chunk(chunk: pd.DataFrame, label_name: str, privileged_groups: list[dict], unprivileged_groups: list[dict], favorable_label_value: float, unfavorable_label_value: float) -> tuple:
+    from analysis_session import compute_group_mask
+
+    group_codes = native_metrics.encode_groups(compute_group_mask(chunk, unprivileged_groups), compute_group_mask(chunk, privileged_groups))
+    label_codes = native_metrics.encode_binary_labels(chunk[label_name].to_numpy(), label_name, favorable_label_value, unfavorable_label_value)
+    return group_codes, label_codes
+
+
+def reweigh_file(input_file: str, output_file: str, label_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, chunksize: int = DEFAULT_CHUNKSIZE, weights_file: str = None, weights_column: str = 'instance_weights') -> np.ndarray:
+    """
+    Two-pass chunked Reweighing.
+
+    Parameters:
+    input_file (str): Path to the input file (CSV, Parquet, Feather or Arrow IPC).
+    output_file (str): Path for the input rows with ``weights_column`` appended. May be None.
+    label_name (str): The name of the label column.
+    protected_attribute_names (list[str]): A list of names of the protected attribute columns.
+    privileged_groups (list[dict]): A list of dictionaries representing privileged groups.
+    unprivileged_groups (list[dict]): A list of dictionaries representing unprivileged groups.
+    favorable_label_value (float, optional): Value representing the favorable outcome. Defaults to 1.0.
+    unfavorable_label_value (float, optional): Value representing the unfavorable outcome. Defaults to 0.0.
+    chunksize (int, optional): Rows per chunk. Defaults to 1,000,000.
+    weights_file (str, optional): Path for a sidecar holding only ``weights_column``, one row per
+                                  input row (empty where a row was skipped). Defaults to None.
+    weights_column (str, optional): Name of the weight column. Defaults to 'instance_weights'.
+
+    Rows with a missing value in any column are skipped, as in the AIF360 path
+    of ``apply_reweighing``, so both backends weigh the same rows.
+
+    Returns:
+    np.ndarray: The ``(4, 2)`` weight table from ``reweighing_weights``.
+    """
+    from analysis_session import validate_group_definitions, validate_label_column, validate_protected_attributes
+
+    if chunksize <= 0:
+        raise ValueError(f"chunksize must be a positive integer, got {chunksize}")
+    columns = data_io.read_columns(input_file)
+    validate_label_column(columns, label_name)
+    validate_protected_attributes(columns, protected_attribute_names)
+    validate_group_definitions(protected_attribute_names, privileged_groups, unprivileged_groups)
+    needed = list(protected_attribute_names) + [label_name]
+
+    # Pass 1: group x label counts over the complete rows.
+    counts = np.zeros((N_GROUP_CODES, 2))
+    with profiling.stage('count', file=str(input_file)) as record:
+        for chunk in data_io.iter_chunks(input_file, None, chunksize):
+            chunk = chunk[needed][chunk.notna().all(axis=1).to_numpy()]
+            group_codes, label_codes = _encode_chunk(chunk, label_name, privileged_groups, unprivileged_groups,
+                                                     favorable_label_value, unfavorable_label_value)
+            counts += np.bincount(group_codes * 2 + label_codes, minlength=N_GROUP_CODES * 2).reshape(N_GROUP_CODES, 2)
+        record['rows'] = int(counts.sum())
+    weights = reweighing_weights(counts)
+
+    # Pass 2: stream the rows back out with their weight.
+    def weighted_chunks(sidecar):
+        for chunk in data_io.iter_chunks(input_file, None, chunksize):
+            complete = chunk.notna().all(axis=1).to_numpy()
+            group_codes, label_codes = _encode_chunk(chunk[complete], label_name, privileged_groups, unprivileged_groups,
+                                                     favorable_label_value, unfavorable_label_value)
+            row_weights = np.full(len(chunk), np.nan)
+            row_weights[complete] = weights[group_codes, label_codes]
+            if not sidecar:
+                yield chunk[complete].assign(**{weights_column: row_weights[complete]})
+            else:
+                yield pd.DataFrame({weights_column: row_weights})
+
+    if output_file:
+        with profiling.stage('write', file=str(output_file)) as record:
+            record['rows'] = data_io.write_chunks(weighted_chunks(False), output_file)
+    if weights_file:
+        with profiling.stage('write', file=str(weights_file)) as record:
+            record['rows'] = data_io.write_chunks(weighted_chunks(True), weights_file)
+    return weights
+
+
+def _fit_repair_column(values: np.ndarray, group_codes: np.ndarray, n_groups: int, name: str) -> tuple:
+    """Reference values, per-group distinct values, ``(G, Q + 1)`` bucket bounds and ``(Q,)`` target positions of one column."""
+    present = ~np.isnan(values)
+    reference, positions = np.unique(values[present], return_inverse=True)
+    # Distinct (group, value) pairs, sorted by group and then by value.
+    pairs = np.unique(group_codes[present] * len(reference) + positions)
+    pair_groups, pair_positions = np.divmod(pairs, len(reference))
+    sizes = np.bincount(pair_groups, minlength=n_groups)
+    if sizes.min() == 0:
+        raise ValueError(f"Feature '{name}' has no values for some group of the sensitive attribute.")
+
+    n_quantiles = sizes.min()
+    # Offsets accumulate like BlackBoxAuditing's running sum, so bucket bounds round identically.
+    offsets = np.cumsum(np.r_[0.0, np.full(n_quantiles, 1.0 / n_quantiles)])
+    bounds = np.rint(offsets * sizes[:, None]).astype(np.int64)
+    starts = np.r_[0, np.cumsum(sizes)[:-1]]
+    lengths = np.diff(bounds, axis=1)
+    # Lower median of each group's distinct values in each bucket, then lower median across groups.
+    medians = pair_positions[np.minimum(starts[:, None] + bounds[:, :-1] + (lengths - 1) // 2, len(pairs) - 1)]
+    medians = np.sort(np.where(lengths > 0, medians, np.iinfo(np.int64).max), axis=0)
+    targets = medians[(np.count_nonzero(lengths > 0, axis=0) - 1) // 2, np.arange(n_quantiles)]
+    group_values = np.split(reference[pair_positions], np.cumsum(sizes)[:-1])
+    return reference, group_values, bounds, targets
+
+
+def _repair_column(values: np.ndarray, group_codes: np.ndarray, state: tuple, repair_level: float) -> np.ndarray:
+    reference, group_values, bounds, targets = state
+    repaired = values.copy()
+    present = ~np.isnan(values)
+    # Position among the reference values; values unseen when fitting snap to the nearest one.
+    positions = np.rint(np.interp(values[present], reference, np.arange(len(reference)))).astype(np.int64)
+    buckets = np.empty(len(positions), dtype=np.int64)
+    codes = group_codes[present]
+    for code, distinct in enumerate(group_values):
+        rows = codes == code
+        # The group's quantile function: rank of each value among the group's distinct values.
+        ranks = np.interp(values[present][rows], distinct, np.arange(len(distinct)))
+        buckets[rows] = np.searchsorted(bounds[code, 1:], ranks, side='right')
+    buckets = np.minimum(buckets, len(targets) - 1)
+    moved = positions + np.rint((targets[buckets] - positions) * repair_level).astype(np.int64)
+    repaired[present] = reference[np.clip(moved, 0, len(reference) - 1)]
+    return repaired
+
+
+def _map_columns(function, names: list, n_jobs: int) -> list:
+    # NumPy sorting and interpolation release the GIL, so columns repair concurrently in threads.
+    if n_jobs and n_jobs > 1 and len(names) > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            return list(executor.map(function, names))
+    return list(map(function, names))
+
+
+def _sensitive_codes(df: pd.DataFrame, sensitive_attribute: str, groups: np.ndarray) -> np.ndarray:
+    if sensitive_attribute not in df.columns:
+        raise ValueError(f"Sensitive attribute '{sensitive_attribute}' not found.")
+    values = df[sensitive_attribute]
+    codes = pd.Index(groups).get_indexer(values)
+    if (codes < 0).any():
+        unseen = sorted(map(str, set(values[codes < 0])))
+        raise ValueError(f"Values {unseen} of '{sensitive_attribute}' were not seen when fitting.")
+    return codes
+
+
+def _repaired_column(df: pd.DataFrame, name: str, repaired: np.ndarray) -> np.ndarray:
+    if pd.api.types.is_integer_dtype(df[name].dtype):
+        return np.rint(repaired).astype(df[name].dtype)
+    return repaired
+
+
+def _numeric_features(df: pd.DataFrame, exclude: list) -> list:
+    return [name for name in df.select_dtypes('number').columns if name not in exclude]
+
+
+class DisparateImpactRepairer:
+    """
+    Vectorized Disparate Impact Remover with a separate ``fit`` and ``transform``.
+
+    Parameters:
+    sensitive_attribute (str): Column whose groups the features are repaired across.
+    repair_level (float, optional): 0.0 is no repair and 1.0 full repair. Defaults to 1.0.
+    features (list[str], optional): Columns to repair. Defaults to None (every numeric column
+                                    other than ``sensitive_attribute``).
+    n_jobs (int, optional): Threads repairing columns concurrently. Defaults to 1.
+
+    On the data it was fitted on, the repaired values match AIF360's
+    ``DisparateImpactRemover``. Missing feature values stay missing. A fitted
+    repairer only holds NumPy arrays and can be pickled for reuse.
+    """
+
+    def __init__(self, sensitive_attribute: str, repair_level: float = 1.0, features: list[str] = None, n_jobs: int = 1):
+        if not 0.0 <= repair_level <= 1.0:
+            raise ValueError("'repair_level' must be between 0.0 and 1.0.")
+        self.sensitive_attribute = sensitive_attribute
+        self.repair_level = repair_level
+        self.features = features
+        self.n_jobs = n_jobs
+        self.groups_ = None
+        self.columns_ = None
+
+    def fit(self, df: pd.DataFrame) -> 'DisparateImpactRepairer':
+        """Learn the per-group quantile buckets and repair targets of every feature from ``df``."""
+        if self.sensitive_attribute not in df.columns:
+            raise ValueError(f"Sensitive attribute '{self.sensitive_attribute}' not found.")
+        features = self.features if self.features is not None else _numeric_features(df, [self.sensitive_attribute])
+        missing = [name for name in features if name not in df.columns]
+        if missing:
+            raise ValueError(f"Features {missing} not found.")
+        df = df.dropna(subset=[self.sensitive_attribute])
+        self.groups_ = np.unique(df[self.sensitive_attribute])
+        group_codes = _sensitive_codes(df, self.sensitive_attribute, self.groups_)
+        states = _map_columns(lambda name: _fit_repair_column(df[name].to_numpy(dtype=np.float64), group_codes, len(self.groups_), name),
+                              features, self.n_jobs)
+        self.columns_ = dict(zip(features, states))
+        return self
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Return ``df`` with every fitted feature repaired; other columns are left as they are."""
+        if self.columns_ is None:
+            raise ValueError("DisparateImpactRepairer must be fitted before transform.")
+        group_codes = _sensitive_codes(df, self.sensitive_attribute, self.groups_)
+
+        def repair(name):
+            return _repaired_column(df, name, _repair_column(df[name].to_numpy(dtype=np.float64), group_codes,
+                                                             self.columns_[name], self.repair_level))
+
+        names = list(self.columns_)
+        return df.assign(**dict(zip(names, _map_columns(repair, names, self.n_jobs))))
+
+    def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """``fit`` on ``df`` and return it repaired."""
+        return self.fit(df).transform(df)
+
+
+class SketchedDisparateImpactRepairer:
+    """
+    Disparate Impact Remover fitted from mergeable quantile sketches instead of the full data.
+
+    Parameters:
+    sensitive_attribute (str): Column whose groups the features are repaired across.
+    repair_level (float, optional): 0.0 is no repair and 1.0 full repair. Defaults to 1.0.
+    features (list[str], optional): Columns to repair. Defaults to None (every numeric column
+                                    of the first fitted chunk other than ``sensitive_attribute``).
+    k (int, optional): Sketch size; the rank error of each sketch is about ``1.7 / k``. Defaults to 200.
+    n_quantiles (int, optional): Number of repair buckets. Defaults to None (the fewest distinct
+                                 values any group keeps in its sketch, as the exact repair uses).
+    n_jobs (int, optional): Threads repairing columns concurrently. Defaults to 1.
+    random_state (int, optional): Seed for the sketches. Defaults to None.
+
+    Each group's values are placed in quantile buckets with the group's sketch
+    CDF, and each bucket's target is the median of the groups' bucket
+    quantiles. Values move towards the target by ``repair_level`` of the
+    distance in pooled rank, i.e. through the CDF of all groups together, the
+    counterpart of the exact repair's positions among distinct values. The
+    result differs from ``DisparateImpactRepairer`` by about the sketch rank
+    error, and repaired values are interpolated rather than restricted to
+    values seen when fitting (integer columns are rounded).
+    """
+
+    def __init__(self, sensitive_attribute: str, repair_level: float = 1.0, features: list[str] = None, k: int = 200, n_quantiles: int = None, n_jobs: int = 1, random_state: int = None):
+        if not 0.0 <= repair_level <= 1.0:
+            raise ValueError("'repair_level' must be between 0.0 and 1.0.")
+        self.sensitive_attribute = sensitive_attribute
+        self.repair_level = repair_level
+        self.features = features
+        self.k = k
+        self.n_quantiles = n_quantiles
+        self.n_jobs = n_jobs
+        self.sketches_ = {} # group value -> {feature: QuantileSketch}
+        self._rng = np.random.default_rng(random_state)
+        self._tables = None
+
+    def partial_fit(self, df: pd.DataFrame) -> 'SketchedDisparateImpactRepairer':
+        """Add the rows of one chunk to the sketches."""
+        if self.sensitive_attribute not in df.columns:
+            raise ValueError(f"Sensitive attribute '{self.sensitive_attribute}' not found.")
+        if self.features is None:
+            self.features = _numeric_features(df, [self.sensitive_attribute])
+        missing = [name for name in self.features if name not in df.columns]
+        if missing:
+            raise ValueError(f"Features {missing} not found.")
+        for group, part in df.dropna(subset=[self.sensitive_attribute]).groupby(self.sensitive_attribute, sort=False):
+            sketches = self.sketches_.get(group)
+            if sketches is None:
+                sketches = self.sketches_[group] = {name: QuantileSketch(self.k, self._rng.integers(2 ** 32)) for name in self.features}
+            for name in self.features:
+                sketches[name].update(part[name].to_numpy(dtype=np.float64))
+        self._tables = None
+        return self
+
+    def fit(self, df: pd.DataFrame) -> 'SketchedDisparateImpactRepairer':
+        """Fit the sketches on ``df`` alone."""
+        self.sketches_ = {}
+        return self.partial_fit(df)
+
+    def merge(self, other: 'SketchedDisparateImpactRepairer') -> 'SketchedDisparateImpactRepairer':
+        """Fold the sketches of a repairer fitted on other rows (e.g. in another process) into this one."""
+        if self.features is None:
+            self.features = other.features
+        for group, sketches in other.sketches_.items():
+            if group in self.sketches_:
+                for name, sketch in sketches.items():
+                    self.sketches_[group][name].merge(sketch)
+            else:
+                self.sketches_[group] = copy.deepcopy(sketches)
+        self._tables = None
+        return self
+
+    def _fit_column(self, name: str) -> tuple:
+        groups = [self.sketches_[group][name] for group in self.groups_]
+        if any(sketch.n == 0 for sketch in groups):
+            raise ValueError(f"Feature '{name}' has no values for some group of the sensitive attribute.")
+        pooled = copy.deepcopy(groups[0])
+        for sketch in groups[1:]:
+            pooled.merge(sketch)
+        group_points = [sketch.cdf_points() for sketch in groups]
+        n_quantiles = self.n_quantiles or min(len(values) for values, _ in group_points)
+        levels = (np.arange(n_quantiles) + 0.5) / n_quantiles
+        bucket_quantiles = np.sort([np.interp(levels, ranks, values) for values, ranks in group_points], axis=0)
+        targets = bucket_quantiles[(len(groups) - 1) // 2]
+        return pooled.cdf_points(), group_points, targets
+
+    @property
+    def groups_(self) -> np.ndarray:
+        return np.array(sorted(self.sketches_))
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Return ``df`` with every fitted feature repaired; other columns are left as they are."""
+        if not self.sketches_:
+            raise ValueError("SketchedDisparateImpactRepairer must be fitted before transform.")
+        if self._tables is None:
+            self._tables = dict(zip(self.features, _map_columns(self._fit_column, self.features, self.n_jobs)))
+        group_codes = _sensitive_codes(df, self.sensitive_attribute, self.groups_)
+
+        def repair(name):
+            (values, ranks), group_points, targets = self._tables[name]
+            column = df[name].to_numpy(dtype=np.float64)
+            quantiles = np.empty(len(column))
+            for code, (group_values, group_ranks) in enumerate(group_points):
+                rows = group_codes == code
+                quantiles[rows] = np.interp(column[rows], group_values, group_ranks)
+            buckets = np.clip((np.nan_to_num(quantiles) * len(targets)).astype(np.int64), 0, len(targets) - 1)
+            pooled_ranks = np.interp(column, values, ranks)
+            target_ranks = np.interp(targets[buckets], values, ranks)
+            repaired = np.interp(pooled_ranks + self.repair_level * (target_ranks - pooled_ranks), ranks, values)
+            return _repaired_column(df, name, np.where(np.isnan(column), np.nan, repaired))
+
+        return df.assign(**dict(zip(self.features, _map_columns(repair, self.features, self.n_jobs))))
+
+    def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """``fit`` on ``df`` and return it repaired."""
+        return self.fit(df).transform(df)
+
+
+def repair_file(input_file: str, output_file: str, sensitive_attribute_name: str, label_name: str = None, repair_level: float = 1.0, chunksize: int = DEFAULT_CHUNKSIZE, k: int = 200, n_quantiles: int = None, n_jobs: int = 1, reference_file: str = None, random_state: int = None) -> SketchedDisparateImpactRepairer:
+    """
+    Out-of-core Disparate Impact Remover: sketch the input in one chunked pass, repair it in a second.
+
+    Parameters:
+    input_file (str): Path to the input file (CSV, Parquet, Feather or Arrow IPC).
+    output_file (str): Path where the repaired rows are written, one chunk at a time.
+    sensitive_attribute_name (str): Column whose groups the features are repaired across.
+    label_name (str, optional): Label column, left unrepaired. Defaults to None.
+    repair_level (float, optional): 0.0 is no repair and 1.0 full repair. Defaults to 1.0.
+    chunksize (int, optional): Rows per chunk. Defaults to 1,000,000.
+    k (int, optional): Sketch size; the rank error is about ``1.7 / k``. Defaults to 200.
+    n_quantiles (int, optional): Number of repair buckets. Defaults to None (chosen from the sketches).
+    n_jobs (int, optional): Threads repairing columns concurrently. Defaults to 1.
+    reference_file (str, optional): Sketch this file instead of ``input_file``. Defaults to None.
+    random_state (int, optional): Seed for the sketches. Defaults to None.
+
+    Rows with a missing sensitive attribute are skipped.
+
+    Returns:
+    SketchedDisparateImpactRepairer: The fitted repairer, reusable on other data.
+    """
+    if chunksize <= 0:
+        raise ValueError(f"chunksize must be a positive integer, got {chunksize}")
+    repairer = SketchedDisparateImpactRepairer(sensitive_attribute_name, repair_level, k=k, n_quantiles=n_quantiles,
+                                               n_jobs=n_jobs, random_state=random_state)
+    with profiling.stage('fit', file=str(reference_file or input_file)) as record:
+        record['rows'] = 0
+        for chunk in data_io.iter_chunks(reference_file or input_file, None, chunksize):
+            if repairer.features is None:
+                repairer.features = _numeric_features(chunk, [sensitive_attribute_name, label_name])
+            repairer.partial_fit(chunk)
+            record['rows'] += len(chunk)
+
+    def repaired_chunks():
+        for chunk in data_io.iter_chunks(input_file, None, chunksize):
+            yield repairer.transform(chunk.dropna(subset=[sensitive_attribute_name]))
+
+    with profiling.stage('write', file=str(output_file)) as record:
+        record['rows'] = data_io.write_chunks(repaired_chunks(), output_file)
+    return repairer
@@ -0,0 +1,219 @@
+# profiling.py
+"""Per-stage timing of analysis runs.
+
+Library code marks its stages with ``profiling.stage(name, **labels)``, e.g.
+reading the input, validation, ``BinaryLabelDataset`` construction, metric
+computation and writing the report. The hook does nothing unless a
+``Profiler`` is active, so unprofiled runs pay only for one global lookup per
+stage.
+
+While a profiler is active every stage records its wall time, CPU time, the
+process's peak RSS at the end of the stage and, where the stage knows it, the
+number of rows it handled. Labels such as ``attribute`` and ``check`` are
+inherited by nested stages, so the records can be grouped per attribute and
+per check. Each record names its enclosing stage as ``parent``; a stage's
+times include those of the stages nested in it. One named stage can
+additionally be captured with cProfile (a ``.pstats`` file for ``pstats`` or
+snakeviz) or tracemalloc (peak traced memory and the top allocation sites).
+
+CPU time and peak RSS are process-wide: they include every thread, and the
+peak RSS is a high-water mark that never decreases.
+"""
+import contextlib
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+CAPTURE_MODES = ('cprofile', 'tracemalloc')
+TOP_ALLOCATIONS = 10
+
+_active_profiler = None
+_labels = contextvars.ContextVar('profiling_labels', default={})
+_parent = contextvars.ContextVar('profiling_parent', default=None)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes, or None where ``resource`` is unavailable (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return int(peak) if sys.platform == 'darwin' else int(peak) * 1024
+
+
+class Profiler:
+    """
+    Collects one record per executed stage while active.
+
+    Parameters:
+    capture_stage (str, optional): Name of the stage to capture in depth. Defaults to None (timings only).
+    capture (str, optional): 'cprofile' or 'tracemalloc'. Defaults to 'cprofile'.
+    capture_file (str, optional): Where ``write`` saves the cProfile statistics. Defaults to the JSON path
+                                  with a ``.pstats`` extension.
+    """
+
+    def __init__(self, capture_stage: str = None, capture: str = 'cprofile', capture_file: str = None):
+        if capture not in CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode '{capture}'. Use one of {list(CAPTURE_MODES)}.")
+        self.capture_stage = capture_stage
+        self.capture = capture
+        self.capture_file = capture_file
+        self.records = []
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self._capturing = False
+        self._started = None
+        self.total_wall_time = None
+
+    def __enter__(self) -> 'Profiler':
+        global _active_profiler
+        self._previous = _active_profiler
+        _active_profiler = self
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global _active_profiler
+        _active_profiler = self._previous
+        self.total_wall_time = time.perf_counter() - self._started
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **labels):
+        """Time one stage; the yielded dict is the record and accepts ``rows`` and other fields."""
+        labels = {**_labels.get(), **labels}
+        record = {'stage': name, 'parent': _parent.get(), **labels, 'rows': None}
+        tokens = _labels.set(labels), _parent.set(name)
+        capture = name == self.capture_stage and not self._capturing
+        if capture:
+            self._start_capture()
+        rss_before = peak_rss_bytes()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record['wall_time'] = time.perf_counter() - wall
+            record['cpu_time'] = time.process_time() - cpu
+            record['peak_rss_bytes'] = peak_rss_bytes()
+            record['rss_growth_bytes'] = None if rss_before is None else record['peak_rss_bytes'] - rss_before
+            record['pid'] = os.getpid()
+            if capture:
+                self._stop_capture(record)
+            _labels.reset(tokens[0])
+            _parent.reset(tokens[1])
+            with self._lock:
+                self.records.append(record)
+
+    def _start_capture(self) -> None:
+        self._capturing = True
+        if self.capture == 'cprofile':
+            if self._cprofile is None:
+                self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        else:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+    def _stop_capture(self, record: dict) -> None:
+        self._capturing = False
+        if self.capture == 'cprofile':
+            self._cprofile.disable()
+            return
+        snapshot = tracemalloc.take_snapshot()
+        record['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        record['top_allocations'] = [
+            {'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", 'size_bytes': stat.size, 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+        ]
+        if self._started_tracing:
+            tracemalloc.stop()
+
+    def extend(self, records: list) -> None:
+        """Add records collected elsewhere, e.g. by a profiler in a worker process."""
+        with self._lock:
+            self.records.extend(records)
+
+    def summary(self) -> list:
+        """Totals per stage name: number of calls, wall and CPU time, rows and the largest peak RSS."""
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'wall_time': 0.0,
+                                                        'cpu_time': 0.0, 'rows': 0, 'peak_rss_bytes': None})
+            total['calls'] += 1
+            total['wall_time'] += record['wall_time']
+            total['cpu_time'] += record['cpu_time']
+            total['rows'] += record['rows'] or 0
+            if record['peak_rss_bytes'] is not None:
+                total['peak_rss_bytes'] = max(total['peak_rss_bytes'] or 0, record['peak_rss_bytes'])
+        return sorted(totals.values(), key=lambda total: total['wall_time'], reverse=True)
+
+    def to_dict(self) -> dict:
+        """The JSON document written by ``write``."""
+        return {
+            'total_wall_time': self.total_wall_time,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'capture_stage': self.capture_stage,
+            'capture': self.capture if self.capture_stage else None,
+            'stages': self.records,
+            'summary': self.summary(),
+        }
+
+    def write(self, path: str) -> None:
+        """
+        Save the records as JSON to ``path``.
+
+        If a stage was captured with cProfile, its statistics are also dumped
+        to ``capture_file`` (by default ``path`` with a ``.pstats`` extension).
+        """
+        document = self.to_dict()
+        if self._cprofile is not None:
+            capture_file = self.capture_file or os.path.splitext(path)[0] + '.pstats'
+            self._cprofile.dump_stats(capture_file)
+            document['capture_file'] = capture_file
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2, default=str)
+
+
+def active_profiler():
+    """The profiler currently recording, or None."""
+    return _active_profiler
+
+
+def profiled(name: str, **labels):
+    """Decorator running every call of the function as a stage named ``name``."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stage(name: str, **labels):
+    """
+    Context manager marking a stage of the active profiler.
+
+    Without an active profiler this is a no-op whose yielded record is a
+    throwaway dict, so callers can set ``record['rows']`` unconditionally.
+
+    Parameters:
+    name (str): Stage name, e.g. 'read', 'validate', 'dataset', 'metrics' or 'write'.
+    **labels: Fields such as ``attribute`` or ``check`` stored on this record and every nested one.
+    """
+    profiler = _active_profiler
+    if profiler is None:
+        return contextlib.nullcontext({})
+    return profiler.stage(name, **labels)
@@ -0,0 +1,125 @@
+# quantile_sketch.py
+"""Mergeable streaming quantile sketch (KLL style).
+
+A ``QuantileSketch`` summarizes any number of values in a few thousand
+items. Items live in levels; an item at level ``h`` stands for ``2 ** h``
+values. When a level outgrows its capacity it is sorted and every other item
+(starting at a random offset) is promoted to the next level, halving its size
+while keeping the total weight. Capacities shrink geometrically (by ``2/3``)
+from the top level down, so memory stays below about ``3 * k`` items however many
+values are added.
+
+Sketches built on different chunks, files or processes are combined with
+``merge``. The rank error is roughly ``1.7 / k`` of the number of values
+(about 1% for the default ``k = 200``), and ``k`` trades memory for accuracy.
+The exact minimum and maximum are tracked separately, so the sketch's CDF
+always covers every value that was added.
+"""
+import numpy as np
+
+SHRINK = 2 / 3
+MIN_CAPACITY = 2
+
+
+class QuantileSketch:
+    """
+    Streaming quantile summary of a numeric column.
+
+    Parameters:
+    k (int, optional): Capacity of the top level; the rank error is about ``1.7 / k``. Defaults to 200.
+    random_state (int or np.random.Generator, optional): Seed for the compaction offsets. Defaults to None.
+    """
+
+    def __init__(self, k: int = 200, random_state=None):
+        if k < 8:
+            raise ValueError(f"k must be at least 8, got {k}")
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(random_state)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._levels) - level - 1
+        return max(MIN_CAPACITY, int(np.ceil(self.k * SHRINK ** depth)))
+
+    def _compress(self) -> None:
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self._levels)):
+                items = self._levels[level]
+                if len(items) <= self._capacity(level):
+                    continue
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind so the promoted half keeps the exact weight.
+                leftover, items = items[:len(items) % 2], items[len(items) % 2:]
+                promoted = items[self._rng.integers(2)::2]
+                self._levels[level] = leftover
+                self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+                compacted = True
+
+    def update(self, values) -> 'QuantileSketch':
+        """Add an array of values; missing values are ignored."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self._levels[0] = np.concatenate([self._levels[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Fold ``other`` (built on other rows) into this sketch."""
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge sketches with k={self.k} and k={other.k}")
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    @property
+    def size(self) -> int:
+        """Number of items retained."""
+        return sum(len(items) for items in self._levels)
+
+    def cdf_points(self) -> tuple:
+        """
+        Knots of the sketch's piecewise-linear CDF.
+
+        Returns:
+        tuple: (strictly increasing values, strictly increasing mid-ranks in [0, 1]); the
+               exact minimum and maximum are included as the end points.
+        """
+        if not self.n:
+            raise ValueError("The sketch is empty.")
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self._levels)])
+        values, inverse = np.unique(items, return_inverse=True)
+        weights = np.bincount(inverse.ravel(), weights=weights)
+        ranks = (np.cumsum(weights) - weights / 2) / weights.sum()
+        if self.min < values[0]:
+            values, ranks = np.r_[self.min, values], np.r_[0.0, ranks]
+        if self.max > values[-1]:
+            values, ranks = np.r_[values, self.max], np.r_[ranks, 1.0]
+        return values, ranks
+
+    def cdf(self, values) -> np.ndarray:
+        """Approximate fraction of values below each of ``values``."""
+        knots, ranks = self.cdf_points()
+        return np.interp(values, knots, ranks)
+
+    def quantile(self, q) -> np.ndarray:
+        """Approximate quantiles at the probabilities ``q``."""
+        knots, ranks = self.cdf_points()
+        return np.interp(q, ranks, knots)
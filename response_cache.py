@@ -0,0 +1,184 @@
+"""Persistent cache of LLM backend responses for HallBayes runs.
+
+``CachedBackend`` wraps a backend (e.g. HallBayes' ``OpenAIBackend``) and
+memoizes every method call in a SQLite file. The key is a hash of the
+backend's model, the method name, the exact request arguments and how many
+identical calls came before it, so repeated identical sampling calls replay
+distinct stored draws rather than the first one over and over. The
+sampling requests HallBayes issues are determined by the prompt, temperature,
+``n_samples``, ``m`` and ``skeleton_policy``, while decision-time parameters
+(``h_star``, ``isr_threshold``, ``margin_extra_bits``, ``B_clip``,
+``clip_mode``) never reach the backend. Re-scoring a suite with new decision
+parameters therefore replays every response from disk.
+
+Responses are stored as JSON, so only plain types (strings, numbers, booleans,
+``None``, lists and dicts with string keys) can be cached, and tuples come back
+as lists. Other responses (e.g. SDK response objects) are returned uncached
+with a warning. Loading a cache file never executes code from it. Entries record
+when they were last used; once ``max_entries`` is exceeded the least recently
+used ones are evicted. ``mode`` switches between using the
+cache, refreshing it (always call the backend and overwrite) and bypassing it.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Dict, Optional
+
+CACHE_MODES = ("use", "refresh", "off")
+
+
+def _request_key(model: Any, method: str, args: tuple, kwargs: dict, occurrence: int = 0) -> str:
+    try:
+        payload = json.dumps([str(model), method, args, kwargs, occurrence], sort_keys=True)
+    except (TypeError, ValueError) as e:
+        raise TypeError(f"Cannot cache '{method}': its arguments are not JSON serializable ({e}).") from e
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite key/value store of JSON-encoded responses with LRU eviction.
+
+    Parameters
+    ----------
+    path: str
+        SQLite file; created if missing.
+    max_entries: Optional[int]
+        Keep at most this many entries, evicting the least recently used.
+        ``None`` means unbounded.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, got {max_entries}")
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            # A cap lower than the file's current size applies right away.
+            self._evict()
+
+    def get(self, key: str) -> tuple:
+        """Return ``(True, value)`` on a hit and ``(False, None)`` on a miss."""
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            # Binary values were written by older, pickle-based versions and are never loaded.
+            if row is None or not isinstance(row[0], str):
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            with self._connection:
+                self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return True, json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        """Store ``value`` under ``key`` and evict beyond ``max_entries``.
+
+        Raises ``TypeError`` if ``value`` is not JSON serializable.
+        """
+        try:
+            blob = json.dumps(value)
+        except (TypeError, ValueError) as e:
+            raise TypeError(f"Cannot cache a response of type {type(value).__name__}: it is not JSON serializable ({e}).") from e
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, blob, now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.max_entries is not None:
+            self.evictions += self._connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counts of this session and the number of stored entries."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "entries": len(self),
+        }
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class CachedBackend:
+    """Proxy that serves a backend's method calls from a ``ResponseCache``.
+
+    Parameters
+    ----------
+    backend: Any
+        The wrapped backend. Attributes are passed through; method calls are
+        cached by model, method name and arguments, which must be JSON
+        serializable (a ``TypeError`` is raised otherwise). The k-th identical
+        call of a session replays the k-th stored response. Responses that
+        are not JSON serializable are returned uncached with a warning.
+    cache: ResponseCache
+        Where responses are stored.
+    mode: str
+        ``"use"`` reads and writes the cache, ``"refresh"`` always calls the
+        backend and overwrites stored responses, ``"off"`` bypasses the cache.
+    """
+
+    def __init__(self, backend: Any, cache: ResponseCache, mode: str = "use"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}'. Use one of {list(CACHE_MODES)}.")
+        self._backend = backend
+        self._cache = cache
+        self._mode = mode
+        self._occurrences: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self) -> ResponseCache:
+        return self._cache
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._backend, name)
+        if not callable(attribute) or name.startswith("_") or self._mode == "off":
+            return attribute
+
+        def cached(*args, **kwargs):
+            request = _request_key(getattr(self._backend, "model", None), name, args, kwargs)
+            with self._lock:
+                occurrence = self._occurrences.get(request, 0)
+                self._occurrences[request] = occurrence + 1
+            key = _request_key(getattr(self._backend, "model", None), name, args, kwargs, occurrence)
+            if self._mode == "use":
+                hit, value = self._cache.get(key)
+                if hit:
+                    return value
+            value = attribute(*args, **kwargs)
+            try:
+                self._cache.put(key, value)
+            except TypeError as e:
+                warnings.warn(f"Response of '{name}' returned uncached: {e}", RuntimeWarning, stacklevel=2)
+            return value
+
+        return cached
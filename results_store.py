@@ -0,0 +1,234 @@
+# results_store.py
+"""Append-only store of scoring tables from many runs in one long-format table.
+
+Writing a small CSV per attribute and check leaves scheduled deployments
+with millions of files that are slow to list and to aggregate. A
+``ResultsStore`` keeps every result in a single table with one row per
+metric value:
+
+    run_id, timestamp, input_file, input_fingerprint, check, attribute,
+    privileged_groups, unprivileged_groups, subgroup, threshold,
+    metric, value, ci_lower, ci_upper, std_error
+
+Group definitions are stored as JSON. ``subgroup`` is filled for
+intersectional subgroups and per-group ROC rows, and ``threshold`` for
+threshold sweeps. A run's results are appended in one batched write.
+
+Two backends are chosen by the path's extension. SQLite (``.sqlite``,
+``.sqlite3``, ``.db``) is a single file indexed by metric, attribute and
+time. Parquet (``.parquet``, ``.pq``) is a directory holding one file per
+run, read as one dataset with filters pushed down to the files. Parquet
+files cannot be appended to in place, so each run adds a file rather than
+rewriting the table. ``query`` pulls metric history across runs from either
+backend.
+"""
+import datetime
+import functools
+import json
+import operator as operator_module
+import os
+import sqlite3
+import uuid
+import numpy as np
+import pandas as pd
+from dataset_cache import file_fingerprint
+
+RUN_COLUMNS = ['run_id', 'timestamp', 'input_file', 'input_fingerprint']
+RESULT_COLUMNS = ['check', 'attribute', 'privileged_groups', 'unprivileged_groups', 'subgroup', 'threshold',
+                  'metric', 'value', 'ci_lower', 'ci_upper', 'std_error']
+COLUMNS = RUN_COLUMNS + RESULT_COLUMNS
+QUOTED_COLUMNS = ', '.join(f'"{column}"' for column in COLUMNS)  # "check" is an SQL keyword
+FLOAT_COLUMNS = {'threshold', 'value', 'ci_lower', 'ci_upper', 'std_error'}
+STORE_FORMATS_BY_EXTENSION = {
+    '.sqlite': 'sqlite',
+    '.sqlite3': 'sqlite',
+    '.db': 'sqlite',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+}
+COMPARISONS = {'>=': operator_module.ge, '<=': operator_module.le}
+# Scoring-table columns and their long-format names.
+INTERVAL_COLUMNS = {'CI Lower': 'ci_lower', 'CI Upper': 'ci_upper', 'Std Error': 'std_error'}
+
+
+def _groups_json(groups) -> str:
+    return None if groups is None else json.dumps(groups, sort_keys=True, default=str)
+
+
+def _utc_iso(moment) -> str:
+    # One fixed ISO format, so timestamps also compare correctly as strings.
+    moment = pd.Timestamp(moment)
+    moment = moment.tz_localize('UTC') if moment.tzinfo is None else moment.tz_convert('UTC')
+    return moment.isoformat(timespec='microseconds')
+
+
+def long_format(table: pd.DataFrame, check: str, attribute: str = None, privileged_groups: list[dict] = None, unprivileged_groups: list[dict] = None) -> pd.DataFrame:
+    """
+    Convert one scoring table to the store's result columns.
+
+    ``Metric``/``Score`` tables (bias, fairness and intersectional checks) map
+    to one row per metric, keeping any confidence interval columns and the
+    ``Subgroup``. Wide tables (threshold sweeps and ROC tables) are melted,
+    keeping ``Threshold`` and ``Group``.
+
+    Parameters:
+    table (pd.DataFrame): The scoring table as written to CSV by the checks.
+    check (str): Name of the check that produced it, e.g. 'bias_check'.
+    attribute (str, optional): Protected attribute(s) it was computed for. Defaults to None.
+    privileged_groups (list[dict], optional): Privileged group definition. Defaults to None.
+    unprivileged_groups (list[dict], optional): Unprivileged group definition. Defaults to None.
+
+    Returns:
+    pd.DataFrame: The rows, with the columns in ``RESULT_COLUMNS``.
+    """
+    if {'Metric', 'Score'} <= set(table.columns):
+        rows = pd.DataFrame({'metric': table['Metric'].astype(str), 'value': table['Score']})
+        for column, name in INTERVAL_COLUMNS.items():
+            if column in table.columns:
+                rows[name] = table[column].to_numpy()
+        if 'Subgroup' in table.columns:
+            rows['subgroup'] = table['Subgroup'].astype(str).to_numpy()
+    else:
+        ids = {'Threshold': 'threshold', 'Group': 'subgroup'}
+        id_columns = [column for column in ids if column in table.columns]
+        rows = table.melt(id_vars=id_columns, var_name='metric', value_name='value').rename(columns=ids)
+    rows = rows.assign(check=check, attribute=attribute, privileged_groups=_groups_json(privileged_groups),
+                       unprivileged_groups=_groups_json(unprivileged_groups))
+    return rows.reindex(columns=RESULT_COLUMNS)
+
+
+class ResultsStore:
+    """
+    Long-format results table shared by every run.
+
+    Parameters:
+    path (str): SQLite file (.sqlite/.sqlite3/.db) or Parquet dataset directory (.parquet/.pq).
+    store_format (str, optional): 'sqlite' or 'parquet', overriding the extension. Defaults to None.
+    """
+
+    def __init__(self, path: str, store_format: str = None):
+        store_format = store_format or STORE_FORMATS_BY_EXTENSION.get(os.path.splitext(str(path))[1].lower())
+        if store_format not in ('sqlite', 'parquet'):
+            raise ValueError(f"Cannot tell the results store format of '{path}'. "
+                             f"Use one of the extensions {list(STORE_FORMATS_BY_EXTENSION)} or pass store_format.")
+        self.path = path
+        self.store_format = store_format
+
+    def append(self, results: pd.DataFrame, run_id: str = None, input_file: str = None, timestamp=None, content_hash: bool = False) -> str:
+        """
+        Append one run's results in a single write.
+
+        Parameters:
+        results (pd.DataFrame): Rows with the ``RESULT_COLUMNS``, e.g. concatenated ``long_format`` tables.
+        run_id (str, optional): Identifier of the run. Defaults to a new random id.
+        input_file (str, optional): The analysed input; its fingerprint (path, size, mtime) is stored too.
+        timestamp (optional): Time of the run (stored in UTC). Defaults to now.
+        content_hash (bool, optional): Include the input's contents in the fingerprint. Defaults to False.
+
+        Returns:
+        str: The run id.
+        """
+        run_id = run_id or uuid.uuid4().hex
+        rows = results.reindex(columns=RESULT_COLUMNS).assign(
+            run_id=run_id,
+            timestamp=_utc_iso(timestamp if timestamp is not None else datetime.datetime.now(datetime.timezone.utc)),
+            input_file=None if input_file is None else str(input_file),
+            input_fingerprint=None if input_file is None else file_fingerprint(input_file, content_hash),
+        )[COLUMNS]
+        for column in COLUMNS:
+            rows[column] = rows[column].astype(np.float64 if column in FLOAT_COLUMNS else object)
+        rows = rows.astype(object).where(rows.notna(), None)
+        if self.store_format == 'sqlite':
+            self._append_sqlite(rows)
+        else:
+            self._append_parquet(rows, run_id)
+        return run_id
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        columns = ', '.join(f'"{column}" {"REAL" if column in FLOAT_COLUMNS else "TEXT"}' for column in COLUMNS)
+        with connection:
+            connection.execute(f"CREATE TABLE IF NOT EXISTS results ({columns})")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_metric ON results (metric, attribute, timestamp)")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_run ON results (run_id)")
+        return connection
+
+    def _append_sqlite(self, rows: pd.DataFrame) -> None:
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(f"INSERT INTO results ({QUOTED_COLUMNS}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                                       rows.itertuples(index=False, name=None))
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _arrow():
+        try:
+            import pyarrow
+            import pyarrow.dataset
+            import pyarrow.parquet
+        except Exception as exc:  # pragma: no cover - dependency issue
+            raise ImportError("pyarrow is required for Parquet results stores. Install it with `pip install pyarrow`.") from exc
+        schema = pyarrow.schema([(column, pyarrow.float64() if column in FLOAT_COLUMNS else pyarrow.string()) for column in COLUMNS])
+        return pyarrow, schema
+
+    def _append_parquet(self, rows: pd.DataFrame, run_id: str) -> None:
+        pa, schema = self._arrow()
+        os.makedirs(self.path, exist_ok=True)
+        table = pa.Table.from_pandas(rows, schema=schema, preserve_index=False)
+        # The timestamp prefix keeps the files in run order; a temporary name keeps readers off partial files.
+        file_name = f"{rows['timestamp'].iloc[0] if len(rows) else _utc_iso(pd.Timestamp.now('UTC'))}_{run_id}"
+        file_name = ''.join(character if character.isalnum() or character in '-_' else '-' for character in file_name)
+        final_path = os.path.join(self.path, f"{file_name}.parquet")
+        tmp_path = os.path.join(self.path, f".{file_name}.parquet.tmp")
+        pa.parquet.write_table(table, tmp_path)
+        os.replace(tmp_path, final_path)
+
+    def query(self, metric=None, check=None, attribute=None, run_id=None, input_fingerprint=None, since=None, until=None, columns: list[str] = None) -> pd.DataFrame:
+        """
+        Rows matching every given filter, oldest first.
+
+        ``metric``, ``check``, ``attribute``, ``run_id`` and ``input_fingerprint``
+        each take a value or a list of values. ``since`` and ``until`` bound the
+        run timestamp (inclusive); naive times are taken as UTC. Only the
+        matching rows, and only ``columns`` (default: all), are read.
+
+        Returns:
+        pd.DataFrame: Matching rows.
+        """
+        columns = list(columns or COLUMNS)
+        filters = {name: [value] if isinstance(value, str) or not hasattr(value, '__iter__') else list(value)
+                   for name, value in (('metric', metric), ('check', check), ('attribute', attribute), ('run_id', run_id),
+                                       ('input_fingerprint', input_fingerprint)) if value is not None}
+        bounds = [(operator, _utc_iso(moment)) for operator, moment in (('>=', since), ('<=', until)) if moment is not None]
+        if self.store_format == 'sqlite':
+            if not os.path.exists(self.path):
+                return pd.DataFrame(columns=columns)
+            clauses = [f'"{name}" IN ({", ".join("?" * len(values))})' for name, values in filters.items()]
+            clauses += [f'timestamp {operator} ?' for operator, _ in bounds]
+            parameters = [value for values in filters.values() for value in values] + [moment for _, moment in bounds]
+            selected = ', '.join(f'"{column}"' for column in columns)
+            sql = f"SELECT {selected} FROM results{' WHERE ' + ' AND '.join(clauses) if clauses else ''} ORDER BY timestamp, rowid"
+            connection = self._connect()
+            try:
+                return pd.read_sql_query(sql, connection, params=parameters)
+            finally:
+                connection.close()
+
+        pa, schema = self._arrow()
+        if not os.path.isdir(self.path):
+            return pd.DataFrame(columns=columns)
+        field = pa.dataset.field
+        conditions = [field(name).isin(values) for name, values in filters.items()]
+        conditions += [COMPARISONS[operator](field('timestamp'), moment) for operator, moment in bounds]
+        expression = functools.reduce(operator_module.and_, conditions) if conditions else None
+        dataset = pa.dataset.dataset(self.path, schema=schema, format='parquet')
+        table = dataset.to_table(columns=sorted(set(columns) | {'timestamp'}, key=COLUMNS.index), filter=expression).to_pandas()
+        return table.sort_values('timestamp', kind='stable', ignore_index=True)[columns]
+
+    def runs(self) -> pd.DataFrame:
+        """One row per stored run: run_id, timestamp, input_file, input_fingerprint and its number of results."""
+        results = self.query(columns=RUN_COLUMNS)
+        return (results.groupby(RUN_COLUMNS, dropna=False, sort=False).size().rename('n_results').reset_index()
+                .sort_values('timestamp', kind='stable', ignore_index=True))
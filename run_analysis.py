@@ -2,9 +2,21 @@
 import yaml
 import argparse
 import os
-from bias_check import bias_check
-from fairness import fairness_check
-import pandas as pd # Will be needed soon
+from analysis_session import AnalysisSession, ApproximateAnalysis, StreamingAnalysis
+from dataset_cache import DatasetCache
+import profiling
+from results_store import ResultsStore, long_format
+import pandas as pd
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+CHECK_DESCRIPTIONS = {'bias_check': 'bias check', 'fairness_check': 'fairness check', 'threshold_sweep': 'threshold sweep'}
+
+# Session inherited by pool workers (see _init_worker).
+_worker_session = None
+_worker_profile = False
+_worker_collect = False
 
 def load_config(config_path):
     try:
@@ -18,6 +30,73 @@ def load_config(config_path):
         print(f"Error parsing YAML configuration file: {e}")
         return None
 
+def check_tables(session, check, attr_name, privileged_groups, unprivileged_groups, options=None):
+    """Results of one check for one protected attribute as long-format tables (see ``results_store.long_format``)."""
+    options = dict(options or {})
+    if check == 'threshold_sweep':
+        curves, roc = session.threshold_metrics(options['score_name'], [attr_name], privileged_groups, unprivileged_groups,
+                                                options.get('thresholds'))
+        tables = [('threshold_sweep', curves), ('threshold_roc', roc)]
+    else:
+        metrics = getattr(session, check.replace('_check', '_metrics'))
+        tables = [(check, metrics([attr_name], privileged_groups, unprivileged_groups, **options))]
+    return [long_format(table, name, attr_name, privileged_groups, unprivileged_groups) for name, table in tables]
+
+def run_check(session, check, attr_name, output_path, privileged_groups, unprivileged_groups, options=None, results=None):
+    """Run one check for one protected attribute and return its status line.
+
+    ``options`` holds extra keyword arguments for the check (e.g. bootstrap
+    settings). Errors are reported in the returned line rather than raised, so
+    one failing attribute never stops the others. If ``results`` (a list) is
+    given, the check's long-format tables are appended to it instead of being
+    written to ``output_path``.
+    """
+    description = CHECK_DESCRIPTIONS[check]
+    try:
+        with profiling.stage(check, check=check, attribute=attr_name):
+            if results is not None:
+                with profiling.stage('metrics'):
+                    results.extend(check_tables(session, check, attr_name, privileged_groups, unprivileged_groups, options))
+            else:
+                getattr(session, check)(
+                    output_file=output_path,
+                    protected_attribute_names=[attr_name], # checks expect a list
+                    privileged_groups=privileged_groups,
+                    unprivileged_groups=unprivileged_groups,
+                    **(options or {})
+                )
+        return f"  {description.capitalize()} for {attr_name} completed."
+    except Exception as e:
+        return f"  Error during {description} for {attr_name}: {e}"
+
+def _pool_context():
+    # Forked workers share the parent's loaded session read-only (copy-on-write)
+    # instead of re-parsing the input. Platforms without fork fall back to
+    # their default start method, which pickles the session once per worker.
+    # Off the main thread (analysis_server jobs) other threads may hold locks a
+    # forked child would inherit locked, so workers are spawned there instead.
+    if threading.current_thread() is not threading.main_thread():
+        return multiprocessing.get_context('spawn')
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+def _init_worker(session, profile=False, collect=False):
+    global _worker_session, _worker_profile, _worker_collect
+    _worker_session = session
+    _worker_profile = profile
+    _worker_collect = collect
+
+def _run_check_in_worker(*task):
+    """Run one check in a pool worker and return its status line, profiling records and collected results."""
+    results = [] if _worker_collect else None
+    if not _worker_profile:
+        return run_check(_worker_session, *task, results=results), [], results or []
+    # A fresh profiler per task; its records are merged into the parent's by run_config.
+    with profiling.Profiler() as profiler:
+        line = run_check(_worker_session, *task, results=results)
+    return line, profiler.records, results or []
+
 def main():
     parser = argparse.ArgumentParser(description="Run bias and fairness analysis based on a config file.")
     parser.add_argument(
@@ -26,6 +105,30 @@ def main():
         default='config_template.yaml',
         help='Path to the YAML configuration file (default: config_template.yaml)'
     )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='Number of worker processes for the per-attribute checks (default: the config\'s "jobs" key, or 1)'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Record wall time, CPU time, peak RSS and rows per stage, attribute and check, '
+             'and save them as JSON in the output directory (profile.json)'
+    )
+    parser.add_argument(
+        '--profile-stage',
+        type=str,
+        default=None,
+        help='With --profile, also capture this stage (e.g. read, dataset, metrics, write, bias_check) in depth'
+    )
+    parser.add_argument(
+        '--profile-capture',
+        choices=profiling.CAPTURE_MODES,
+        default='cprofile',
+        help='How --profile-stage is captured: cprofile (a .pstats file) or tracemalloc (default: cprofile)'
+    )
     args = parser.parse_args()
 
     config = load_config(args.config)
@@ -35,6 +138,38 @@ def main():
     print("Configuration loaded successfully.")
     # print(yaml.dump(config, indent=2)) # Optional: keep for debugging if desired
 
+    if not args.profile:
+        run_config(config, args.jobs)
+        return
+    run_profiled(config, args.jobs, args.profile_stage, args.profile_capture)
+
+def run_profiled(config, jobs=None, profile_stage=None, profile_capture='cprofile', sessions=None):
+    """
+    Run ``config`` under a ``profiling.Profiler`` and save the profile next to the reports.
+
+    ``profile_stage`` and ``profile_capture`` are those of ``--profile-stage``
+    and ``--profile-capture``; the other arguments are passed to ``run_config``.
+    Returns the path of the profile.
+    """
+    output_dir = config.get('output_directory', 'analysis_results')
+    profile_path = os.path.join(output_dir, config.get('output_filenames', {}).get('profile_report', 'profile.json'))
+    with profiling.Profiler(profile_stage, profile_capture) as profiler:
+        run_config(config, jobs, profile=True, sessions=sessions)
+    os.makedirs(output_dir, exist_ok=True)
+    profiler.write(profile_path)
+    print(f"Profile saved to {profile_path}")
+    return profile_path
+
+def run_config(config, jobs=None, profile=False, sessions=None):
+    """
+    Run every analysis configured in ``config`` (the parsed YAML), printing progress.
+
+    ``jobs`` overrides the config's ``jobs`` key. With ``profile``, pool
+    workers record their stages too and return them to the active profiler.
+    ``sessions`` (e.g. an ``analysis_server.SessionCache``) lends in-memory
+    sessions from earlier runs on the unchanged input; streaming runs never
+    use it.
+    """
     # General parameters
     input_file = config.get('input_file')
     output_dir = config.get('output_directory', 'analysis_results')
@@ -42,11 +177,31 @@ def main():
     label_name = analysis_params.get('label_name')
     favorable_label_value = analysis_params.get('favorable_label_value', 1.0)
     unfavorable_label_value = analysis_params.get('unfavorable_label_value', 0.0)
+    backend = analysis_params.get('backend', 'aif360')
+    chunksize = analysis_params.get('chunksize')
+    prediction_name = analysis_params.get('prediction_name')
+    score_name = analysis_params.get('score_name')
+    thresholds = analysis_params.get('thresholds')
+    # Optional approximate mode: bias and fairness metrics estimated from sampled blocks, with error bounds.
+    approximate_params = analysis_params.get('approximate')
+    if approximate_params is True:
+        approximate_params = {}
+    # Optional bootstrap confidence intervals for the scoring tables.
+    bootstrap_params = analysis_params.get('bootstrap') or {}
+    check_options = {}
+    if bootstrap_params.get('n_bootstrap'):
+        check_options = {
+            'n_bootstrap': bootstrap_params['n_bootstrap'],
+            'confidence_level': bootstrap_params.get('confidence_level', 0.95),
+            'random_state': bootstrap_params.get('random_state'),
+        }
 
     # Output filenames (optional from config)
     output_filenames = config.get('output_filenames', {})
     default_bias_report_name_template = "bias_metrics_{attribute_name}.csv"
     default_fairness_report_name_template = "fairness_metrics_{attribute_name}.csv"
+    default_threshold_report_name_template = "fairness_by_threshold_{attribute_name}.csv"
+    default_roc_report_name_template = "roc_{attribute_name}.csv"
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -56,63 +211,190 @@ def main():
         print("Error: 'input_file' and 'analysis_params.label_name' must be defined in the config.")
         return
 
-    protected_attributes_definitions = analysis_params.get('protected_attributes_definitions', [])
-    if not protected_attributes_definitions:
-        print("Warning: No 'protected_attributes_definitions' found in config. Nothing to analyze.")
-        return
+    # Optional single results table shared by every run instead of one CSV per attribute and check.
+    sink_config = config.get('output_sink') or {}
+    store = None
+    if sink_config.get('type', 'csv') != 'csv':
+        try:
+            store = ResultsStore(sink_config['path'], sink_config['type'])
+        except (KeyError, ValueError) as e:
+            print(f"Error: invalid 'output_sink' configuration: {e}")
+            return
+    results = [] if store is not None else None
+
+    def destination(path):
+        return f"Output will be saved to {path}" if store is None else f"Results will be appended to {store.path}"
 
     analyses_to_run = config.get('analyses_to_run', {})
     run_bias_check = analyses_to_run.get('bias_check', False)
     run_fairness_check = analyses_to_run.get('fairness_check', False)
+    run_threshold_sweep = analyses_to_run.get('threshold_sweep', False)
+    if run_threshold_sweep and not score_name:
+        print("Warning: 'threshold_sweep' requires 'analysis_params.score_name'. Skipping threshold sweeps.")
+        run_threshold_sweep = False
+    intersectional_params = analysis_params.get('intersectional') or {}
+    run_intersectional_check = analyses_to_run.get('intersectional_check', False) and bool(intersectional_params.get('attributes'))
+
+    protected_attributes_definitions = analysis_params.get('protected_attributes_definitions', [])
+    if not protected_attributes_definitions and not run_intersectional_check:
+        print("Warning: No 'protected_attributes_definitions' found in config. Nothing to analyze.")
+        return
 
+    # Parse and validate the input once; every attribute and check below reuses it.
+    try:
+        with profiling.stage('load'):
+            if isinstance(approximate_params, dict):
+                session = ApproximateAnalysis(input_file, label_name, favorable_label_value, unfavorable_label_value, chunksize or 100_000,
+                                              prediction_name=prediction_name,
+                                              tolerance=approximate_params.get('tolerance'),
+                                              confidence_level=approximate_params.get('confidence_level', 0.95),
+                                              min_group_rows=approximate_params.get('min_group_rows', 1000),
+                                              rows_per_group=approximate_params.get('rows_per_group', 100_000),
+                                              n_bootstrap=approximate_params.get('n_bootstrap', 200),
+                                              random_state=approximate_params.get('random_state'))
+            elif chunksize:
+                session = StreamingAnalysis(input_file, label_name, favorable_label_value, unfavorable_label_value, chunksize,
+                                            prediction_name=prediction_name)
+            else:
+                # Only the label and the configured protected attributes are read from the input.
+                needed_columns = [attr_def.get('name') for attr_def in protected_attributes_definitions if attr_def.get('name')]
+                if run_intersectional_check:
+                    needed_columns += list(intersectional_params['attributes'])
+                if run_threshold_sweep:
+                    needed_columns.append(score_name)
+                cache_config = config.get('cache')
+                cache = None
+                if cache_config:
+                    cache = DatasetCache(cache_config.get('directory', '.fairness_cache'),
+                                         max_bytes=int(cache_config.get('max_size_mb', 10240) * 1024 * 1024),
+                                         content_hash=cache_config.get('content_hash', False))
+                def load_session():
+                    return AnalysisSession.from_file(input_file, label_name, favorable_label_value, unfavorable_label_value, backend,
+                                                     columns=needed_columns, cache=cache, prediction_name=prediction_name)
+                if sessions is None:
+                    session = load_session()
+                else:
+                    session = sessions.get(input_file, (label_name, favorable_label_value, unfavorable_label_value, backend, prediction_name),
+                                           load_session)
+    except Exception as e:
+        print(f"Error loading input file {input_file}: {e}")
+        return
+
+    if isinstance(session, StreamingAnalysis):
+        # Register every definition up front so a single pass over the input serves them all.
+        # Invalid definitions are reported by the per-attribute checks below.
+        for attr_def in protected_attributes_definitions:
+            try:
+                session.register([attr_def.get('name')], attr_def.get('privileged_groups'), attr_def.get('unprivileged_groups'))
+            except ValueError:
+                pass
+
+    jobs = jobs or config.get('jobs', 1)
+
+    # Plan every (attribute, check) task first so results can be reported in config order
+    # regardless of the order in which parallel workers finish.
+    plan = []
     for attr_def in protected_attributes_definitions:
         attr_name = attr_def.get('name')
         privileged_groups = attr_def.get('privileged_groups')
         unprivileged_groups = attr_def.get('unprivileged_groups')
 
         if not attr_name or not privileged_groups or not unprivileged_groups:
-            print(f"Warning: Skipping attribute definition due to missing 'name', 'privileged_groups', or 'unprivileged_groups': {attr_def}")
+            plan.append((f"Warning: Skipping attribute definition due to missing 'name', 'privileged_groups', or 'unprivileged_groups': {attr_def}", []))
             continue
 
-        print(f"\nProcessing protected attribute: {attr_name}")
-
+        tasks = []
         if run_bias_check:
             bias_output_filename = output_filenames.get('bias_report', default_bias_report_name_template).format(attribute_name=attr_name)
             bias_output_path = os.path.join(output_dir, bias_output_filename)
-            print(f"  Running bias check... Output will be saved to {bias_output_path}")
-            try:
-                bias_check(
-                    input_file=input_file,
-                    output_file=bias_output_path,
-                    label_name=label_name,
-                    protected_attribute_names=[attr_name], # bias_check expects a list
-                    privileged_groups=privileged_groups,
-                    unprivileged_groups=unprivileged_groups,
-                    favorable_label_value=favorable_label_value,
-                    unfavorable_label_value=unfavorable_label_value
-                )
-                print(f"  Bias check for {attr_name} completed.")
-            except Exception as e:
-                print(f"  Error during bias check for {attr_name}: {e}")
+            tasks.append((f"  Running bias check... {destination(bias_output_path)}",
+                          ('bias_check', attr_name, bias_output_path, privileged_groups, unprivileged_groups, check_options)))
 
         if run_fairness_check:
             fairness_output_filename = output_filenames.get('fairness_report', default_fairness_report_name_template).format(attribute_name=attr_name)
             fairness_output_path = os.path.join(output_dir, fairness_output_filename)
-            print(f"  Running fairness check... Output will be saved to {fairness_output_path}")
-            try:
-                fairness_check(
-                    input_file=input_file,
-                    output_file=fairness_output_path,
-                    label_name=label_name,
-                    protected_attribute_names=[attr_name], # fairness_check expects a list
-                    privileged_groups=privileged_groups,
-                    unprivileged_groups=unprivileged_groups,
-                    favorable_label_value=favorable_label_value,
-                    unfavorable_label_value=unfavorable_label_value
-                )
-                print(f"  Fairness check for {attr_name} completed.")
-            except Exception as e:
-                print(f"  Error during fairness check for {attr_name}: {e}")
+            tasks.append((f"  Running fairness check... {destination(fairness_output_path)}",
+                          ('fairness_check', attr_name, fairness_output_path, privileged_groups, unprivileged_groups, check_options)))
+
+        if run_threshold_sweep:
+            threshold_output_filename = output_filenames.get('threshold_report', default_threshold_report_name_template).format(attribute_name=attr_name)
+            threshold_output_path = os.path.join(output_dir, threshold_output_filename)
+            roc_output_filename = output_filenames.get('roc_report', default_roc_report_name_template).format(attribute_name=attr_name)
+            sweep_options = {'score_name': score_name, 'thresholds': thresholds,
+                             'roc_output_file': os.path.join(output_dir, roc_output_filename)}
+            tasks.append((f"  Running threshold sweep... {destination(threshold_output_path)}",
+                          ('threshold_sweep', attr_name, threshold_output_path, privileged_groups, unprivileged_groups, sweep_options)))
+
+        plan.append((f"\nProcessing protected attribute: {attr_name}", tasks))
+
+    executor = None
+    futures = {}
+    if jobs > 1:
+        if isinstance(session, StreamingAnalysis):
+            # Finish the single streaming pass in the parent; workers only finalize counts.
+            session.run()
+        executor = ProcessPoolExecutor(max_workers=jobs, mp_context=_pool_context(),
+                                       initializer=_init_worker, initargs=(session, profile, store is not None))
+        for _, tasks in plan:
+            for _, task in tasks:
+                futures[id(task)] = executor.submit(_run_check_in_worker, *task)
+
+    try:
+        for header, tasks in plan:
+            print(header)
+            for announcement, task in tasks:
+                print(announcement)
+                if executor is None:
+                    print(run_check(session, *task, results=results))
+                    continue
+                try:
+                    line, records, tables = futures[id(task)].result()
+                    if profile:
+                        profiling.active_profiler().extend(records)
+                    if results is not None:
+                        results.extend(tables)
+                    print(line)
+                except Exception as e: # e.g. a worker process died
+                    check, attr_name = task[0], task[1]
+                    print(f"  Error during {CHECK_DESCRIPTIONS[check]} for {attr_name}: {e}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if isinstance(session, ApproximateAnalysis) and session.rows_read:
+        print(f"\nApproximate mode: {session.describe()}")
+
+    if run_intersectional_check:
+        # One table for every subgroup of the attribute lattice, from a single pass of cell counts.
+        intersectional_output_path = os.path.join(output_dir, output_filenames.get('intersectional_report', 'intersectional_metrics.csv'))
+        print(f"\nRunning intersectional check... {destination(intersectional_output_path)}")
+        intersectional_attributes = list(intersectional_params['attributes'])
+        intersectional_options = {'min_support': intersectional_params.get('min_support', 30),
+                                  'mode': intersectional_params.get('mode', 'cube')}
+        try:
+            with profiling.stage('intersectional_check', check='intersectional_check'):
+                if results is not None:
+                    with profiling.stage('metrics'):
+                        table = session.intersectional_metrics(intersectional_attributes, **intersectional_options)
+                    results.append(long_format(table, 'intersectional_check', ','.join(intersectional_attributes)))
+                else:
+                    session.intersectional_check(output_file=intersectional_output_path,
+                                                 protected_attribute_names=intersectional_attributes, **intersectional_options)
+            print("  Intersectional check completed.")
+        except Exception as e:
+            print(f"  Error during intersectional check: {e}")
+
+    if results:
+        # Every table of the run goes to the store in one batched write.
+        try:
+            with profiling.stage('write', file=str(store.path)) as record:
+                table = pd.concat(results, ignore_index=True)
+                run_id = store.append(table, run_id=sink_config.get('run_id'), input_file=input_file,
+                                      content_hash=sink_config.get('content_hash', False))
+                record['rows'] = len(table)
+            print(f"\nAppended {len(table)} results to {store.path} (run {run_id}).")
+        except Exception as e:
+            print(f"\nError writing results to {store.path}: {e}")
 
     print("\nAnalysis run complete.")
 
@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 import pandas as pd
 from bias_check import bias_check
 from fairness import fairness_check # Corrected import
@@ -7,7 +8,10 @@ import os # Added for potential cleanup, though not strictly used in this diff
 class TestBiasCheck(unittest.TestCase):
     def test_bias_check(self):
         input_file = 'sample_test_data_sex.csv' # Use static test data
-        output_file = 'test_output.csv'
+        import tempfile
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        output_file = os.path.join(tmp_dir.name, 'test_output.csv')
         
         # Run the bias check function
         bias_check(
@@ -42,7 +46,10 @@ class TestBiasCheck(unittest.TestCase):
 class TestFairnessCheck(unittest.TestCase):
     def test_fairness_check(self):
         input_file = 'sample_test_data_sex.csv' # Use static test data
-        output_file = 'test_output.csv'
+        import tempfile
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        output_file = os.path.join(tmp_dir.name, 'test_output.csv')
         
         # Run the fairness check function
         fairness_check( # Corrected function call
@@ -419,3 +426,1545 @@ class TestMitigationTechniques(unittest.TestCase):
         finally: # Ensure cleanup
             if os.path.exists(output_file_test):
                 os.remove(output_file_test)
+
+class TestAnalysisSession(unittest.TestCase):
+    def setUp(self):
+        self.input_file = 'sample_test_data_sex.csv'
+        self.group_params = {
+            'protected_attribute_names': ['sex'],
+            'privileged_groups': [{'sex': 1}],
+            'unprivileged_groups': [{'sex': 0}],
+        }
+
+    def test_session_matches_file_functions(self):
+        from analysis_session import AnalysisSession
+
+        session = AnalysisSession.from_file(self.input_file, 'outcome')
+        output_file = 'test_session_output.csv'
+        try:
+            bias_check(input_file=self.input_file, output_file=output_file, label_name='outcome', **self.group_params)
+            expected_bias = pd.read_csv(output_file)
+            fairness_check(input_file=self.input_file, output_file=output_file, label_name='outcome', **self.group_params)
+            expected_fairness = pd.read_csv(output_file)
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+        bias_df = session.bias_metrics(**self.group_params)
+        fairness_df = session.fairness_metrics(**self.group_params)
+        pd.testing.assert_series_equal(bias_df['Score'], expected_bias['Score'], check_names=False)
+        pd.testing.assert_series_equal(fairness_df['Score'], expected_fairness['Score'], check_names=False)
+
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            feather_file = os.path.join(tmp_dir, 'fairness.feather')
+            session.fairness_check(feather_file, **self.group_params)
+            pd.testing.assert_frame_equal(pd.read_feather(feather_file), fairness_df)
+
+    def test_session_shares_datasets_and_masks(self):
+        from analysis_session import AnalysisSession
+
+        session = AnalysisSession.from_file(self.input_file, 'outcome')
+        self.assertIs(session.binary_label_dataset(['sex']), session.binary_label_dataset(['sex']))
+        mask = session.group_mask([{'sex': 0}])
+        self.assertIs(mask, session.group_mask([{'sex': 0}]))
+        self.assertEqual(int(mask.sum()), 4)
+
+    def test_session_validates_label_once(self):
+        from analysis_session import AnalysisSession
+
+        with self.assertRaisesRegex(ValueError, "Label name 'missing' not found"):
+            AnalysisSession.from_file(self.input_file, 'missing')
+        session = AnalysisSession.from_file(self.input_file, 'outcome')
+        with self.assertRaisesRegex(ValueError, "Protected attribute name 'race' not found"):
+            session.bias_metrics(['race'], [{'race': 1}], [{'race': 0}])
+
+class TestNativeBackend(unittest.TestCase):
+    def setUp(self):
+        df = pd.read_csv('sample_data/sample_data_adult_binary.csv').dropna()
+        self.df = pd.DataFrame({
+            'sex': (df['sex'] == 'Male').astype(int),
+            'race': (df['race'] == 'White').astype(int),
+            'income-label': df['income-label'],
+        })
+        self.definitions = [
+            (['sex'], [{'sex': 1}], [{'sex': 0}]),
+            (['race'], [{'race': 1}], [{'race': 0}]),
+            (['sex', 'race'], [{'sex': 1, 'race': 1}], [{'sex': 0}, {'race': 0}]),
+        ]
+
+    def test_native_matches_aif360_on_labels(self):
+        from analysis_session import AnalysisSession
+
+        aif = AnalysisSession(self.df, 'income-label', backend='aif360')
+        native = AnalysisSession(self.df, 'income-label', backend='native')
+        for names, priv, unpriv in self.definitions:
+            for method in ('bias_metrics', 'fairness_metrics'):
+                expected = getattr(aif, method)(names, priv, unpriv)
+                actual = getattr(native, method)(names, priv, unpriv)
+                self.assertEqual(actual['Metric'].tolist(), expected['Metric'].tolist())
+                np.testing.assert_allclose(actual['Score'], expected['Score'], equal_nan=True, err_msg=f"{method} {names}")
+
+    def test_native_counts_match_classification_metric(self):
+        from aif360.datasets import BinaryLabelDataset
+        from aif360.metrics import ClassificationMetric
+        import native_metrics
+
+        rng = np.random.default_rng(0)
+        df = self.df.copy()
+        predictions = rng.integers(0, 2, len(df))
+        dataset_true = BinaryLabelDataset(df=df, label_names=['income-label'], protected_attribute_names=['sex'])
+        dataset_pred = dataset_true.copy()
+        dataset_pred.labels = predictions.reshape(-1, 1).astype(float)
+        metric = ClassificationMetric(dataset_true, dataset_pred, unprivileged_groups=[{'sex': 0}], privileged_groups=[{'sex': 1}])
+        expected = [
+            metric.accuracy(), (metric.true_positive_rate() + metric.true_negative_rate()) / 2,
+            metric.statistical_parity_difference(), metric.equal_opportunity_difference(),
+            metric.equalized_odds_difference(), metric.false_positive_rate_difference(),
+            metric.false_negative_rate_difference(),
+        ]
+
+        group_codes = native_metrics.encode_groups(df['sex'].to_numpy() == 0, df['sex'].to_numpy() == 1)
+        label_codes = native_metrics.encode_binary_labels(df['income-label'].to_numpy(), 'income-label', 1.0, 0.0)
+        counts = native_metrics.confusion_counts(group_codes, label_codes, predictions)
+        np.testing.assert_allclose(native_metrics.fairness_table(counts)['Score'], expected)
+
+    def test_native_backend_through_file_functions(self):
+        output_file = 'test_native_output.csv'
+        try:
+            bias_check(input_file='sample_test_data_sex.csv', output_file=output_file, label_name='outcome',
+                       protected_attribute_names=['sex'], privileged_groups=[{'sex': 1}],
+                       unprivileged_groups=[{'sex': 0}], backend='native')
+            output_data = pd.read_csv(output_file)
+            di = output_data.loc[output_data['Metric'] == 'Disparate Impact', 'Score'].iloc[0]
+            self.assertAlmostEqual(di, 3.0, places=5)
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    def test_invalid_backend(self):
+        from analysis_session import AnalysisSession
+
+        with self.assertRaisesRegex(ValueError, "backend must be one of"):
+            AnalysisSession(self.df, 'income-label', backend='spark')
+
+class TestStreamingAnalysis(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        n = 1037
+        self.input_file = 'test_streaming_input.csv'
+        pd.DataFrame({
+            'feature': rng.normal(size=n),
+            'sex': rng.integers(0, 2, n),
+            'race': rng.choice(['W', 'B', 'A'], n),
+            'outcome': rng.integers(0, 2, n),
+        }).to_csv(self.input_file, index=False)
+        self.definitions = [
+            (['sex'], [{'sex': 1}], [{'sex': 0}]),
+            (['race'], [{'race': 'W'}], [{'race': 'B'}, {'race': 'A'}]),
+        ]
+
+    def tearDown(self):
+        if os.path.exists(self.input_file):
+            os.remove(self.input_file)
+
+    def test_streaming_matches_in_memory(self):
+        from analysis_session import AnalysisSession, StreamingAnalysis
+
+        session = AnalysisSession.from_file(self.input_file, 'outcome', backend='native')
+        streaming = StreamingAnalysis(self.input_file, 'outcome', chunksize=100)
+        for names, priv, unpriv in self.definitions:
+            streaming.register(names, priv, unpriv)
+        for names, priv, unpriv in self.definitions:
+            pd.testing.assert_frame_equal(streaming.bias_metrics(names, priv, unpriv), session.bias_metrics(names, priv, unpriv))
+            pd.testing.assert_frame_equal(streaming.fairness_metrics(names, priv, unpriv), session.fairness_metrics(names, priv, unpriv))
+            np.testing.assert_array_equal(streaming.confusion_counts(names, priv, unpriv), session.confusion_counts(names, priv, unpriv))
+
+    def test_streaming_file_function(self):
+        output_file = 'test_streaming_output.csv'
+        try:
+            fairness_check(input_file=self.input_file, output_file=output_file, label_name='outcome',
+                           protected_attribute_names=['sex'], privileged_groups=[{'sex': 1}],
+                           unprivileged_groups=[{'sex': 0}], chunksize=64)
+            self.assertEqual(len(pd.read_csv(output_file)), 7)
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    def test_streaming_validation(self):
+        from analysis_session import StreamingAnalysis
+
+        with self.assertRaisesRegex(ValueError, "Label name 'missing' not found"):
+            StreamingAnalysis(self.input_file, 'missing', chunksize=100)
+        streaming = StreamingAnalysis(self.input_file, 'outcome', favorable_label_value=1, unfavorable_label_value=0, chunksize=100)
+        with self.assertRaisesRegex(ValueError, "Key 'wrong_key' in privileged_groups"):
+            streaming.bias_metrics(['sex'], [{'wrong_key': 1}], [{'sex': 0}])
+        pd.DataFrame({'outcome': [1, 1, 1], 'sex': [0, 1, 0]}).to_csv(self.input_file, index=False)
+        streaming = StreamingAnalysis(self.input_file, 'outcome', chunksize=2)
+        with self.assertRaisesRegex(ValueError, "Unfavorable label value '0.0' not found"):
+            streaming.bias_metrics(['sex'], [{'sex': 1}], [{'sex': 0}])
+
+class TestFairnessAccumulator(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        n = 600
+        self.df = pd.DataFrame({
+            'sex': rng.integers(0, 2, n),
+            'outcome': rng.integers(0, 2, n),
+        })
+        self.params = (['sex'], [{'sex': 1}], [{'sex': 0}])
+        self.files = []
+
+    def tearDown(self):
+        for path in self.files:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_sharded_accumulators_merge_to_full_result(self):
+        from analysis_session import AnalysisSession
+        from native_metrics import FairnessAccumulator
+
+        full = AnalysisSession(self.df, 'outcome', backend='native')
+        shards = [AnalysisSession(part, 'outcome').accumulator(*self.params)
+                  for part in (self.df.iloc[:150], self.df.iloc[150:420], self.df.iloc[420:])]
+        merged = FairnessAccumulator.merge_all(shards)
+        self.assertEqual(merged.num_rows, len(self.df))
+        pd.testing.assert_frame_equal(merged.bias_table(), full.bias_metrics(*self.params))
+        pd.testing.assert_frame_equal(merged.fairness_table(), full.fairness_metrics(*self.params))
+        # Merging is associative.
+        np.testing.assert_array_equal((shards[0] + shards[1] + shards[2]).counts, (shards[0] + (shards[1] + shards[2])).counts)
+
+    def test_accumulator_file_round_trip(self):
+        from native_metrics import FairnessAccumulator
+
+        input_file = 'test_accumulator_input.csv'
+        accumulator_file = 'test_accumulator.npz'
+        self.files += [input_file, accumulator_file]
+        self.df.to_csv(input_file, index=False)
+        bias_check(input_file=input_file, output_file=None, label_name='outcome',
+                   protected_attribute_names=['sex'], privileged_groups=[{'sex': 1}],
+                   unprivileged_groups=[{'sex': 0}], accumulator_file=accumulator_file)
+        loaded = FairnessAccumulator.load(accumulator_file)
+        self.assertEqual(loaded.privileged_groups, [{'sex': 1}])
+        self.assertEqual(loaded.num_rows, len(self.df))
+
+    def test_merge_rejects_different_definitions(self):
+        from native_metrics import FairnessAccumulator
+
+        a = FairnessAccumulator('outcome', ['sex'], [{'sex': 1}], [{'sex': 0}])
+        b = FairnessAccumulator('outcome', ['sex'], [{'sex': 0}], [{'sex': 1}])
+        with self.assertRaisesRegex(ValueError, "Cannot merge accumulators"):
+            a.merge(b)
+
+class TestRunAnalysisParallel(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config = {
+            'input_file': 'sample_test_data_sex.csv',
+            'analysis_params': {
+                'label_name': 'outcome',
+                'protected_attributes_definitions': [
+                    {'name': 'sex', 'privileged_groups': [{'sex': 1}], 'unprivileged_groups': [{'sex': 0}]},
+                    {'name': 'missing', 'privileged_groups': [{'missing': 1}], 'unprivileged_groups': [{'missing': 0}]},
+                ],
+            },
+            'analyses_to_run': {'bias_check': True, 'fairness_check': True},
+        }
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _run(self, jobs):
+        import contextlib
+        import io
+        import sys
+        import yaml
+        import run_analysis
+
+        output_dir = os.path.join(self.tmp_dir, f'jobs{jobs}')
+        config_path = os.path.join(self.tmp_dir, f'config{jobs}.yaml')
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(dict(self.config, output_directory=output_dir), f)
+        stdout = io.StringIO()
+        argv = sys.argv
+        sys.argv = ['run_analysis.py', '--config', config_path, '--jobs', str(jobs)]
+        try:
+            with contextlib.redirect_stdout(stdout):
+                run_analysis.main()
+        finally:
+            sys.argv = argv
+        return output_dir, stdout.getvalue().replace(output_dir, '<out>')
+
+    def test_parallel_matches_sequential(self):
+        sequential_dir, sequential_log = self._run(1)
+        parallel_dir, parallel_log = self._run(2)
+        self.assertEqual(sequential_log, parallel_log)
+        self.assertIn("Error during bias check for missing", parallel_log)
+        for name in ('bias_metrics_sex.csv', 'fairness_metrics_sex.csv'):
+            pd.testing.assert_frame_equal(pd.read_csv(os.path.join(sequential_dir, name)),
+                                          pd.read_csv(os.path.join(parallel_dir, name)))
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+
+@unittest.skipUnless(HAVE_PYARROW, "pyarrow is not installed")
+class TestColumnarInput(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        self.df = pd.read_csv('sample_test_data_sex.csv')
+        self.group_params = {
+            'label_name': 'outcome',
+            'protected_attribute_names': ['sex'],
+            'privileged_groups': [{'sex': 1}],
+            'unprivileged_groups': [{'sex': 0}],
+        }
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def test_checks_accept_columnar_formats(self):
+        import data_io
+
+        expected_file = self._path('expected.csv')
+        fairness_check(input_file='sample_test_data_sex.csv', output_file=expected_file, **self.group_params)
+        expected = pd.read_csv(expected_file)
+        for name in ('input.parquet', 'input.feather', 'input.arrow'):
+            input_file = self._path(name)
+            data_io.write_table(self.df, input_file)
+            output_file = self._path(name + '.out.csv')
+            fairness_check(input_file=input_file, output_file=output_file, **self.group_params)
+            pd.testing.assert_frame_equal(pd.read_csv(output_file), expected)
+            fairness_check(input_file=input_file, output_file=output_file, chunksize=3, **self.group_params)
+            pd.testing.assert_frame_equal(pd.read_csv(output_file), expected)
+
+    def test_session_reads_only_needed_columns(self):
+        import data_io
+        from analysis_session import AnalysisSession
+
+        input_file = self._path('input.parquet')
+        data_io.write_table(self.df, input_file)
+        session = AnalysisSession.from_file(input_file, 'outcome', columns=['sex'])
+        self.assertEqual(sorted(session.input_df.columns), ['outcome', 'sex'])
+        self.assertIn('feature1', session.columns)
+        # Columns outside the projection are loaded on demand.
+        session.bias_metrics(['feature1'], [{'feature1': 10}], [{'feature1': 12}])
+        self.assertIn('feature1', session.input_df.columns)
+        with self.assertRaisesRegex(ValueError, "Protected attribute name 'race' not found"):
+            session.bias_metrics(['race'], [{'race': 1}], [{'race': 0}])
+
+    def test_reweighing_reads_and_writes_parquet(self):
+        import data_io
+        from mitigation_techniques import apply_reweighing
+
+        input_file = self._path('input.parquet')
+        output_file = self._path('reweighed.parquet')
+        data_io.write_table(self.df, input_file)
+        apply_reweighing(input_file=input_file, output_file=output_file, **self.group_params)
+        self.assertIn('instance_weights', pd.read_parquet(output_file).columns)
+
+class TestDatasetCache(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.tmp_dir, 'input.csv')
+        pd.DataFrame({
+            'feature': [1.5, 2.5, 3.5, 4.5, 5.5, 6.5],
+            'race': ['W', 'B', 'W', None, 'B', 'W'],
+            'outcome': [1, 0, 1, 0, 1, 0],
+        }).to_csv(self.input_file, index=False)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_second_read_is_served_from_cache(self):
+        from unittest import mock
+        from dataset_cache import DatasetCache
+        from analysis_session import AnalysisSession
+
+        cache = DatasetCache(os.path.join(self.tmp_dir, 'cache'))
+        first = AnalysisSession.from_file(self.input_file, 'outcome', backend='native', columns=['race'], cache=cache)
+        expected = first.bias_metrics(['race'], [{'race': 'W'}], [{'race': 'B'}])
+        with mock.patch('data_io.read_table', side_effect=AssertionError("input was re-parsed")):
+            second = AnalysisSession.from_file(self.input_file, 'outcome', backend='native', columns=['race'], cache=cache)
+            pd.testing.assert_frame_equal(second.bias_metrics(['race'], [{'race': 'W'}], [{'race': 'B'}]), expected)
+        self.assertTrue(pd.isna(second.input_df['race'].iloc[3]))
+
+    def test_changed_input_invalidates_entry(self):
+        from dataset_cache import DatasetCache
+
+        cache = DatasetCache(os.path.join(self.tmp_dir, 'cache'))
+        key = cache.fingerprint(self.input_file)
+        cache.read_table(self.input_file, ['outcome'])
+        pd.DataFrame({'outcome': [0, 0, 1]}).to_csv(self.input_file, index=False)
+        os.utime(self.input_file, ns=(0, 10 ** 18))
+        self.assertNotEqual(cache.fingerprint(self.input_file), key)
+        self.assertEqual(cache.read_table(self.input_file, ['outcome'])['outcome'].tolist(), [0, 0, 1])
+
+    def test_lru_eviction_respects_size_cap(self):
+        from dataset_cache import DatasetCache
+
+        other_file = os.path.join(self.tmp_dir, 'other.csv')
+        pd.read_csv(self.input_file).to_csv(other_file, index=False)
+        cache = DatasetCache(os.path.join(self.tmp_dir, 'cache'), max_bytes=1)
+        cache.read_table(self.input_file)
+        cache.read_table(other_file)
+        entries = os.listdir(cache.cache_dir)
+        self.assertEqual(entries, [cache.fingerprint(other_file)])
+
+class TestIntersectional(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        self.df = pd.read_csv('sample_data/sample_data_adult_binary.csv').dropna()[['sex', 'race', 'income-label']]
+        self.input_file = os.path.join(self.tmp_dir, 'adult.csv')
+        self.df.to_csv(self.input_file, index=False)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _lattice(self, **kwargs):
+        from intersectional import cell_counts, subgroup_lattice
+
+        cells = cell_counts(self.df, ['sex', 'race'], 'income-label')
+        return subgroup_lattice(cells, ['sex', 'race'], **kwargs)
+
+    def test_subgroups_match_explicit_definitions(self):
+        from analysis_session import AnalysisSession
+
+        lattice = self._lattice(min_support=1)
+        session = AnalysisSession(self.df, 'income-label', backend='native')
+        races = self.df['race'].unique().tolist()
+        cases = [
+            ('sex=Female', [{'sex': 'Female'}], [{'sex': 'Male'}]),
+            ('sex=Female & race=Black', [{'sex': 'Female', 'race': 'Black'}],
+             [{'sex': 'Male'}] + [{'race': race} for race in races if race != 'Black']),
+        ]
+        for subgroup, unpriv, priv in cases:
+            rows = lattice[lattice['Subgroup'] == subgroup].set_index('Metric')['Score']
+            names = sorted({key for group in unpriv + priv for key in group})
+            expected = pd.concat([session.bias_metrics(names, priv, unpriv), session.fairness_metrics(names, priv, unpriv)])
+            for metric, score in zip(expected['Metric'], expected['Score']):
+                if metric in rows:
+                    np.testing.assert_allclose(rows[metric], score, equal_nan=True, err_msg=f"{subgroup} {metric}")
+
+    def test_cube_rollup_and_min_support(self):
+        cube = self._lattice(min_support=1)
+        self.assertEqual(sorted(cube['Level'].unique()), [0, 1, 2])
+        self.assertEqual(cube.loc[cube['Level'] == 0, 'Support'].iloc[0], len(self.df))
+        self.assertIn('race=Black', cube['Subgroup'].tolist())
+        self.assertTrue(cube.loc[cube['Level'] == 1, 'sex'].isna().any()) # race marginals roll sex up
+
+        rollup = self._lattice(min_support=1, mode='rollup')
+        self.assertFalse(rollup.loc[rollup['Level'] == 1, 'sex'].isna().any())
+
+        pruned = self._lattice(min_support=50)
+        self.assertTrue((pruned['Support'] >= 50).all())
+        self.assertLess(pruned['Subgroup'].nunique(), cube['Subgroup'].nunique())
+
+        with self.assertRaisesRegex(ValueError, "mode must be one of"):
+            self._lattice(mode='grouping_sets')
+
+    def test_chunked_file_matches_in_memory(self):
+        from intersectional import intersectional_check
+
+        output_file = os.path.join(self.tmp_dir, 'intersectional.csv')
+        intersectional_check(self.input_file, output_file, 'income-label', ['sex', 'race'], min_support=5, chunksize=7)
+        expected = self._lattice(min_support=5)
+        actual = pd.read_csv(output_file)
+        np.testing.assert_allclose(actual['Score'], expected['Score'], equal_nan=True)
+        self.assertEqual(actual['Subgroup'].tolist(), expected['Subgroup'].tolist())
+
+    def test_run_analysis_intersectional_check(self):
+        import contextlib
+        import io
+        import sys
+        import yaml
+        import run_analysis
+
+        config_path = os.path.join(self.tmp_dir, 'config.yaml')
+        output_dir = os.path.join(self.tmp_dir, 'out')
+        with open(config_path, 'w') as f:
+            yaml.safe_dump({
+                'input_file': self.input_file,
+                'output_directory': output_dir,
+                'analysis_params': {'label_name': 'income-label',
+                                    'intersectional': {'attributes': ['sex', 'race'], 'min_support': 5}},
+                'analyses_to_run': {'intersectional_check': True},
+            }, f)
+        argv = sys.argv
+        sys.argv = ['run_analysis.py', '--config', config_path]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                run_analysis.main()
+        finally:
+            sys.argv = argv
+        self.assertIn("Intersectional check completed.", stdout.getvalue())
+        output = pd.read_csv(os.path.join(output_dir, 'intersectional_metrics.csv'))
+        self.assertIn('sex=Male & race=White', output['Subgroup'].tolist())
+
+class TestBootstrapIntervals(unittest.TestCase):
+    def setUp(self):
+        df = pd.read_csv('sample_data/sample_data_adult_binary.csv').dropna()
+        self.df = pd.DataFrame({'sex': (df['sex'] == 'Male').astype(int), 'income-label': df['income-label']})
+        self.definition = (['sex'], [{'sex': 1}], [{'sex': 0}])
+
+    def test_intervals_added_and_reproducible(self):
+        from analysis_session import AnalysisSession
+
+        session = AnalysisSession(self.df, 'income-label', backend='native')
+        first = session.fairness_metrics(*self.definition, n_bootstrap=200, random_state=7)
+        second = session.fairness_metrics(*self.definition, n_bootstrap=200, random_state=7)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(first.columns.tolist(), ['Metric', 'Score', 'CI Lower', 'CI Upper', 'Std Error'])
+        dpd = first.set_index('Metric').loc['Demographic Parity Difference']
+        self.assertLessEqual(dpd['CI Lower'], dpd['Score'])
+        self.assertGreaterEqual(dpd['CI Upper'], dpd['Score'])
+        self.assertEqual(session.fairness_metrics(*self.definition).columns.tolist(), ['Metric', 'Score'])
+
+    def test_standard_error_matches_analytic(self):
+        import native_metrics
+
+        rng = np.random.default_rng(0)
+        n = 5000
+        group = rng.integers(0, 2, n)
+        labels = (rng.random(n) < np.where(group == 1, 0.6, 0.4)).astype(np.intp)
+        counts = native_metrics.confusion_counts(native_metrics.encode_groups(group == 0, group == 1), labels, labels)
+        table = native_metrics.bias_table(counts, n_bootstrap=4000, random_state=1)
+        spd = table.set_index('Metric').loc['Statistical Parity Difference']
+        p0, n0 = labels[group == 0].mean(), (group == 0).sum()
+        p1, n1 = labels[group == 1].mean(), (group == 1).sum()
+        expected = np.sqrt(p0 * (1 - p0) / n0 + p1 * (1 - p1) / n1)
+        self.assertAlmostEqual(spd['Std Error'], expected, delta=0.1 * expected)
+
+    def test_backends_and_streaming_agree(self):
+        from analysis_session import AnalysisSession, StreamingAnalysis
+        import tempfile
+
+        native = AnalysisSession(self.df, 'income-label', backend='native').bias_metrics(*self.definition, n_bootstrap=100, random_state=3)
+        aif = AnalysisSession(self.df, 'income-label', backend='aif360').bias_metrics(*self.definition, n_bootstrap=100, random_state=3)
+        np.testing.assert_allclose(aif[['CI Lower', 'CI Upper', 'Std Error']], native[['CI Lower', 'CI Upper', 'Std Error']])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, 'adult.csv')
+            self.df.to_csv(input_file, index=False)
+            streamed = StreamingAnalysis(input_file, 'income-label', chunksize=10).bias_metrics(*self.definition, n_bootstrap=100, random_state=3)
+        pd.testing.assert_frame_equal(streamed, native)
+
+    def test_invalid_bootstrap_settings(self):
+        import native_metrics
+
+        counts = np.ones((4, 2, 2))
+        with self.assertRaisesRegex(ValueError, "n_bootstrap must be at least 2"):
+            native_metrics.bias_table(counts, n_bootstrap=1)
+        with self.assertRaisesRegex(ValueError, "confidence_level must be between 0 and 1"):
+            native_metrics.bias_table(counts, n_bootstrap=10, confidence_level=95)
+
+class TestPredictionColumn(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        df = pd.read_csv('sample_data/sample_data_adult_binary.csv').dropna()
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame({
+            'sex': (df['sex'] == 'Male').astype(int),
+            'income-label': df['income-label'],
+            'prediction': rng.integers(0, 2, len(df)).astype(float),
+        })
+        self.input_file = os.path.join(self.tmp_dir, 'scored.csv')
+        self.df.to_csv(self.input_file, index=False)
+        self.definition = (['sex'], [{'sex': 1}], [{'sex': 0}])
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_backends_and_streaming_agree_on_predictions(self):
+        from analysis_session import AnalysisSession, StreamingAnalysis
+
+        aif = AnalysisSession(self.df, 'income-label', backend='aif360', prediction_name='prediction').fairness_metrics(*self.definition)
+        native = AnalysisSession(self.df, 'income-label', backend='native', prediction_name='prediction').fairness_metrics(*self.definition)
+        streamed = StreamingAnalysis(self.input_file, 'income-label', chunksize=9, prediction_name='prediction').fairness_metrics(*self.definition)
+        np.testing.assert_allclose(native['Score'], aif['Score'])
+        np.testing.assert_allclose(streamed['Score'], aif['Score'])
+        self.assertLess(aif.set_index('Metric').loc['Accuracy', 'Score'], 1.0)
+
+    def test_predicted_dataset_shares_features(self):
+        from analysis_session import AnalysisSession
+
+        session = AnalysisSession(self.df, 'income-label', prediction_name='prediction')
+        dataset_true = session.binary_label_dataset(['sex'])
+        dataset_pred = session.predicted_dataset(['sex'])
+        self.assertIs(dataset_pred.features, dataset_true.features)
+        np.testing.assert_array_equal(dataset_pred.labels.ravel(), self.df['prediction'].to_numpy())
+        np.testing.assert_array_equal(dataset_true.labels.ravel(), self.df['income-label'].to_numpy())
+
+    def test_fairness_check_with_prediction_name(self):
+        output_file = os.path.join(self.tmp_dir, 'fairness.csv')
+        fairness_check(self.input_file, output_file, 'income-label', ['sex'], [{'sex': 1}], [{'sex': 0}],
+                       prediction_name='prediction')
+        accuracy = pd.read_csv(output_file).set_index('Metric').loc['Accuracy', 'Score']
+        self.assertAlmostEqual(accuracy, (self.df['prediction'] == self.df['income-label']).mean())
+
+        with self.assertRaisesRegex(ValueError, "Prediction name 'score' not found"):
+            fairness_check(self.input_file, output_file, 'income-label', ['sex'], [{'sex': 1}], [{'sex': 0}],
+                           prediction_name='score')
+
+    def test_invalid_prediction_values(self):
+        from analysis_session import AnalysisSession
+
+        df = self.df.assign(prediction=0.7)
+        with self.assertRaisesRegex(ValueError, "Column 'prediction' contains values other than"):
+            AnalysisSession(df, 'income-label', prediction_name='prediction').fairness_metrics(*self.definition)
+
+class TestThresholdSweep(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        df = pd.read_csv('sample_data/sample_data_adult_binary.csv').dropna()
+        rng = np.random.default_rng(1)
+        self.df = pd.DataFrame({
+            'sex': (df['sex'] == 'Male').astype(int),
+            'income-label': df['income-label'],
+            'score': np.round(rng.random(len(df)), 2),
+        })
+        self.input_file = os.path.join(self.tmp_dir, 'scored.csv')
+        self.df.to_csv(self.input_file, index=False)
+        self.definition = (['sex'], [{'sex': 1}], [{'sex': 0}])
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_sweep_matches_binarized_fairness_check(self):
+        from analysis_session import AnalysisSession
+
+        curves, roc = AnalysisSession(self.df, 'income-label').threshold_metrics('score', *self.definition)
+        self.assertEqual(curves['Threshold'].tolist(), sorted(self.df['score'].unique()))
+        for threshold in curves['Threshold'].iloc[[0, len(curves) // 2, -1]]:
+            binarized = self.df.assign(prediction=(self.df['score'] >= threshold).astype(float))
+            expected = AnalysisSession(binarized, 'income-label', prediction_name='prediction').fairness_metrics(*self.definition)
+            row = curves.loc[curves['Threshold'] == threshold].iloc[0]
+            np.testing.assert_allclose(row[expected['Metric']].astype(float), expected['Score'], equal_nan=True, err_msg=str(threshold))
+        overall = roc[roc['Group'] == 'all']
+        self.assertTrue((np.diff(overall['True Positive Rate']) <= 0).all())
+        self.assertEqual(sorted(roc['Group'].unique()), ['all', 'privileged', 'unprivileged'])
+
+    def test_streamed_grid_matches_in_memory(self):
+        from analysis_session import AnalysisSession
+        from threshold_sweep import threshold_sweep
+
+        grid = [0.25, 0.5, 0.75]
+        output_file = os.path.join(self.tmp_dir, 'curves.csv')
+        roc_file = os.path.join(self.tmp_dir, 'roc.csv')
+        threshold_sweep(self.input_file, output_file, 'income-label', 'score', *self.definition,
+                        thresholds=grid, roc_output_file=roc_file, chunksize=8)
+        expected, expected_roc = AnalysisSession(self.df, 'income-label').threshold_metrics('score', *self.definition, thresholds=grid)
+        pd.testing.assert_frame_equal(pd.read_csv(output_file), expected)
+        pd.testing.assert_frame_equal(pd.read_csv(roc_file), expected_roc)
+
+        with self.assertRaisesRegex(ValueError, "needs an explicit thresholds grid"):
+            threshold_sweep(self.input_file, output_file, 'income-label', 'score', *self.definition, chunksize=8)
+        with self.assertRaisesRegex(ValueError, "Score name 'proba' not found"):
+            threshold_sweep(self.input_file, output_file, 'income-label', 'proba', *self.definition)
+
+class TestMulticlassFairness(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        self.label = 'education-level-multiclass'
+        df = pd.read_csv('sample_data/sample_data_adult_multiclass.csv').dropna()
+        rng = np.random.default_rng(2)
+        self.classes = sorted(df[self.label].unique())
+        self.df = df.assign(prediction=rng.choice(self.classes, len(df)))
+        self.input_file = os.path.join(self.tmp_dir, 'multiclass.csv')
+        self.df.to_csv(self.input_file, index=False)
+        self.groups = ([{'sex': 'Male'}], [{'sex': 'Female'}])
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_one_vs_rest_matches_binarized_fairness_check(self):
+        from analysis_session import AnalysisSession
+        from multiclass_fairness import cell_counts, contingency_tensor, multiclass_fairness_table
+
+        classes, counts = contingency_tensor(cell_counts(self.df, self.label, *self.groups, prediction_name='prediction'))
+        self.assertEqual(classes, self.classes)
+        table = multiclass_fairness_table(counts, classes)
+        for cls in classes:
+            binarized = pd.DataFrame({
+                'sex': self.df['sex'].to_numpy(),
+                'label': (self.df[self.label] == cls).astype(float).to_numpy(),
+                'prediction': (self.df['prediction'] == cls).astype(float).to_numpy(),
+            })
+            binarized['sex'] = (binarized['sex'] == 'Male').astype(int)
+            expected = AnalysisSession(binarized, 'label', prediction_name='prediction').fairness_metrics(['sex'], [{'sex': 1}], [{'sex': 0}])
+            actual = table[table['Class'] == cls]
+            self.assertEqual(actual['Metric'].tolist(), expected['Metric'].tolist())
+            np.testing.assert_allclose(actual['Score'], expected['Score'], equal_nan=True, err_msg=cls)
+
+        per_class = table[table['Class'].isin(classes)].pivot(index='Class', columns='Metric', values='Score')
+        summary = table[~table['Class'].isin(classes)].set_index(['Class', 'Metric'])['Score']
+        self.assertAlmostEqual(summary[('max', 'Accuracy')], per_class['Accuracy'].max())
+        self.assertAlmostEqual(summary[('macro', 'Accuracy')], per_class['Accuracy'].mean())
+        self.assertAlmostEqual(summary[('all', 'Demographic Parity Total Variation')],
+                               per_class['Demographic Parity Difference'].abs().sum() / 2)
+
+    def test_reference_file_chunked_matches_in_memory(self):
+        from multiclass_fairness import multiclass_fairness_check
+
+        whole, chunked = os.path.join(self.tmp_dir, 'whole.csv'), os.path.join(self.tmp_dir, 'chunked.csv')
+        multiclass_fairness_check('sample_data/sample_data_adult_multiclass.csv', whole, self.label, ['sex'], *self.groups)
+        multiclass_fairness_check('sample_data/sample_data_adult_multiclass.csv', chunked, self.label, ['sex'], *self.groups, chunksize=7)
+        pd.testing.assert_frame_equal(pd.read_csv(whole), pd.read_csv(chunked))
+        accuracy = pd.read_csv(whole).query("Metric == 'Accuracy'")
+        self.assertTrue((accuracy['Score'] == 1.0).all()) # labels evaluated against themselves
+
+        with self.assertRaisesRegex(ValueError, "classes must list every class"):
+            multiclass_fairness_check(self.input_file, whole, self.label, ['sex'], *self.groups, classes=['Graduate'])
+
+class TestFairnessMonitor(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        n = 2000
+        self.events = [
+            {'timestamp': float(t), 'sex': int(s), 'outcome': float(y), 'prediction': float(p)}
+            for t, s, y, p in zip(np.sort(rng.uniform(0, 1000, n)), rng.integers(0, 2, n),
+                                  rng.integers(0, 2, n), rng.integers(0, 2, n))
+        ]
+
+    def _monitor(self, **kwargs):
+        from fairness_monitor import FairnessMonitor
+
+        return FairnessMonitor('outcome', [{'sex': 1}], [{'sex': 0}], prediction_name='prediction', **kwargs)
+
+    def _expected(self, start, end):
+        import native_metrics
+
+        window = pd.DataFrame([e for e in self.events if start <= e['timestamp'] < end])
+        group_codes = native_metrics.encode_groups(window['sex'].to_numpy() == 0, window['sex'].to_numpy() == 1)
+        counts = native_metrics.confusion_counts(group_codes, window['outcome'].to_numpy().astype(np.intp),
+                                                 window['prediction'].to_numpy().astype(np.intp))
+        return native_metrics.fairness_table(counts).set_index('Metric')['Score']
+
+    def test_sliding_windows_match_recomputation(self):
+        rows = list(self._monitor(bucket_seconds=10, window_buckets=10, slide_buckets=3).consume(self.events, flush=False))
+        self.assertEqual([row['window_end'] for row in rows], list(range(30, 1000, 30)))
+        for row in rows[::5]:
+            expected = self._expected(row['window_start'], row['window_end'])
+            self.assertEqual(row['n_events'], sum(row['window_start'] <= e['timestamp'] < row['window_end'] for e in self.events))
+            for metric, score in expected.items():
+                np.testing.assert_allclose(row[metric], score, equal_nan=True, err_msg=metric)
+
+    def test_tumbling_windows_alerts_and_bad_records(self):
+        monitor = self._monitor(bucket_seconds=100, window_buckets=1, slide_buckets=1,
+                                thresholds={'Accuracy': {'min': 0.9}}, min_events=50)
+        events = self.events + [{'timestamp': 5.0, 'sex': 1, 'outcome': 1.0, 'prediction': 1.0},  # late
+                                {'timestamp': 999.0, 'sex': 1, 'outcome': 7.0, 'prediction': 1.0}]  # invalid label
+        rows = list(monitor.consume(events))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(sum(row['n_events'] for row in rows), len(self.events))
+        self.assertTrue(all(row['alerts'] and row['alerts'][0].startswith('Accuracy') for row in rows))
+        self.assertEqual((monitor.late_events, monitor.invalid_events), (1, 1))
+        self.assertEqual(monitor._buckets.shape[0], 1) # memory bounded by the window
+
+    def test_jsonl_sources(self):
+        import io
+        import json
+        import tempfile
+        from fairness_monitor import iter_jsonl, tail_jsonl
+
+        lines = ''.join(json.dumps(dict(e, timestamp=f"2024-01-01T00:{int(e['timestamp']) // 60:02d}:00Z")) + '\n'
+                        for e in self.events[:50])
+        self.assertEqual(len(list(iter_jsonl(io.StringIO(lines + '\n')))), 50)
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write(lines + '{"partial": ')
+        try:
+            records = list(tail_jsonl(f.name, from_start=True, follow=False))
+        finally:
+            os.remove(f.name)
+        self.assertEqual(len(records), 50)
+        rows = list(self._monitor(bucket_seconds=60, window_buckets=5, slide_buckets=5).consume(records))
+        self.assertEqual(sum(row['n_events'] for row in rows), 50)
+
+
+class TestNativeReweighing(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        df = pd.read_csv('sample_data/sample_data_adult_binary.csv').dropna()
+        self.df = pd.DataFrame({
+            'age': df['age'],
+            'sex': (df['sex'] == 'Male').astype(int),
+            'race': (df['race'] == 'White').astype(int),
+            'income-label': df['income-label'],
+        }).reset_index(drop=True)
+        self.input_file = os.path.join(self.tmp_dir, 'adult.csv')
+        self.df.to_csv(self.input_file, index=False)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_weights_match_aif360(self):
+        from aif360.algorithms.preprocessing import Reweighing
+        from aif360.datasets import BinaryLabelDataset
+        from native_mitigation import reweigh_file
+
+        # Overlapping definitions so rows in both groups and in neither occur.
+        for privileged, unprivileged in [([{'sex': 1}], [{'sex': 0}]), ([{'sex': 1}], [{'race': 0}])]:
+            dataset = BinaryLabelDataset(df=self.df, label_names=['income-label'], protected_attribute_names=['sex', 'race'])
+            expected = Reweighing(unprivileged_groups=unprivileged, privileged_groups=privileged).fit_transform(dataset).instance_weights
+            output_file = os.path.join(self.tmp_dir, 'reweighed.csv')
+            reweigh_file(self.input_file, output_file, 'income-label', ['sex', 'race'], privileged, unprivileged, chunksize=97)
+            output = pd.read_csv(output_file)
+            pd.testing.assert_frame_equal(output.drop(columns='instance_weights'), pd.read_csv(self.input_file))
+            np.testing.assert_allclose(output['instance_weights'], expected)
+
+    def test_apply_reweighing_dispatch_and_sidecar(self):
+        from mitigation_techniques import apply_reweighing
+
+        df = self.df.astype({'sex': float})
+        df.loc[[3, 10], 'sex'] = np.nan
+        df.loc[5, 'age'] = np.nan
+        df.to_csv(self.input_file, index=False)
+        params = dict(label_name='income-label', protected_attribute_names=['sex'],
+                      privileged_groups=[{'sex': 1}], unprivileged_groups=[{'sex': 0}])
+        in_memory = os.path.join(self.tmp_dir, 'in_memory.parquet')
+        streamed = os.path.join(self.tmp_dir, 'streamed.parquet')
+        sidecar = os.path.join(self.tmp_dir, 'weights.csv')
+        apply_reweighing(self.input_file, in_memory, backend='native', **params)
+        apply_reweighing(self.input_file, streamed, chunksize=50, weights_file=sidecar, **params)
+
+        output = pd.read_parquet(streamed)
+        pd.testing.assert_frame_equal(output, pd.read_parquet(in_memory))
+        self.assertEqual(len(output), len(df) - 3) # rows with any missing value are skipped
+        weights = pd.read_csv(sidecar)['instance_weights']
+        self.assertEqual(len(weights), len(df))
+        self.assertTrue(weights[[3, 5, 10]].isna().all())
+        np.testing.assert_allclose(weights.dropna(), output['instance_weights'])
+        with self.assertRaises(ValueError):
+            apply_reweighing(self.input_file, in_memory, backend='numpy', **params)
+        with self.assertRaisesRegex(ValueError, "need backend='native'"):
+            apply_reweighing(self.input_file, in_memory, backend='aif360', chunksize=50, **params)
+        with self.assertRaisesRegex(ValueError, "need backend='native'"):
+            apply_reweighing(self.input_file, None, backend='aif360', weights_file=sidecar, **params)
+
+        # The AIF360 backend skips the same rows and gives them the same weights.
+        aif360_output = os.path.join(self.tmp_dir, 'aif360.parquet')
+        apply_reweighing(self.input_file, aif360_output, backend='aif360', **params)
+        pd.testing.assert_frame_equal(pd.read_parquet(aif360_output), output, check_dtype=False)
+
+
+class TestDisparateImpactRepairer(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 3000
+        group = rng.integers(0, 3, n)
+        self.df = pd.DataFrame({
+            'score': np.round(rng.normal(group, 1, n), 2),
+            'count': rng.integers(0, 40, n) + 3 * group,
+            'amount': rng.exponential(1 + group, n),
+            'group': group,
+            'outcome': rng.integers(0, 2, n).astype(float),
+        })
+        self.features = ['score', 'count', 'amount']
+
+    def test_matches_aif360_disparate_impact_remover(self):
+        from aif360.algorithms.preprocessing import DisparateImpactRemover
+        from aif360.datasets import BinaryLabelDataset
+        from native_mitigation import DisparateImpactRepairer
+
+        for repair_level in (1.0, 0.55, 0.0):
+            dataset = BinaryLabelDataset(df=self.df, label_names=['outcome'], protected_attribute_names=['group'])
+            expected = DisparateImpactRemover(repair_level=repair_level, sensitive_attribute='group').fit_transform(dataset)
+            expected = expected.convert_to_dataframe()[0]
+            repaired = DisparateImpactRepairer('group', repair_level, self.features, n_jobs=3).fit_transform(self.df)
+            for name in self.features:
+                np.testing.assert_array_equal(repaired[name].to_numpy(dtype=float), expected[name].to_numpy())
+            self.assertEqual(repaired['count'].dtype, self.df['count'].dtype)
+            pd.testing.assert_series_equal(repaired['outcome'], self.df['outcome'])
+
+    def test_fit_then_transform_new_rows(self):
+        import pickle
+        from native_mitigation import DisparateImpactRepairer
+
+        reference, traffic = self.df.iloc[:2000], self.df.iloc[2000:].copy()
+        traffic.loc[traffic.index[0], 'score'] = 100.0 # beyond the reference range
+        repairer = pickle.loads(pickle.dumps(DisparateImpactRepairer('group', features=self.features).fit(reference)))
+        repaired = repairer.transform(traffic)
+        for name in self.features:
+            # Full repair only emits reference values, and closes the gap between group medians.
+            self.assertTrue(repaired[name].isin(reference[name]).all())
+            medians = repaired.groupby('group')[name].median()
+            original = traffic.groupby('group')[name].median()
+            self.assertLess(medians.max() - medians.min(), original.max() - original.min())
+        # An out-of-range value is repaired like the group's largest reference value.
+        outlier = traffic.loc[[traffic.index[0]]]
+        top = reference.loc[reference['group'] == outlier['group'].iloc[0], 'score'].max()
+        self.assertEqual(repaired.loc[traffic.index[0], 'score'], repairer.transform(outlier.assign(score=top))['score'].iloc[0])
+        with self.assertRaisesRegex(ValueError, 'not seen when fitting'):
+            repairer.transform(traffic.assign(group=7))
+        with self.assertRaises(ValueError):
+            DisparateImpactRepairer('group', repair_level=1.5)
+
+    def test_apply_disparate_impact_remover_native_backend(self):
+        import tempfile
+        from mitigation_techniques import apply_disparate_impact_remover
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, 'input.csv')
+            output_file = os.path.join(tmp_dir, 'repaired.csv')
+            self.df.to_csv(input_file, index=False)
+            apply_disparate_impact_remover(input_file, output_file, ['group'], 'group', 'outcome',
+                                           repair_level=0.8, backend='native', n_jobs=2)
+            output = pd.read_csv(output_file)
+        self.assertEqual(list(output.columns), list(self.df.columns))
+        pd.testing.assert_series_equal(output['outcome'], self.df['outcome'])
+        pd.testing.assert_series_equal(output['group'], self.df['group'])
+        self.assertFalse(output['score'].equals(self.df['score']))
+
+    def test_apply_disparate_impact_remover_row_filter(self):
+        import tempfile
+        from mitigation_techniques import apply_disparate_impact_remover
+
+        df = self.df.astype({'group': float})
+        df.loc[[4, 9], 'group'] = np.nan
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, 'input.csv')
+            native, aif360 = os.path.join(tmp_dir, 'native.csv'), os.path.join(tmp_dir, 'aif360.csv')
+            df.to_csv(input_file, index=False)
+            apply_disparate_impact_remover(input_file, native, ['group'], 'group', 'outcome', backend='native')
+            apply_disparate_impact_remover(input_file, aif360, ['group'], 'group', 'outcome', backend='aif360')
+            self.assertEqual(len(pd.read_csv(native)), len(df) - 2)
+            self.assertEqual(len(pd.read_csv(aif360)), len(df) - 2)
+
+            # A missing feature value drops its row on the AIF360 path only.
+            df.loc[7, 'score'] = np.nan
+            df.to_csv(input_file, index=False)
+            apply_disparate_impact_remover(input_file, native, ['group'], 'group', 'outcome', backend='native')
+            apply_disparate_impact_remover(input_file, aif360, ['group'], 'group', 'outcome')
+            self.assertEqual(len(pd.read_csv(native)), len(df) - 2)
+            self.assertTrue(pd.read_csv(native)['score'].isna().any())
+            self.assertEqual(len(pd.read_csv(aif360)), len(df) - 3)
+            for option in (dict(reference_file=input_file), dict(chunksize=500)):
+                with self.assertRaisesRegex(ValueError, "need backend='native'"):
+                    apply_disparate_impact_remover(input_file, aif360, ['group'], 'group', 'outcome', backend='aif360', **option)
+
+
+class TestQuantileSketch(unittest.TestCase):
+    def test_rank_error_and_merge(self):
+        from quantile_sketch import QuantileSketch
+
+        values = np.random.default_rng(0).lognormal(size=200_000)
+        ordered = np.sort(values)
+        probabilities = np.linspace(0.01, 0.99, 99)
+        streamed = QuantileSketch(k=200, random_state=0)
+        for chunk in np.array_split(values, 10):
+            streamed.update(chunk)
+        parts = [QuantileSketch(k=200, random_state=i).update(chunk) for i, chunk in enumerate(np.array_split(values, 4))]
+        merged = parts[0]
+        for part in parts[1:]:
+            merged.merge(part)
+        for sketch in (streamed, merged):
+            self.assertEqual(sketch.n, len(values))
+            self.assertLess(sketch.size, 3 * sketch.k)
+            ranks = np.searchsorted(ordered, sketch.quantile(probabilities)) / len(values)
+            self.assertLess(np.abs(ranks - probabilities).max(), 1.7 / sketch.k)
+            self.assertEqual(sketch.quantile([0.0, 1.0]).tolist(), [values.min(), values.max()])
+        with self.assertRaises(ValueError):
+            merged.merge(QuantileSketch(k=50))
+
+
+class TestSketchedDisparateImpactRepairer(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 50_000
+        group = rng.integers(0, 3, n)
+        self.df = pd.DataFrame({
+            'score': rng.normal(group, 1, n),
+            'amount': rng.exponential(1 + group, n),
+            'count': rng.integers(0, 40, n) + 3 * group,
+            'group': group,
+            'outcome': rng.integers(0, 2, n).astype(float),
+        })
+        self.features = ['score', 'amount', 'count']
+
+    def test_close_to_exact_repair(self):
+        from native_mitigation import DisparateImpactRepairer, SketchedDisparateImpactRepairer
+
+        for repair_level in (1.0, 0.5):
+            exact = DisparateImpactRepairer('group', repair_level, self.features).fit_transform(self.df)
+            sketched = SketchedDisparateImpactRepairer('group', repair_level, self.features, random_state=0).fit_transform(self.df)
+            for name in self.features:
+                pooled = np.sort(self.df[name].to_numpy(dtype=float))
+                rank_gap = np.abs(np.searchsorted(pooled, exact[name]) - np.searchsorted(pooled, sketched[name])) / len(pooled)
+                self.assertLess(rank_gap.mean(), 0.01)
+            self.assertEqual(sketched['count'].dtype, self.df['count'].dtype)
+        untouched = SketchedDisparateImpactRepairer('group', 0.0, self.features, random_state=0).fit_transform(self.df)
+        np.testing.assert_allclose(untouched[self.features].to_numpy(dtype=float), self.df[self.features].to_numpy(dtype=float))
+
+    def test_repair_file_in_chunks_with_merged_sketches(self):
+        import tempfile
+        from mitigation_techniques import apply_disparate_impact_remover
+        from native_mitigation import SketchedDisparateImpactRepairer
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, 'input.parquet')
+            output_file = os.path.join(tmp_dir, 'repaired.parquet')
+            self.df.to_parquet(input_file)
+            apply_disparate_impact_remover(input_file, output_file, ['group'], 'group', 'outcome', chunksize=7000)
+            output = pd.read_parquet(output_file)
+        pd.testing.assert_frame_equal(output[['group', 'outcome']], self.df[['group', 'outcome']])
+        for name in self.features:
+            self.assertLess(np.ptp(output.groupby('group')[name].median()), 0.1 * np.ptp(self.df.groupby('group')[name].median()))
+
+        # Repairers fitted on separate halves merge into one that repairs like a single fit.
+        halves = [SketchedDisparateImpactRepairer('group', features=self.features, random_state=i).fit(part)
+                  for i, part in enumerate([self.df.iloc[:25_000], self.df.iloc[25_000:]])]
+        merged = halves[0].merge(halves[1]).transform(self.df)
+        single = SketchedDisparateImpactRepairer('group', features=self.features, random_state=0).fit_transform(self.df)
+        pooled = np.sort(self.df['score'].to_numpy())
+        rank_gap = np.abs(np.searchsorted(pooled, merged['score']) - np.searchsorted(pooled, single['score'])) / len(pooled)
+        self.assertLess(rank_gap.mean(), 0.01)
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_stages_are_recorded_only_while_active(self):
+        import profiling
+
+        output_file = os.path.join(self.tmp_dir, 'bias.csv')
+        args = (output_file, 'outcome', ['sex'], [{'sex': 1}], [{'sex': 0}])
+        bias_check('sample_test_data_sex.csv', *args)
+        with profiling.Profiler() as profiler:
+            bias_check('sample_test_data_sex.csv', *args)
+        self.assertIsNone(profiling.active_profiler())
+
+        records = {record['stage']: record for record in profiler.records}
+        self.assertEqual(set(records), {'bias_check', 'read', 'validate', 'metrics', 'dataset', 'write'})
+        self.assertEqual(records['read']['rows'], 8)
+        self.assertEqual(records['write']['rows'], 3)
+        self.assertEqual(records['dataset']['parent'], 'metrics')
+        self.assertTrue(all(record['attribute'] == 'sex' for record in profiler.records))
+        self.assertGreaterEqual(records['bias_check']['wall_time'], records['metrics']['wall_time'])
+        summary = {total['stage']: total for total in profiler.summary()}
+        self.assertEqual(summary['validate']['calls'], 2)
+
+    def test_tracemalloc_capture(self):
+        import profiling
+
+        with profiling.Profiler(capture_stage='read', capture='tracemalloc') as profiler:
+            bias_check('sample_test_data_sex.csv', os.path.join(self.tmp_dir, 'bias.csv'), 'outcome', ['sex'], [{'sex': 1}], [{'sex': 0}])
+        read = next(record for record in profiler.records if record['stage'] == 'read')
+        self.assertGreater(read['tracemalloc_peak_bytes'], 0)
+        self.assertTrue(read['top_allocations'])
+        with self.assertRaises(ValueError):
+            profiling.Profiler(capture='perf')
+
+    def _run(self, *flags, jobs=1):
+        import contextlib
+        import io
+        import json
+        import sys
+        import yaml
+        import run_analysis
+
+        output_dir = os.path.join(self.tmp_dir, f'out{jobs}')
+        config_path = os.path.join(self.tmp_dir, 'config.yaml')
+        config = {
+            'input_file': 'sample_test_data_sex.csv',
+            'output_directory': output_dir,
+            'analysis_params': {
+                'label_name': 'outcome',
+                'protected_attributes_definitions': [
+                    {'name': 'sex', 'privileged_groups': [{'sex': 1}], 'unprivileged_groups': [{'sex': 0}]},
+                ],
+            },
+            'analyses_to_run': {'bias_check': True, 'fairness_check': True},
+        }
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(config, f)
+        argv = sys.argv
+        sys.argv = ['run_analysis.py', '--config', config_path, '--jobs', str(jobs), '--profile', *flags]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_analysis.main()
+        finally:
+            sys.argv = argv
+        with open(os.path.join(output_dir, 'profile.json')) as f:
+            return output_dir, json.load(f)
+
+    def test_run_analysis_profile(self):
+        import pstats
+
+        output_dir, profile = self._run('--profile-stage', 'metrics')
+        checks = [(record['stage'], record['attribute']) for record in profile['stages'] if record['parent'] is None and 'check' in record]
+        self.assertEqual(checks, [('bias_check', 'sex'), ('fairness_check', 'sex')])
+        metrics = [record for record in profile['stages'] if record['stage'] == 'metrics']
+        self.assertEqual([record['check'] for record in metrics], ['bias_check', 'fairness_check'])
+        self.assertGreater(profile['total_wall_time'], 0)
+        self.assertEqual(profile['capture_file'], os.path.join(output_dir, 'profile.pstats'))
+        self.assertTrue(pstats.Stats(profile['capture_file']).total_calls > 0)
+
+    def test_run_analysis_profile_with_workers(self):
+        _, profile = self._run(jobs=2)
+        workers = {record['pid'] for record in profile['stages'] if record['stage'] == 'write'}
+        self.assertNotIn(os.getpid(), workers)
+        self.assertEqual(sorted(record['check'] for record in profile['stages'] if record['stage'] == 'write'),
+                         ['bias_check', 'fairness_check'])
+
+class TestBenchmarks(unittest.TestCase):
+    def test_generator(self):
+        from benchmarks import generate_dataset, LABEL_NAME
+
+        df = generate_dataset(200_000, race_cardinality=7, favorable_rate=0.3, bias=0.4, seed=1, chunksize=50_000)
+        pd.testing.assert_frame_equal(df, generate_dataset(200_000, race_cardinality=7, favorable_rate=0.3, bias=0.4, seed=1, chunksize=50_000))
+        self.assertFalse(df.equals(generate_dataset(200_000, race_cardinality=7, favorable_rate=0.3, bias=0.4, seed=2, chunksize=50_000)))
+        self.assertEqual(len(df), 200_000)
+        self.assertEqual(sorted(df['race'].unique()), list(range(7)))
+        self.assertAlmostEqual(df[LABEL_NAME].mean(), 0.3, delta=0.01)
+        rates = df.groupby('sex')[LABEL_NAME].mean()
+        self.assertAlmostEqual(rates[0] / rates[1], 0.6, delta=0.02)
+        self.assertTrue(all(pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes))
+        with self.assertRaises(ValueError):
+            generate_dataset(10, favorable_rate=0.9, bias=0.9)
+
+    def test_run_and_compare(self):
+        import copy
+        from benchmarks import compare, run_benchmarks
+
+        results = run_benchmarks([2_000], ['bias_check_native', 'reweighing_native'], repeats=1, isolate=False)
+        self.assertEqual([(r['case'], r['rows']) for r in results['results']], [('bias_check_native', 2_000), ('reweighing_native', 2_000)])
+        self.assertTrue(all(r['rows_per_second'] > 0 for r in results['results']))
+        self.assertEqual(compare(results, results), [])
+
+        baseline = copy.deepcopy(results)
+        baseline['results'][0]['rows_per_second'] *= 2
+        baseline['results'][1]['peak_rss_bytes'] //= 2
+        regressions = compare(results, baseline, tolerance=0.1)
+        self.assertEqual([(r['case'], r['metric']) for r in regressions],
+                         [('bias_check_native', 'rows_per_second'), ('reweighing_native', 'peak_rss_bytes')])
+        with self.assertRaises(ValueError):
+            run_benchmarks([10], ['no_such_case'])
+
+class TestResultsStore(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _tables(self):
+        from analysis_session import AnalysisSession
+        from results_store import long_format
+
+        session = AnalysisSession(pd.read_csv('sample_test_data_sex.csv').assign(score=np.linspace(0, 1, 8)), 'outcome', backend='native')
+        groups = ([{'sex': 1}], [{'sex': 0}])
+        curves, roc = session.threshold_metrics('score', ['sex'], *groups, thresholds=[0.3, 0.6])
+        return pd.concat([
+            long_format(session.bias_metrics(['sex'], *groups, n_bootstrap=20, random_state=0), 'bias_check', 'sex', *groups),
+            long_format(curves, 'threshold_sweep', 'sex', *groups),
+            long_format(roc, 'threshold_roc', 'sex', *groups),
+        ], ignore_index=True)
+
+    def _check_store(self, path):
+        from results_store import COLUMNS, ResultsStore
+
+        store = ResultsStore(path)
+        tables = self._tables()
+        store.append(tables, run_id='first', input_file='sample_test_data_sex.csv', timestamp='2026-01-01 00:00')
+        store.append(tables.assign(value=tables['value'] * 2), run_id='second', timestamp='2026-02-01 00:00')
+
+        history = store.query(metric='Disparate Impact', attribute='sex')
+        self.assertEqual(list(history.columns), COLUMNS)
+        self.assertEqual(history['run_id'].tolist(), ['first', 'second'])
+        self.assertEqual(history['value'].tolist(), [3.0, 6.0])
+        self.assertTrue(history['ci_lower'].notna().all())
+        self.assertEqual(history['privileged_groups'].iloc[0], '[{"sex": 1}]')
+        self.assertEqual(len(history['input_fingerprint'].iloc[0]), 32)
+
+        sweep = store.query(check='threshold_sweep', since='2026-01-15')
+        self.assertEqual(set(sweep['run_id']), {'second'})
+        self.assertEqual(sorted(sweep['threshold'].unique()), [0.3, 0.6])
+        self.assertEqual(set(store.query(check='threshold_roc')['subgroup']), {'all', 'privileged', 'unprivileged'})
+        runs = store.runs()
+        self.assertEqual(runs['run_id'].tolist(), ['first', 'second'])
+        self.assertEqual(runs['n_results'].tolist(), [len(tables)] * 2)
+
+    def test_sqlite_store(self):
+        self._check_store(os.path.join(self.tmp_dir, 'results.sqlite'))
+
+    @unittest.skipUnless(HAVE_PYARROW, "pyarrow is not installed")
+    def test_parquet_store(self):
+        path = os.path.join(self.tmp_dir, 'results.parquet')
+        self._check_store(path)
+        self.assertEqual(len(os.listdir(path)), 2)
+
+    def test_unknown_format(self):
+        from results_store import ResultsStore
+
+        with self.assertRaises(ValueError):
+            ResultsStore(os.path.join(self.tmp_dir, 'results.csv'))
+
+    def _run(self, jobs):
+        import contextlib
+        import io
+        import sys
+        import yaml
+        import run_analysis
+
+        config = {
+            'input_file': 'sample_test_data_sex.csv',
+            'output_directory': os.path.join(self.tmp_dir, 'out'),
+            'output_sink': {'type': 'sqlite', 'path': os.path.join(self.tmp_dir, 'history.sqlite')},
+            'analysis_params': {
+                'label_name': 'outcome',
+                'protected_attributes_definitions': [
+                    {'name': 'sex', 'privileged_groups': [{'sex': 1}], 'unprivileged_groups': [{'sex': 0}]},
+                ],
+                'intersectional': {'attributes': ['sex'], 'min_support': 1},
+            },
+            'analyses_to_run': {'bias_check': True, 'fairness_check': True, 'intersectional_check': True},
+        }
+        config_path = os.path.join(self.tmp_dir, 'config.yaml')
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(config, f)
+        argv = sys.argv
+        sys.argv = ['run_analysis.py', '--config', config_path, '--jobs', str(jobs)]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                run_analysis.main()
+        finally:
+            sys.argv = argv
+        return stdout.getvalue()
+
+    def test_run_analysis_sink(self):
+        from results_store import ResultsStore
+
+        log = self._run(1)
+        self._run(2)
+        self.assertIn("Results will be appended to", log)
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'out')), [])
+
+        store = ResultsStore(os.path.join(self.tmp_dir, 'history.sqlite'))
+        self.assertEqual(len(store.runs()), 2)
+        first, second = (store.query(run_id=run_id) for run_id in store.runs()['run_id'])
+        self.assertEqual(set(first['check']), {'bias_check', 'fairness_check', 'intersectional_check'})
+        pd.testing.assert_frame_equal(first.drop(columns=['run_id', 'timestamp']), second.drop(columns=['run_id', 'timestamp']))
+        di = store.query(metric='Disparate Impact', check='bias_check')
+        self.assertEqual(di['value'].tolist(), [3.0, 3.0])
+
+
+class TestAnalysisServer(unittest.TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+        import threading
+        from analysis_server import AnalysisServer
+
+        self.tmp_dir = tempfile.mkdtemp()
+        shutil.copy('sample_test_data_sex.csv', os.path.join(self.tmp_dir, 'data.csv'))
+        self.server = AnalysisServer(port=0, workers=2)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        import shutil
+        self.server.shutdown()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _config(self, output_directory):
+        return {
+            'input_file': 'data.csv',
+            'output_directory': output_directory,
+            'analysis_params': {
+                'label_name': 'outcome',
+                'backend': 'native',
+                'protected_attributes_definitions': [
+                    {'name': 'sex', 'privileged_groups': [{'sex': 1}], 'unprivileged_groups': [{'sex': 0}]},
+                ],
+            },
+            'analyses_to_run': {'bias_check': True, 'fairness_check': True},
+        }
+
+    def _request(self, method, path, document=None):
+        import json
+        import urllib.error
+        import urllib.request
+
+        data = None if document is None else json.dumps(document).encode()
+        request = urllib.request.Request(self.server.url + path, data=data, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode()
+
+    def test_run_remote_reuses_session(self):
+        import contextlib
+        import io
+        import yaml
+        from analysis_server import run_remote
+        import run_analysis
+
+        config = self._config(os.path.join(self.tmp_dir, 'remote'))
+        config['input_file'] = os.path.join(self.tmp_dir, 'data.csv')
+        config_path = os.path.join(self.tmp_dir, 'config.yaml')
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(config, f)
+        for _ in range(2):
+            out = io.StringIO()
+            self.assertEqual(run_remote(config_path, server_url=self.server.url, out=out), 0)
+            self.assertIn("Configuration loaded successfully.", out.getvalue())
+            self.assertIn("Bias check for sex completed.", out.getvalue())
+            self.assertIn("Analysis run complete.", out.getvalue())
+        health = self.server.health()
+        self.assertEqual((health['session_misses'], health['session_hits'], health['sessions']), (1, 1, 1))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_analysis.run_config({**config, 'output_directory': os.path.join(self.tmp_dir, 'local')})
+        for name in ('bias_metrics_sex.csv', 'fairness_metrics_sex.csv'):
+            pd.testing.assert_frame_equal(pd.read_csv(os.path.join(self.tmp_dir, 'remote', name)),
+                                          pd.read_csv(os.path.join(self.tmp_dir, 'local', name)))
+
+    def test_job_api(self):
+        import json
+
+        job_ids = []
+        for output_directory in ('first', 'second'):
+            status, body = self._request('POST', '/jobs', {'config': self._config(output_directory), 'cwd': self.tmp_dir})
+            self.assertEqual(status, 202)
+            job_ids.append(json.loads(body)['job_id'])
+        for job_id, output_directory in zip(job_ids, ('first', 'second')):
+            status, body = self._request('GET', f'/jobs/{job_id}/events')
+            events = [json.loads(line) for line in body.splitlines()]
+            self.assertEqual(events[-1]['status'], 'done')
+            output = ''.join(event.get('output', '') for event in events)
+            # Each job's output holds only its own paths, although the jobs ran concurrently.
+            self.assertIn(os.path.join(self.tmp_dir, output_directory, 'bias_metrics_sex.csv'), output)
+            self.assertEqual(output.count("Analysis run complete."), 1)
+            self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, output_directory, 'fairness_metrics_sex.csv')))
+            status, body = self._request('GET', f'/jobs/{job_id}')
+            self.assertEqual((status, json.loads(body)['output']), (200, output))
+
+        # A job with worker processes spawns them rather than forking the threaded server.
+        status, body = self._request('POST', '/run', {'config': self._config('pooled'), 'cwd': self.tmp_dir, 'jobs': 2})
+        events = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(events[-1]['status'], 'done')
+        pd.testing.assert_frame_equal(pd.read_csv(os.path.join(self.tmp_dir, 'pooled', 'bias_metrics_sex.csv')),
+                                      pd.read_csv(os.path.join(self.tmp_dir, 'first', 'bias_metrics_sex.csv')))
+
+        self.assertEqual(self._request('POST', '/jobs', {'cwd': self.tmp_dir})[0], 400)
+        self.assertEqual(self._request('GET', '/jobs/unknown')[0], 404)
+        status, body = self._request('GET', '/health')
+        self.assertEqual(json.loads(body)['status'], 'ok')
+
+    def test_client_falls_back_to_local_run(self):
+        import contextlib
+        import io
+        import json
+        import socket
+        import yaml
+        import analysis_server
+
+        config = self._config(os.path.join(self.tmp_dir, 'fallback'))
+        config['input_file'] = os.path.join(self.tmp_dir, 'data.csv')
+        config_path = os.path.join(self.tmp_dir, 'config.yaml')
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(config, f)
+        with socket.socket() as sock:  # a port nobody listens on
+            sock.bind(('127.0.0.1', 0))
+            url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        args = ['run', '--config', config_path, '--server', url]
+        with contextlib.redirect_stderr(io.StringIO()), contextlib.redirect_stdout(io.StringIO()) as stdout:
+            self.assertEqual(analysis_server.main(args + ['--no-fallback']), 1)
+            self.assertEqual(analysis_server.main(args), 0)
+        self.assertIn("Analysis run complete.", stdout.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'fallback', 'bias_metrics_sex.csv')))
+
+        # The profiling flags of run_analysis.py work locally and remotely.
+        profile_args = ['--profile', '--profile-stage', 'metrics']
+        with contextlib.redirect_stderr(io.StringIO()), contextlib.redirect_stdout(io.StringIO()) as stdout:
+            self.assertEqual(analysis_server.main(args + profile_args), 0)
+            self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'fallback', 'profile.json')))
+            config['output_directory'] = os.path.join(self.tmp_dir, 'remote')
+            with open(config_path, 'w') as f:
+                yaml.safe_dump(config, f)
+            self.assertEqual(analysis_server.main(['run', '--config', config_path, '--server', self.server.url] + profile_args), 0)
+        self.assertIn("Profile saved to", stdout.getvalue())
+        with open(os.path.join(self.tmp_dir, 'remote', 'profile.json')) as f:
+            self.assertIn('metrics', {record['stage'] for record in json.load(f)['stages']})
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'remote', 'profile.pstats')))
+
+        # A local run that cannot load its config fails.
+        with contextlib.redirect_stderr(io.StringIO()), contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(analysis_server.main(['run', '--config', os.path.join(self.tmp_dir, 'missing.yaml'), '--server', url]), 1)
+
+
+@unittest.skipUnless(HAVE_PYARROW, "pyarrow is not installed")
+class TestApproximateAnalysis(unittest.TestCase):
+    groups = (['sex'], [{'sex': 1}], [{'sex': 0}])
+
+    @classmethod
+    def setUpClass(cls):
+        import tempfile
+        from benchmarks import write_synthetic_dataset
+
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.input_file = os.path.join(cls.tmp_dir, 'synthetic.parquet')
+        write_synthetic_dataset(cls.input_file, 200_000, chunksize=5_000)  # 40 row groups
+
+    @classmethod
+    def tearDownClass(cls):
+        import shutil
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def _session(self, **kwargs):
+        from analysis_session import ApproximateAnalysis
+        from benchmarks import LABEL_NAME
+
+        return ApproximateAnalysis(self.input_file, LABEL_NAME, chunksize=5_000, prediction_name='prediction', **kwargs)
+
+    def test_shuffled_chunks(self):
+        import data_io
+
+        ordered = pd.concat(data_io.iter_chunks(self.input_file, ['age'], 5_000), ignore_index=True)
+        shuffled = pd.concat(data_io.iter_chunks(self.input_file, ['age'], 5_000, shuffle=True, random_state=0), ignore_index=True)
+        self.assertFalse(ordered.equals(shuffled))
+        self.assertEqual(sorted(ordered['age']), sorted(shuffled['age']))
+        self.assertEqual(data_io.count_rows(self.input_file), 200_000)
+        self.assertIsNone(data_io.count_rows('sample_test_data_sex.csv'))
+
+    def test_stops_early_within_tolerance(self):
+        from analysis_session import StreamingAnalysis
+        from benchmarks import LABEL_NAME
+
+        session = self._session(tolerance=0.05, min_group_rows=500, random_state=0)
+        table = session.bias_metrics(*self.groups)
+        self.assertTrue(table.attrs['stopped_early'])
+        self.assertLess(table.attrs['rows_read'], 200_000)
+        self.assertEqual(table.attrs['rows_read'] % 5_000, 0)
+        self.assertTrue((table['Error Bound'] <= 0.05).all())
+        self.assertTrue((session.fairness_metrics(*self.groups)['Error Bound'] <= 0.05).all())
+        self.assertAlmostEqual(session.estimated_counts(*self.groups).sum(), 200_000)
+
+        exact = StreamingAnalysis(self.input_file, LABEL_NAME, chunksize=50_000).bias_metrics(*self.groups)
+        self.assertTrue((abs(table['Score'] - exact['Score']) <= table['Error Bound']).all())
+        self.assertIn("stopped once every error bound was within 0.05", session.describe())
+
+    def test_seeded_check_reports_the_stopping_bounds(self):
+        from bias_check import bias_check
+        from benchmarks import LABEL_NAME
+
+        output_file = os.path.join(self.tmp_dir, 'approximate_bias.csv')
+        bias_check(self.input_file, output_file, LABEL_NAME, *self.groups, approximate=True, tolerance=0.05,
+                   chunksize=5_000, random_state=3)
+        self.assertTrue((pd.read_csv(output_file)['Error Bound'] <= 0.05).all())
+        # Reports follow the output file's extension.
+        parquet_file = os.path.join(self.tmp_dir, 'approximate_bias.parquet')
+        bias_check(self.input_file, parquet_file, LABEL_NAME, *self.groups, approximate=True, tolerance=0.05,
+                   chunksize=5_000, random_state=3)
+        pd.testing.assert_frame_equal(pd.read_parquet(parquet_file), pd.read_csv(output_file), check_dtype=False)
+
+    def test_without_tolerance_reads_everything(self):
+        from analysis_session import StreamingAnalysis
+        from benchmarks import LABEL_NAME
+
+        session = self._session(rows_per_group=10**6, random_state=0)
+        table = session.fairness_metrics(*self.groups)
+        exact = StreamingAnalysis(self.input_file, LABEL_NAME, chunksize=50_000, prediction_name='prediction')
+        np.testing.assert_allclose(table['Score'], exact.fairness_metrics(*self.groups)['Score'])
+        np.testing.assert_array_equal(session.estimated_counts(*self.groups), exact.confusion_counts(*self.groups))
+        self.assertEqual((table.attrs['rows_read'], table.attrs['rows_sampled'], table.attrs['stopped_early']), (200_000, 200_000, False))
+        # Unreachable group sizes also read the whole input.
+        table = self._session(tolerance=0.5, min_group_rows=10**9).bias_metrics(*self.groups)
+        self.assertEqual((table.attrs['rows_read'], table.attrs['stopped_early']), (200_000, False))
+        with self.assertRaises(ValueError):
+            self._session(tolerance=0)
+
+    def test_stratified_sample_of_csv(self):
+        from analysis_session import ApproximateAnalysis, StreamingAnalysis
+        from benchmarks import LABEL_NAME
+        import data_io
+
+        csv_file = os.path.join(self.tmp_dir, 'synthetic.csv')
+        data_io.write_table(data_io.read_table(self.input_file, ['sex', LABEL_NAME, 'prediction']), csv_file)
+        with self.assertRaises(ValueError):  # a CSV prefix is not a random sample
+            ApproximateAnalysis(csv_file, LABEL_NAME, tolerance=0.05)
+
+        session = ApproximateAnalysis(csv_file, LABEL_NAME, chunksize=20_000, prediction_name='prediction',
+                                      rows_per_group=2_000, random_state=0)
+        table = session.bias_metrics(*self.groups)
+        exact = StreamingAnalysis(csv_file, LABEL_NAME, chunksize=50_000, prediction_name='prediction')
+        exact_counts = exact.confusion_counts(*self.groups)
+        self.assertEqual((table.attrs['rows_read'], table.attrs['rows_sampled'], table.attrs['stopped_early']), (200_000, 4_000, False))
+        # Each group is capped at rows_per_group and reweighted to its true size.
+        np.testing.assert_allclose(session.estimated_counts(*self.groups).sum(axis=(1, 2)), exact_counts.sum(axis=(1, 2)))
+        scores = exact.bias_metrics(*self.groups)['Score']
+        self.assertTrue((abs(table['Score'] - scores) <= table['Error Bound']).all())
+
+    def test_stratified_reservoir(self):
+        from native_metrics import StratifiedReservoir
+
+        rng = np.random.default_rng(0)
+        group_codes = np.where(rng.random(10_000) < 0.05, 1, 2)
+        labels = rng.integers(0, 2, 10_000)
+        reservoir = StratifiedReservoir(600, random_state=0)
+        for start in range(0, 10_000, 1_000):
+            reservoir.update(group_codes[start:start + 1_000], labels[start:start + 1_000], labels[start:start + 1_000])
+        seen = np.bincount(group_codes, minlength=4)
+        np.testing.assert_array_equal(reservoir.seen, seen)
+        np.testing.assert_array_equal(reservoir.sampled, np.minimum(seen, 600))
+        np.testing.assert_allclose(reservoir.weighted_counts().sum(axis=(1, 2)), seen)
+        # The small group keeps every row, so its counts are exact.
+        np.testing.assert_array_equal(reservoir.counts()[1].sum(axis=1), np.bincount(labels[group_codes == 1], minlength=2))
+        with self.assertRaises(ValueError):
+            StratifiedReservoir(0)
+
+    def test_run_analysis_approximate_mode(self):
+        import contextlib
+        import io
+        import yaml
+        import run_analysis
+        from benchmarks import LABEL_NAME
+
+        config = {
+            'input_file': self.input_file,
+            'output_directory': os.path.join(self.tmp_dir, 'out'),
+            'analysis_params': {
+                'label_name': LABEL_NAME,
+                'prediction_name': 'prediction',
+                'chunksize': 5_000,
+                'approximate': {'tolerance': 0.05, 'min_group_rows': 500, 'random_state': 0},
+                'protected_attributes_definitions': [
+                    {'name': 'sex', 'privileged_groups': [{'sex': 1}], 'unprivileged_groups': [{'sex': 0}]},
+                ],
+            },
+            'analyses_to_run': {'bias_check': True, 'fairness_check': True},
+        }
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            run_analysis.run_config(config)
+        self.assertIn("Approximate mode: read 20000 of 200000 rows", stdout.getvalue())
+        table = pd.read_csv(os.path.join(self.tmp_dir, 'out', 'fairness_metrics_sex.csv'))
+        self.assertEqual(list(table.columns), ['Metric', 'Score', 'CI Lower', 'CI Upper', 'Std Error', 'Error Bound'])
+        self.assertTrue((table['Error Bound'] <= 0.05).all())
@@ -1,5 +1,8 @@
 import os
+import random
 import sys
+import threading
+import time
 import types
 import unittest
 import pandas as pd
@@ -39,14 +42,96 @@ class DummyPlanner:
         return results
 
 
-def _install_fake_hallbayes():
+class RateLimitError(Exception):
+    """Stands in for the OpenAI client's rate-limit error."""
+
+
+class SimulatedBackend:
+    """Fake backend with per-call latency and a rate of transient failures."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0, fail_after: int = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fail_after = fail_after
+        self.calls = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def evaluate(self, prompt: str):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self._rng.random() < self.error_rate
+            quota_exceeded = self.fail_after is not None and self.calls > self.fail_after
+        try:
+            if quota_exceeded:
+                raise RuntimeError("quota exceeded")
+            time.sleep(self.latency)
+            if fail:
+                with self._lock:
+                    self.failures += 1
+                raise RateLimitError("429 Too Many Requests")
+            index = int(prompt[1:])
+            return types.SimpleNamespace(decision_answer=index % 3 == 0, roh_bound=index / 100,
+                                         delta_bar=1.0, b2t=0.5, isr=1.2, q_lo=0.3, q_bar=0.6)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+    def sample(self, prompt: str, n: int, temperature: float):
+        with self._lock:
+            self.calls += 1
+        return [f"{prompt}-answer-{i}" for i in range(n)]
+
+
+class SimulatedPlanner:
+    def __init__(self, backend: SimulatedBackend, temperature: float = 0.3):
+        self.backend = backend
+        self.temperature = temperature
+
+    def run(self, items, **kwargs):
+        return [self.backend.evaluate(item.prompt) for item in items]
+
+
+class SamplingPlanner(SimulatedPlanner):
+    """Samples through the backend, then decides with the decision-time ``h_star``."""
+
+    def run(self, items, h_star=0.05, **kwargs):
+        results = []
+        for item in items:
+            samples = self.backend.sample(item.prompt, n=item.n_samples, temperature=self.temperature)
+            roh_bound = len(samples) / 100
+            results.append(types.SimpleNamespace(decision_answer=roh_bound <= h_star, roh_bound=roh_bound,
+                                                 delta_bar=1.0, b2t=0.5, isr=1.2, q_lo=0.3, q_bar=0.6))
+        return results
+
+
+class KeywordPlanner(SimulatedPlanner):
+    """Samples through the backend; prompts mentioning Alice are declined and score a higher ISR."""
+
+    def run(self, items, **kwargs):
+        results = []
+        for item in items:
+            self.backend.sample(item.prompt, n=item.n_samples, temperature=self.temperature)
+            mentions = "Alice" in item.prompt
+            results.append(types.SimpleNamespace(decision_answer=not mentions, roh_bound=len(item.prompt) / 100,
+                                                 delta_bar=1.0, b2t=0.5, isr=1.0 + mentions, q_lo=0.3, q_bar=0.6))
+        return results
+
+
+def _install_fake_hallbayes(planner=None):
     """Install fake hallbayes modules into sys.modules for testing."""
     hallbayes_mod = types.ModuleType("hallbayes")
     scripts_mod = types.ModuleType("hallbayes.scripts")
     toolkit_mod = types.ModuleType("hallbayes.scripts.hallucination_toolkit")
     toolkit_mod.OpenAIBackend = DummyBackend
     toolkit_mod.OpenAIItem = DummyItem
-    toolkit_mod.OpenAIPlanner = DummyPlanner
+    toolkit_mod.OpenAIPlanner = planner or DummyPlanner
     sys.modules["hallbayes"] = hallbayes_mod
     sys.modules["hallbayes.scripts"] = scripts_mod
     sys.modules["hallbayes.scripts.hallucination_toolkit"] = toolkit_mod
@@ -87,5 +172,332 @@ class TestHallbayesFairness(unittest.TestCase):
         os.remove(out_file)
 
 
+class TestConcurrentHallbayes(unittest.TestCase):
+    def setUp(self):
+        _install_fake_hallbayes(SimulatedPlanner)
+        self.prompts = [f"Q{i}" for i in range(40)]
+        self.groups = ["A" if i % 2 else "B" for i in range(40)]
+
+    def tearDown(self):
+        _install_fake_hallbayes()
+
+    def test_concurrent_run_matches_sequential_order(self):
+        from hallbayes_fairness import hallucination_fairness_analysis
+
+        sequential = hallucination_fairness_analysis(self.prompts, self.groups, backend=SimulatedBackend())
+        backend = SimulatedBackend(latency=0.02)
+        start = time.perf_counter()
+        concurrent = hallucination_fairness_analysis(self.prompts, self.groups, backend=backend, max_concurrency=8)
+        elapsed = time.perf_counter() - start
+
+        pd.testing.assert_frame_equal(concurrent, sequential)
+        self.assertEqual(backend.calls, 40)
+        self.assertTrue(1 < backend.max_in_flight <= 8)
+        self.assertLess(elapsed, 40 * 0.02 / 2)
+
+    def test_transient_errors_are_retried(self):
+        from hallbayes_fairness import hallucination_fairness_analysis
+
+        backend = SimulatedBackend(error_rate=0.3, seed=1)
+        df = hallucination_fairness_analysis(self.prompts, self.groups, backend=backend, max_concurrency=4,
+                                             max_retries=20, retry_backoff=0.001)
+        self.assertEqual(df["prompt"].tolist(), self.prompts)
+        self.assertGreater(backend.failures, 0)
+        self.assertEqual(backend.calls, 40 + backend.failures)
+
+        with self.assertRaises(RateLimitError):
+            hallucination_fairness_analysis(self.prompts, self.groups, backend=SimulatedBackend(error_rate=1.0),
+                                            max_concurrency=4, max_retries=2, retry_backoff=0.001)
+
+    def test_non_transient_errors_are_not_retried(self):
+        from hallbayes_fairness import call_with_retry, is_transient_error
+
+        calls = []
+
+        def broken():
+            calls.append(1)
+            raise ValueError("bad request")
+
+        with self.assertRaises(ValueError):
+            call_with_retry(broken, max_retries=5, backoff=0.001)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(is_transient_error(TimeoutError()))
+        self.assertTrue(is_transient_error(types.SimpleNamespace(status_code=503)))
+
+    def test_token_bucket_paces_calls(self):
+        from hallbayes_fairness import TokenBucket
+
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=10, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(12):
+            bucket.acquire()
+        # Two tokens of burst, then one every 0.1 s.
+        self.assertAlmostEqual(now[0], 1.0)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        _install_fake_hallbayes(SamplingPlanner)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_dir, "responses.sqlite")
+        self.prompts = ["Q1", "Q2", "Q3"]
+        self.groups = ["A", "B", "A"]
+
+    def tearDown(self):
+        import shutil
+        _install_fake_hallbayes()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _run(self, backend, **kwargs):
+        from hallbayes_fairness import hallucination_fairness_analysis
+        return hallucination_fairness_analysis(self.prompts, self.groups, backend=backend,
+                                               cache_path=self.cache_path, **kwargs)
+
+    def test_rescoring_replays_cached_samples(self):
+        backend = SimulatedBackend()
+        first = self._run(backend, planner_params={"h_star": 0.01})
+        self.assertEqual(backend.calls, 3)
+        self.assertEqual(first.attrs["cache_stats"]["misses"], 3)
+
+        second = self._run(backend, planner_params={"h_star": 0.1})
+        self.assertEqual(backend.calls, 3) # decision-time change: no new backend calls
+        self.assertEqual(second.attrs["cache_stats"]["hits"], 3)
+        self.assertEqual(first["decision_answer"].tolist(), [0, 0, 0])
+        self.assertEqual(second["decision_answer"].tolist(), [1, 1, 1])
+
+        self._run(backend, planner_params={"n_samples": 7}) # sampling change: new requests
+        self.assertEqual(backend.calls, 6)
+
+    def test_refresh_bypass_and_lru_cap(self):
+        from response_cache import ResponseCache
+
+        backend = SimulatedBackend()
+        self._run(backend)
+        self._run(backend, cache_mode="refresh")
+        self.assertEqual(backend.calls, 6)
+        off = self._run(backend, cache_mode="off")
+        self.assertEqual(backend.calls, 9)
+        self.assertEqual(off.attrs["cache_stats"]["hits"], 0)
+
+        capped = self._run(backend, cache_max_entries=2)
+        self.assertEqual(capped.attrs["cache_stats"]["entries"], 2)
+        self.assertGreaterEqual(capped.attrs["cache_stats"]["evictions"], 1)
+        with self.assertRaises(ValueError):
+            self._run(backend, cache_mode="sometimes")
+        cache = ResponseCache(self.cache_path)
+        try:
+            self.assertEqual(len(cache), 2)
+        finally:
+            cache.close()
+
+    def test_json_storage(self):
+        import pickle
+        from response_cache import CachedBackend, ResponseCache
+
+        cache = ResponseCache(self.cache_path)
+        try:
+            cache.put("plain", {"samples": ["a", "b"], "score": 0.5})
+            self.assertEqual(cache.get("plain"), (True, {"samples": ["a", "b"], "score": 0.5}))
+            with self.assertRaises(TypeError):
+                cache.put("object", SimulatedBackend())
+            # A pickled value left by an older cache file is a miss, never unpickled.
+            with cache._connection:
+                cache._connection.execute("INSERT INTO responses VALUES ('old', ?, 0, 0)", (pickle.dumps(["a"]),))
+            self.assertEqual(cache.get("old"), (False, None))
+
+            cached = CachedBackend(SimulatedBackend(), cache)
+            self.assertEqual(cached.sample("Q1", n=2, temperature=0.3), ["Q1-answer-0", "Q1-answer-1"])
+            with self.assertRaisesRegex(TypeError, "not JSON serializable"):
+                cached.sample(object(), n=2, temperature=0.3)
+        finally:
+            cache.close()
+
+    def test_repeated_calls_replay_distinct_draws(self):
+        from response_cache import CachedBackend, ResponseCache
+
+        class DrawingBackend(SimulatedBackend):
+            def sample(self, prompt, n, temperature):
+                with self._lock:
+                    self.calls += 1
+                return [self._rng.random() for _ in range(n)]
+
+        backend = DrawingBackend()
+        cache = ResponseCache(self.cache_path)
+        try:
+            cached = CachedBackend(backend, cache)
+            first = [cached.sample("Q1", n=2, temperature=0.3) for _ in range(3)]
+            self.assertEqual(backend.calls, 3)
+            self.assertEqual(len({tuple(draw) for draw in first}), 3) # independent draws stay independent
+
+            # A new session replays the stored draws in order, then samples again.
+            cached = CachedBackend(backend, cache)
+            replayed = [cached.sample("Q1", n=2, temperature=0.3) for _ in range(4)]
+            self.assertEqual(replayed[:3], first)
+            self.assertEqual(backend.calls, 4)
+            self.assertNotIn(replayed[3], first)
+        finally:
+            cache.close()
+
+    def test_object_responses_are_returned_uncached(self):
+        from response_cache import CachedBackend, ResponseCache
+
+        class ObjectBackend(SimulatedBackend):
+            def sample(self, prompt, n, temperature):
+                with self._lock:
+                    self.calls += 1
+                return types.SimpleNamespace(choices=[f"{prompt}-answer-{i}" for i in range(n)])
+
+        backend = ObjectBackend()
+        cache = ResponseCache(self.cache_path)
+        try:
+            cached = CachedBackend(backend, cache)
+            with self.assertWarnsRegex(RuntimeWarning, "returned uncached"):
+                response = cached.sample("Q1", n=2, temperature=0.3)
+            self.assertEqual(response.choices, ["Q1-answer-0", "Q1-answer-1"])
+            self.assertEqual(len(cache), 0)
+        finally:
+            cache.close()
+
+
+class TestCheckpointedRuns(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        _install_fake_hallbayes(SimulatedPlanner)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.tmp_dir, "metrics.jsonl")
+        # Repeated (group, prompt) pairs must still be told apart.
+        self.prompts = [f"Q{i % 25}" for i in range(30)]
+        self.groups = ["A" if i % 2 else "B" for i in range(30)]
+
+    def tearDown(self):
+        import shutil
+        _install_fake_hallbayes()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_resume_after_crash_matches_uninterrupted_run(self):
+        from hallbayes_fairness import hallucination_fairness_analysis, load_checkpoint
+
+        expected = hallucination_fairness_analysis(self.prompts, self.groups, backend=SimulatedBackend())
+        for max_concurrency in (1, 4):
+            with self.assertRaises(RuntimeError):
+                hallucination_fairness_analysis(self.prompts, self.groups, backend=SimulatedBackend(fail_after=12),
+                                                checkpoint_file=self.checkpoint, max_concurrency=max_concurrency)
+            done = len(load_checkpoint(self.checkpoint))
+            self.assertGreaterEqual(done, 12 - 2 * max_concurrency)
+            with open(self.checkpoint, "a") as f:
+                f.write('{"prompt_key": "trunc') # crash mid-write
+
+            backend = SimulatedBackend()
+            resumed = hallucination_fairness_analysis(self.prompts, self.groups, backend=backend,
+                                                      checkpoint_file=self.checkpoint, resume=True,
+                                                      max_concurrency=max_concurrency)
+            pd.testing.assert_frame_equal(resumed, expected)
+            self.assertEqual(backend.calls, 30 - done)
+            self.assertEqual(len(load_checkpoint(self.checkpoint)), 30)
+
+    def test_generator_yields_rows_lazily(self):
+        from hallbayes_fairness import iter_hallucination_metrics
+
+        backend = SimulatedBackend()
+        stream = iter_hallucination_metrics(self.prompts, self.groups, backend=backend, checkpoint_file=self.checkpoint)
+        first = next(stream)
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual((first["group"], first["prompt"]), ("B", "Q0"))
+        rows = [first] + list(stream)
+        self.assertEqual(len({row["prompt_key"] for row in rows}), 30)
+        with open(self.checkpoint) as f:
+            self.assertEqual(len(f.readlines()), 30)
+
+
+class TestCounterfactualPrompts(unittest.TestCase):
+    def setUp(self):
+        _install_fake_hallbayes(KeywordPlanner)
+        self.templates = pd.DataFrame({
+            "template_id": ["t1", "t2", "t3"],
+            "template": ["Is {name} qualified?", "Summarize {name}'s record.", "What is the capital of France?"],
+        })
+        self.substitutions = {"m": {"name": "Bob"}, "f": {"name": "Alice"}, "n": {"name": "Bob"}}
+
+    def tearDown(self):
+        _install_fake_hallbayes()
+
+    def test_deduplicates_and_pairs_counterfactuals(self):
+        from counterfactual_prompts import counterfactual_fairness_analysis
+
+        backend = SimulatedBackend()
+        results, pairs, stats = counterfactual_fairness_analysis(self.templates, self.substitutions, backend=backend)
+        # 9 expansions, but "m" and "n" share a name and t3 has no placeholder.
+        self.assertEqual(len(results), 9)
+        self.assertEqual(results.attrs["unique_prompts"], 5)
+        self.assertEqual(backend.calls, 5)
+        self.assertEqual(results["group"].tolist(), ["m", "f", "n"] * 3)
+
+        self.assertEqual(len(pairs), 6)
+        flips = pairs.set_index(["template_id", "group"])["decision_flip"]
+        self.assertTrue(flips[("t1", "f")] and not flips[("t1", "n")] and not flips[("t3", "f")])
+
+        stats = stats.set_index("group")
+        self.assertAlmostEqual(stats.loc["f", "decision_rate"], 1 / 3)
+        self.assertAlmostEqual(stats.loc["f", "decision_rate_difference"], -2 / 3)
+        self.assertAlmostEqual(stats.loc["f", "flip_rate"], 2 / 3)
+        self.assertAlmostEqual(stats.loc["f", "mean_isr_difference"], 2 / 3)
+        self.assertEqual(stats.loc["m", "flip_rate"], 0)
+
+    def test_from_csv_and_missing_substitution(self):
+        import tempfile
+        from counterfactual_prompts import counterfactual_fairness_analysis, counterfactual_fairness_from_csv
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            template_file = os.path.join(tmp_dir, "templates.csv")
+            substitutions_file = os.path.join(tmp_dir, "groups.csv")
+            stats_file = os.path.join(tmp_dir, "stats.csv")
+            self.templates.to_csv(template_file, index=False)
+            pd.DataFrame({"group": ["m", "f"], "name": ["Bob", "Alice"]}).to_csv(substitutions_file, index=False)
+            _, pairs, _ = counterfactual_fairness_from_csv(template_file, substitutions_file, reference_group="f",
+                                                           backend=SimulatedBackend(), stats_file=stats_file)
+            self.assertEqual(set(pairs["reference_group"]), {"f"})
+            self.assertEqual(len(pd.read_csv(stats_file)), 2)
+        with self.assertRaises(ValueError):
+            counterfactual_fairness_analysis(["Hello {name} and {title}"], self.substitutions, backend=SimulatedBackend())
+
+    def test_missing_template_is_rejected(self):
+        import tempfile
+        from counterfactual_prompts import counterfactual_fairness_from_csv
+
+        backend = SimulatedBackend()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            template_file = os.path.join(tmp_dir, "templates.csv")
+            substitutions_file = os.path.join(tmp_dir, "groups.csv")
+            pd.DataFrame({"template_id": ["t1", "t2"], "template": ["Is {name} qualified?", None]}).to_csv(template_file, index=False)
+            pd.DataFrame({"group": ["m", "f"], "name": ["Bob", "Alice"]}).to_csv(substitutions_file, index=False)
+            with self.assertRaisesRegex(ValueError, "Template 't2' is missing"):
+                counterfactual_fairness_from_csv(template_file, substitutions_file, backend=backend)
+        self.assertEqual(backend.calls, 0)
+
+    def test_csv_prompts_are_deduplicated(self):
+        import tempfile
+        from hallbayes_fairness import hallucination_fairness_from_csv
+
+        backend = SimulatedBackend()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_file = os.path.join(tmp_dir, "prompts.csv")
+            pd.DataFrame({"group": ["m", "f", "m", "f"],
+                          "prompt": ["Is Bob qualified?", "Is Alice qualified?", "What is 2+2?", "What is 2+2?"]}).to_csv(csv_file, index=False)
+            df = hallucination_fairness_from_csv(csv_file, backend=backend)
+            self.assertEqual(backend.calls, 3)
+            self.assertEqual(df.attrs["unique_prompts"], 3)
+            self.assertEqual(df["group"].tolist(), ["m", "f", "m", "f"])
+            self.assertEqual(df.loc[2].drop("group").tolist(), df.loc[3].drop("group").tolist())
+
+            pd.DataFrame({"group": ["m", "f"], "prompt": ["Q1", None]}).to_csv(csv_file, index=False)
+            with self.assertRaisesRegex(ValueError, r"no prompt in rows \[1\]"):
+                hallucination_fairness_from_csv(csv_file, backend=backend)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,161 @@
+# threshold_sweep.py
+"""Fairness metrics at every decision threshold of a continuous score column.
+
+Instead of binarizing the scores at one threshold and re-running
+``fairness_check``, the rows are bucketed by threshold once -- with a single
+sort (``np.unique``) when every distinct score is a threshold, or a binary
+search into a requested grid -- and counted per (group, label, bucket) with one
+``np.bincount``. A reverse cumulative sum over the buckets then gives the
+native engine's ``(4, 2, 2)`` counts for every threshold at once, i.e. a
+``(T, 4, 2, 2)`` tensor that the metric functions score in one vectorized call.
+A row is predicted favorable at threshold ``t`` when its score is ``>= t``.
+
+Histograms over a fixed grid are additive, so chunked inputs are swept in one
+bounded-memory pass when ``thresholds`` is given.
+"""
+import numpy as np
+import pandas as pd
+import data_io
+import native_metrics
+from native_metrics import FAIRNESS_METRIC_NAMES, N_GROUP_CODES
+
+ROC_GROUPS = [('all', None), ('unprivileged', False), ('privileged', True)]
+
+
+def threshold_histogram(scores: np.ndarray, group_codes: np.ndarray, label_codes: np.ndarray, thresholds=None) -> tuple:
+    """
+    Bucket rows by threshold and count them per group and label.
+
+    Parameters:
+    scores (np.ndarray): Continuous scores; higher means more favorable.
+    group_codes (np.ndarray): Codes from ``native_metrics.encode_groups``.
+    label_codes (np.ndarray): Codes from ``native_metrics.encode_binary_labels``.
+    thresholds (array-like, optional): Threshold grid. Defaults to None (every distinct score).
+
+    Returns:
+    tuple: (sorted thresholds of length T, ``(4, 2, T + 1)`` histogram where bucket ``b``
+           holds rows scoring at least ``thresholds[b - 1]`` but below ``thresholds[b]``).
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if np.isnan(scores).any():
+        raise ValueError("Score column contains missing values.")
+    if thresholds is None:
+        thresholds, inverse = np.unique(scores, return_inverse=True)
+        buckets = inverse.ravel() + 1
+    else:
+        thresholds = np.unique(np.asarray(thresholds, dtype=np.float64))
+        buckets = np.searchsorted(thresholds, scores, side='right')
+    n_buckets = len(thresholds) + 1
+    cells = ((group_codes * 2) + label_codes) * n_buckets + buckets
+    histogram = np.bincount(cells, minlength=N_GROUP_CODES * 2 * n_buckets)
+    return thresholds, histogram.reshape(N_GROUP_CODES, 2, n_buckets)
+
+
+def sweep_counts(histogram: np.ndarray) -> np.ndarray:
+    """``(T, 4, 2, 2)`` counts tensor, one native-engine counts tensor per threshold."""
+    at_or_above = np.cumsum(histogram[..., ::-1], axis=-1)[..., ::-1][..., 1:]
+    totals = histogram.sum(axis=-1, keepdims=True)
+    counts = np.stack([totals - at_or_above, at_or_above], axis=-1).astype(np.float64)
+    return np.moveaxis(counts, -2, 0)
+
+
+def sweep_tables(thresholds: np.ndarray, counts: np.ndarray) -> tuple:
+    """
+    Fairness-vs-threshold and per-group ROC tables for a ``(T, 4, 2, 2)`` counts tensor.
+
+    Returns:
+    tuple: (DataFrame with ``Threshold`` and one column per fairness metric,
+            long DataFrame with ``Group``, ``Threshold``, ``True Positive Rate``,
+            ``False Positive Rate`` and ``Selection Rate`` for all rows and each group).
+    """
+    curves = pd.DataFrame({'Threshold': thresholds})
+    for name, score in zip(FAIRNESS_METRIC_NAMES, native_metrics.fairness_scores(counts)):
+        curves[name] = score
+
+    roc = []
+    for group_name, privileged in ROC_GROUPS:
+        rates = native_metrics.group_rates(counts, privileged)
+        roc.append(pd.DataFrame({
+            'Group': group_name,
+            'Threshold': thresholds,
+            'True Positive Rate': rates['TPR'],
+            'False Positive Rate': rates['FPR'],
+            'Selection Rate': rates['selection_rate'],
+        }))
+    return curves, pd.concat(roc, ignore_index=True)
+
+
+def validate_score_column(columns: list, score_name: str) -> None:
+    """Raise ValueError if the score column is missing from ``columns``."""
+    if score_name not in columns:
+        raise ValueError(f"Score name '{score_name}' not found in input CSV columns: {list(columns)}")
+
+
+def sweep_frame(df: pd.DataFrame, label_name: str, score_name: str, privileged_groups: list[dict], unprivileged_groups: list[dict], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, thresholds=None) -> tuple:
+    """``threshold_histogram`` for the rows of ``df``."""
+    from analysis_session import compute_group_mask
+
+    group_codes = native_metrics.encode_groups(compute_group_mask(df, unprivileged_groups), compute_group_mask(df, privileged_groups))
+    label_codes = native_metrics.encode_binary_labels(df[label_name].to_numpy(), label_name, favorable_label_value, unfavorable_label_value)
+    return threshold_histogram(df[score_name].to_numpy(), group_codes, label_codes, thresholds)
+
+
+def threshold_tables(input_file: str, label_name: str, score_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, thresholds: list[float] = None, chunksize: int = None) -> tuple:
+    """
+    Computes the fairness metrics at every threshold of a score column.
+
+    Parameters are those of ``threshold_sweep`` without the output files.
+
+    Returns:
+    tuple: (fairness-vs-threshold table, per-group ROC table)
+    """
+    from analysis_session import validate_group_definitions, validate_label_column, validate_label_values, validate_protected_attributes
+
+    if chunksize and thresholds is None:
+        raise ValueError("A streaming threshold sweep needs an explicit thresholds grid.")
+    columns = data_io.read_columns(input_file)
+    validate_label_column(columns, label_name)
+    validate_score_column(columns, score_name)
+    validate_protected_attributes(columns, protected_attribute_names)
+    validate_group_definitions(protected_attribute_names, privileged_groups, unprivileged_groups)
+
+    needed = list(protected_attribute_names) + [label_name, score_name]
+    chunks = data_io.iter_chunks(input_file, needed, chunksize) if chunksize else [data_io.read_table(input_file, needed)]
+    histogram = None
+    for chunk in chunks:
+        grid, chunk_histogram = sweep_frame(chunk, label_name, score_name, privileged_groups, unprivileged_groups,
+                                            favorable_label_value, unfavorable_label_value, thresholds)
+        histogram = chunk_histogram if histogram is None else histogram + chunk_histogram
+    label_totals = histogram.sum(axis=(0, 2))
+    present = [value for value, total in zip([unfavorable_label_value, favorable_label_value], label_totals) if total > 0]
+    validate_label_values(present, label_name, favorable_label_value, unfavorable_label_value)
+    return sweep_tables(grid, sweep_counts(histogram))
+
+
+def threshold_sweep(input_file: str, output_file: str, label_name: str, score_name: str, protected_attribute_names: list[str], privileged_groups: list[dict], unprivileged_groups: list[dict], favorable_label_value: float = 1.0, unfavorable_label_value: float = 0.0, thresholds: list[float] = None, roc_output_file: str = None, chunksize: int = None) -> None:
+    """
+    Computes the fairness metrics at every threshold of a score column and outputs fairness-vs-threshold and ROC tables.
+
+    Parameters:
+    input_file (str): Path to the input file (CSV, Parquet, Feather or Arrow IPC).
+    output_file (str): Path to the output file for the fairness-vs-threshold table.
+    label_name (str): The name of the label column in the input dataset.
+    score_name (str): Column with continuous model scores; a row is predicted favorable when its score >= threshold.
+    protected_attribute_names (list[str]): A list of names of the protected attribute columns.
+    privileged_groups (list[dict]): A list of dictionaries representing privileged groups.
+    unprivileged_groups (list[dict]): A list of dictionaries representing unprivileged groups.
+    favorable_label_value (float, optional): Value representing the favorable outcome. Defaults to 1.0.
+    unfavorable_label_value (float, optional): Value representing the unfavorable outcome. Defaults to 0.0.
+    thresholds (list[float], optional): Threshold grid. Defaults to None (every distinct score).
+    roc_output_file (str, optional): Path for the per-group ROC table. Defaults to None (not written).
+    chunksize (int, optional): Stream the input in chunks of this many rows. Requires ``thresholds``.
+                               Defaults to None (load the needed columns at once).
+
+    Returns:
+    None
+    """
+    curves, roc = threshold_tables(input_file, label_name, score_name, protected_attribute_names, privileged_groups,
+                                   unprivileged_groups, favorable_label_value, unfavorable_label_value, thresholds, chunksize)
+    data_io.write_table(curves, output_file)
+    if roc_output_file:
+        data_io.write_table(roc, roc_output_file)